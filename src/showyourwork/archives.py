@@ -0,0 +1,596 @@
+"""
+Extraction of files from dataset archives (tarballs and zip files), and
+streaming tarballs of directory outputs for the remote cache.
+
+Tarballs have no table of contents, so the first time we extract from one
+we can record where each member is in the (decompressed) stream in an index
+file. Later extractions use it to seek straight to the members they need.
+In compressed tarballs, we also record *restart points* we can resume
+decompressing from: the start of each gzip member and, if the zlib library
+can be loaded (see ``zran``), deflate block boundaries every few MiB, along
+with the 32 KiB of output that precede them.
+
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import posixpath
+import queue
+import shutil
+import tarfile
+import tempfile
+import threading
+import zlib
+from pathlib import Path
+from zipfile import ZipFile
+
+from . import exceptions, zran
+from .logging import get_logger
+
+#: Size of the chunks read from and written to disk, in bytes
+chunk_size = 1 << 20
+
+#: Version of the archive index format
+index_version = 2
+
+#: Minimum distance between the restart points we record in the middle of a
+#: gzip member, in (decompressed) bytes
+restart_span = 4 << 20
+
+
+def normalize_member(name):
+    """
+    Return the canonical form of an archive member name (no leading ``./``
+    or trailing slash).
+
+    """
+    name = posixpath.normpath(name.replace("\\", "/"))
+    while name.startswith("./"):
+        name = name[2:]
+    return name.strip("/")
+
+
+def _write(source, destination, size=None):
+    """
+    Stream a file object (or its next ``size`` bytes) to ``destination``,
+    atomically.
+
+    """
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{destination.name}.", dir=destination.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if size is None:
+                shutil.copyfileobj(source, f, chunk_size)
+            else:
+                while size > 0:
+                    data = source.read(min(size, chunk_size))
+                    if not data:
+                        raise EOFError("Unexpected end of archive.")
+                    f.write(data)
+                    size -= len(data)
+        os.replace(tmp, destination)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class GzipReader:
+    """
+    A forward-only reader for (possibly multi-member) gzip streams that keeps
+    track of its position in the decompressed stream.
+
+    If ``restart_points`` is a list, the points we can later resume reading
+    from are appended to it as we pass them: the start of every gzip member,
+    as ``(compressed offset, decompressed offset)``, and deflate block
+    boundaries at least ``restart_span`` bytes apart (if ``zran.available()``),
+    as ``(compressed offset, decompressed offset, bits, window)``, where
+    ``bits`` is the number of bits of the byte before the compressed offset
+    that belong to the next block and ``window`` is the output before it.
+
+    Args:
+        file: The compressed file, opened in binary mode.
+        start (tuple, optional): The restart point to start reading from.
+            Default ``(0, 0)``.
+        restart_points (list, optional): List to record restart points in.
+
+    """
+
+    def __init__(self, file, start=(0, 0), restart_points=None):
+        self.file = file
+        self.pos = start[1]
+        self.restart_points = restart_points
+        self._last_point = start[1]
+        self._buffer = b""
+        if len(start) > 2:
+            offset, _, bits, window = start
+            prime = None
+            if bits:
+                self.file.seek(offset - 1)
+                prime = (bits, self.file.read(1)[0] >> (8 - bits))
+            self.file.seek(offset)
+            self._inflater = zran.Inflater(-zlib.MAX_WBITS, window, prime)
+            self._window = window
+            # We're in the middle of a member, so we'll have to skip its
+            # trailer ourselves
+            self._raw = True
+        else:
+            self.file.seek(start[0])
+            self._inflater = zran.inflater(zlib.MAX_WBITS | 16)
+            self._window = b""
+            self._raw = False
+        self.compressed_pos = self.file.tell()
+
+    def _read_raw(self):
+        data = self.file.read(chunk_size)
+        self.compressed_pos += len(data)
+        return data
+
+    def _next_member(self):
+        data = self._inflater.unused_data
+        if self._raw:
+            # Skip the trailer (CRC and size) of the member
+            while len(data) < 8:
+                more = self._read_raw()
+                if not more:
+                    raise EOFError("Compressed file ended before the end of stream.")
+                data += more
+            data = data[8:]
+            self._raw = False
+        if not data:
+            data = self._read_raw()
+        if not data.strip(b"\0"):
+            # End of the stream (possibly zero-padded)
+            return False
+        if self.restart_points is not None:
+            self.restart_points.append((self.compressed_pos - len(data), self.pos))
+            self._last_point = self.pos
+        self._window = b""
+        self._inflater = zran.inflater(zlib.MAX_WBITS | 16)
+        self._inflater.feed(data)
+        return True
+
+    def _track(self, output):
+        # Keep the window, and record a restart point if we're at the end of
+        # a block far enough from the last one
+        if len(output) >= zran.window_size:
+            self._window = output[-zran.window_size :]
+        else:
+            self._window = (self._window + output)[-zran.window_size :]
+        end = self.pos + len(output)
+        bits = self._inflater.boundary
+        if bits is not None and end - self._last_point >= restart_span:
+            offset = self.compressed_pos - self._inflater.pending
+            self.restart_points.append((offset, end, bits, self._window))
+            self._last_point = end
+
+    def _fill(self):
+        while not self._buffer:
+            if self._inflater.eof:
+                if not self._next_member():
+                    return False
+                continue
+            data = self._read_raw() if self._inflater.needs_input else b""
+            if data:
+                self._inflater.feed(data)
+            self._buffer = self._inflater.inflate(chunk_size)
+            if self.restart_points is not None:
+                self._track(self._buffer)
+            if not (self._buffer or data or self._inflater.eof):
+                if self._inflater.needs_input:
+                    raise EOFError("Compressed file ended before the end of stream.")
+        return True
+
+    def read(self, size=-1):
+        chunks = []
+        while size < 0 or size > 0:
+            if not self._fill():
+                break
+            n = len(self._buffer) if size < 0 else min(size, len(self._buffer))
+            chunks.append(self._buffer[:n])
+            self._buffer = self._buffer[n:]
+            self.pos += n
+            if size > 0:
+                size -= n
+        return b"".join(chunks)
+
+    def skip(self, size):
+        """
+        Read and discard the next ``size`` bytes.
+
+        """
+        while size > 0:
+            data = self.read(min(size, chunk_size))
+            if not data:
+                raise EOFError("Unexpected end of archive.")
+            size -= len(data)
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _QueueWriter:
+    """
+    A write-only file object that hands what's written to it to a queue, in
+    chunks of about ``chunk_size`` bytes.
+
+    """
+
+    def __init__(self, chunks, cancelled):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self._buffer = bytearray()
+
+    def _put(self, data):
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(data, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise _Cancelled()
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= chunk_size:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+
+class TarballStream:
+    """
+    A read-only file object producing a gzipped tarball of a directory on the
+    fly, so it can be streamed (e.g., as the body of an upload) without
+    ever being written to disk.
+
+    The tarball is compressed on a background thread, at most a few chunks
+    ahead of the reader. The stream can only be rewound to the start, which
+    compresses the directory again from scratch.
+
+    Args:
+        path (str or Path): The directory.
+        arcname (str, optional): The name of the directory in the tarball.
+            Default ``"."``.
+
+    """
+
+    #: Maximum number of compressed chunks waiting to be read
+    max_pending = 4
+
+    def __init__(self, path, arcname="."):
+        self.path = Path(path)
+        self.arcname = arcname
+        self._thread = None
+        self._start()
+
+    def _start(self):
+        self.close()
+        self._chunks = queue.Queue(maxsize=self.max_pending)
+        self._cancelled = threading.Event()
+        self._buffer = b""
+        self._done = False
+        self._pos = 0
+        self._thread = threading.Thread(
+            target=self._produce,
+            args=(self._chunks, self._cancelled),
+            name="syw-tarball",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _produce(self, chunks, cancelled):
+        writer = _QueueWriter(chunks, cancelled)
+        try:
+            with tarfile.open(fileobj=writer, mode="w|gz") as tb:
+                tb.add(self.path, arcname=self.arcname)
+            writer.flush()
+            result = None
+        except _Cancelled:
+            return
+        except BaseException as e:
+            result = e
+        # Signal the end of the stream (or the error that ended it)
+        try:
+            writer._put(result)
+        except _Cancelled:
+            pass
+
+    def read(self, size=-1):
+        chunks = []
+        while size is None or size < 0 or size > 0:
+            if not self._buffer:
+                if self._done:
+                    break
+                item = self._chunks.get()
+                if item is None or isinstance(item, BaseException):
+                    self._done = True
+                    if item is not None:
+                        raise item
+                    break
+                self._buffer = item
+            n = len(self._buffer) if size is None or size < 0 else size
+            chunks.append(self._buffer[:n])
+            self._buffer = self._buffer[n:]
+            if size is not None and size > 0:
+                size -= len(chunks[-1])
+        data = b"".join(chunks)
+        self._pos += len(data)
+        return data
+
+    def __iter__(self):
+        return iter(lambda: self.read(chunk_size), b"")
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET and offset == 0:
+            if self._pos:
+                self._start()
+            return 0
+        elif whence == os.SEEK_SET and offset == self._pos:
+            return self._pos
+        # NOTE: this is also how ``requests`` finds out it can't know the
+        # length of the stream, and has to send it in chunks
+        raise OSError("A tarball stream can only be rewound to the start.")
+
+    def close(self):
+        if self._thread is not None:
+            self._cancelled.set()
+            self._thread.join()
+            self._thread = None
+
+
+def _signature(archive):
+    stat = os.stat(archive)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _windows_path(index_file):
+    return Path(index_file).with_suffix(".windows")
+
+
+def _replace(path, data):
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def load_index(archive, index_file):
+    """
+    Return the member index of a tarball stored in ``index_file``, or
+    ``None`` if we don't have an up-to-date one.
+
+    The windows of the restart points in the middle of gzip members are kept
+    (compressed) in a file next to the index, and read back into the points.
+
+    """
+    try:
+        with open(index_file) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("version", None) != index_version:
+        return None
+    if index.get("signature", None) != _signature(archive):
+        return None
+    points = []
+    windows = None
+    for point in index["restart_points"]:
+        if len(point) == 2:
+            points.append(tuple(point))
+        elif zran.available():
+            offset, pos, bits, start, size = point
+            try:
+                if windows is None:
+                    windows = _windows_path(index_file).read_bytes()
+                    if hashlib.md5(windows).hexdigest() != index["windows"]:
+                        return None
+                window = zlib.decompress(windows[start : start + size])
+            except (OSError, zlib.error):
+                return None
+            points.append((offset, pos, bits, window))
+    index["restart_points"] = points
+    return index
+
+
+def _save_index(archive, index_file, members, restart_points):
+    windows = bytearray()
+    points = []
+    for point in sorted(restart_points, key=lambda point: point[1]):
+        if len(point) == 2:
+            points.append(point)
+        else:
+            offset, pos, bits, window = point
+            compressed = zlib.compress(window)
+            points.append((offset, pos, bits, len(windows), len(compressed)))
+            windows += compressed
+    index = {
+        "version": index_version,
+        "signature": _signature(archive),
+        "members": members,
+        "restart_points": points,
+        "windows": hashlib.md5(windows).hexdigest(),
+    }
+    path = Path(index_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _replace(_windows_path(path), bytes(windows))
+    _replace(path, json.dumps(index).encode())
+    return index
+
+
+def _member_type(info):
+    if info.isfile():
+        return "file"
+    elif info.isdir():
+        return "dir"
+    else:
+        return "other"
+
+
+def _extract_one(info_type, name, source, destination, size):
+    if info_type == "dir":
+        Path(destination).mkdir(parents=True, exist_ok=True)
+    elif info_type == "file":
+        _write(source, destination, size)
+    else:
+        raise exceptions.TarballExtractionError(
+            f"Member {name} of the archive is not a regular file."
+        )
+
+
+def _scan_tar(archive, members, index_file=None):
+    """
+    Extract members from a tarball in a single streaming pass, indexing
+    every member in the archive on the way if we can seek in it later.
+
+    """
+    remaining = dict(members)
+    index = {}
+    restart_points = [(0, 0)]
+    compressed = archive.name.endswith(".gz")
+    with open(archive, "rb") as raw:
+        stream = GzipReader(raw, restart_points=restart_points) if compressed else raw
+        with tarfile.open(fileobj=stream, mode="r|") as f:
+            for info in f:
+                name = normalize_member(info.name)
+                index[name] = [info.offset_data, info.size, _member_type(info)]
+                if name in remaining:
+                    _extract_one(
+                        _member_type(info),
+                        name,
+                        f.extractfile(info),
+                        remaining.pop(name),
+                        info.size,
+                    )
+    if index_file is not None:
+        if not compressed:
+            _save_index(archive, index_file, index, [(0, 0)])
+        elif len(restart_points) > 1:
+            _save_index(archive, index_file, index, restart_points)
+        else:
+            # We'd have to decompress from the start anyway (the stream is
+            # short, or we can't resume in the middle of a gzip member), so
+            # an index doesn't buy us anything
+            Path(index_file).unlink(missing_ok=True)
+            _windows_path(index_file).unlink(missing_ok=True)
+    return remaining
+
+
+def _extract_tar_indexed(archive, members, index):
+    """
+    Extract members from a tarball, seeking to each one using the index.
+
+    """
+    remaining = {}
+    wanted = []
+    for name, destination in members.items():
+        if name in index["members"]:
+            wanted.append((*index["members"][name], name, destination))
+        else:
+            remaining[name] = destination
+    wanted.sort()
+    restart_points = index["restart_points"]
+    decompressed_offsets = [point[1] for point in restart_points]
+    compressed = archive.name.endswith(".gz")
+    with open(archive, "rb") as raw:
+        stream = None
+        for offset, size, member_type, name, destination in wanted:
+            if compressed:
+                # Resume from the last restart point before the member, unless
+                # we're already closer to it
+                point = restart_points[
+                    bisect.bisect_right(decompressed_offsets, offset) - 1
+                ]
+                if stream is None or stream.pos > offset or stream.pos < point[1]:
+                    stream = GzipReader(raw, start=point)
+                stream.skip(offset - stream.pos)
+            else:
+                raw.seek(offset)
+                stream = raw
+            _extract_one(member_type, name, stream, destination, size)
+    return remaining
+
+
+def _extract_tar(archive, members, index_file=None):
+    """
+    Extract members from a tarball.
+
+    """
+    index = None if index_file is None else load_index(archive, index_file)
+    if index is None:
+        return _scan_tar(archive, members, index_file)
+    else:
+        get_logger().debug(f"Using the member index of {archive}.")
+        return _extract_tar_indexed(archive, members, index)
+
+
+def _extract_zip(archive, members):
+    """
+    Extract members from a zip file.
+
+    """
+    remaining = dict(members)
+    with ZipFile(archive, "r") as f:
+        for info in f.infolist():
+            name = normalize_member(info.filename)
+            if name not in remaining:
+                continue
+            destination = remaining.pop(name)
+            if info.is_dir():
+                Path(destination).mkdir(parents=True, exist_ok=True)
+            else:
+                with f.open(info) as source:
+                    _write(source, destination)
+    return remaining
+
+
+def extract_members(archive, members, index_file=None):
+    """
+    Extract files from an archive directly to their destinations.
+
+    The archive is read at most once, no matter how many members are
+    requested, and each member is written to a temporary file next to its
+    destination and then moved into place.
+
+    Args:
+        archive (str or Path): Path to a ``.tar``, ``.tar.gz`` or ``.zip`` file.
+        members (dict): Mapping of member names in the archive to the paths
+            they should be extracted to.
+        index_file (str or Path, optional): Where to keep the member index
+            of a tarball (see ``load_index``). Tarballs aren't indexed if
+            this isn't given.
+
+    """
+    logger = get_logger()
+    archive = Path(archive)
+    members = {normalize_member(name): dest for name, dest in members.items()}
+    logger.debug(f"Extracting {len(members)} file(s) from {archive}...")
+
+    try:
+        if archive.name.endswith(".tar") or archive.name.endswith(".tar.gz"):
+            missing = _extract_tar(archive, members, index_file)
+        elif archive.name.endswith(".zip"):
+            missing = _extract_zip(archive, members)
+        else:
+            raise exceptions.NotImplementedError("Unsupported archive file type.")
+    except exceptions.ShowyourworkException:
+        raise
+    except Exception as e:
+        raise exceptions.TarballExtractionError(str(e))
+
+    if missing:
+        raise exceptions.TarballExtractionError(
+            f"File(s) not found in {archive.name}: " + ", ".join(sorted(missing))
+        )
@@ -31,6 +31,7 @@ def clean(force, deep, snakemake_args=(), cores=1, conda_frontend="conda"):
         (paths.user().repo / "arxiv.tar.gz").unlink()
     if paths.user().temp.exists():
         shutil.rmtree(paths.user().temp)
+        paths.user.cache_clear()
     if force:
         for root, dirs, files in os.walk(paths.user().data, topdown=False):
             for name in files:
@@ -1,13 +1,22 @@
-from ... import paths
+from ... import fingerprint, paths
+from ...logging import get_logger
 from .run_snakemake import run_snakemake
 
 
 def preprocess(snakemake_args=(), cores=1, conda_frontend="conda"):
     """Pre-processing step for the article build.
 
+    The step is skipped if nothing it depends on has changed since it last
+    ran (see :py:func:`showyourwork.fingerprint.get_prep_fingerprint`).
+
     Args:
         snakemake_args (list, optional): Additional options to pass to Snakemake.
     """
+    current = fingerprint.get_prep_fingerprint(snakemake_args)
+    if fingerprint.prep_is_current(current, snakemake_args):
+        get_logger().info("Preprocess: Up to date, skipping.")
+        return
+    fingerprint.fingerprint_file().unlink(missing_ok=True)
     snakefile = paths.showyourwork().workflow / "prep.smk"
     run_snakemake(
         snakefile.as_posix(),
@@ -17,3 +26,4 @@ def preprocess(snakemake_args=(), cores=1, conda_frontend="conda"):
         extra_args=snakemake_args,
         check=True,
     )
+    fingerprint.record_prep_fingerprint(current)
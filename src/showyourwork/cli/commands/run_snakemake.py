@@ -2,7 +2,7 @@ import os
 import subprocess
 import sys
 
-from ... import paths
+from ... import git, paths
 
 
 def run_snakemake(
@@ -15,6 +15,8 @@ def run_snakemake(
 ):
     env = dict(os.environ)
     env["SNAKEMAKE_OUTPUT_CACHE"] = paths.user().cache.as_posix()
+    env[paths.REPO_ROOT_ENV] = paths.user().repo.as_posix()
+    env[git.SNAPSHOT_ENV] = git.get_snapshot().to_json()
     if run_type is not None:
         env["SNAKEMAKE_RUN_TYPE"] = run_type
     cmd = [
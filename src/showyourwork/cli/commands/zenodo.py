@@ -2,7 +2,7 @@ import os
 
 from ... import exceptions, logging
 from ...config import edit_yaml
-from ...git import get_repo_branch
+from ...git import get_snapshot
 from ...zenodo import Zenodo
 
 
@@ -17,7 +17,7 @@ def zenodo_publish(branch):
     """
     # Ensure there's a sandbox cache record for this branch
     if branch is None:
-        branch = get_repo_branch()
+        branch = get_snapshot().branch
     try:
         with edit_yaml("zenodo.yml") as config:
             sandbox_doi = config["cache"][branch]["sandbox"]
@@ -63,7 +63,7 @@ def zenodo_freeze(branch):
         branch (str): Branch whose cache is to be frozen.
     """
     if branch is None:
-        branch = get_repo_branch()
+        branch = get_snapshot().branch
     try:
         with edit_yaml("zenodo.yml") as config:
             doi = config["cache"][branch]["sandbox"]
@@ -86,7 +86,7 @@ def zenodo_create(branch):
         branch (str): Branch to create the cache for.
     """
     if branch is None:
-        branch = get_repo_branch()
+        branch = get_snapshot().branch
     try:
         with edit_yaml("zenodo.yml") as config:
             doi = config["cache"].get(branch, {}).get("sandbox", None)
@@ -112,7 +112,7 @@ def zenodo_delete(branch):
         branch (str): Branch whose cahce is to be deleted.
     """
     if branch is None:
-        branch = get_repo_branch()
+        branch = get_snapshot().branch
     try:
         with edit_yaml("zenodo.yml") as config:
             doi = config["cache"][branch]["sandbox"]
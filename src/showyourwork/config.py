@@ -7,7 +7,7 @@ import jinja2
 import yaml
 from packaging import version
 
-from . import __version__, exceptions, git, paths
+from . import __version__, exceptions, git, paths, session
 
 try:
     from yaml import CDumper as Dumper, CLoader as Loader
@@ -134,23 +134,95 @@ def as_dict(x, depth=0, maxdepth=30):
     return x
 
 
-def get_upstream_dependencies(file, dependencies, depth=0):
+class UpstreamDependencies:
+    """
+    The transitive closure of a dependency graph.
+
+    Files are mapped to integer ids, and the upstream set of each file is a
+    ``frozenset`` of ids computed iteratively (no recursion) and at most once,
+    reusing the sets already computed for its dependencies. Identical sets are
+    stored only once.
+
+    Args:
+        dependencies (dict): Mapping of each file to the files it depends on
+            (a list of strings, or a single string).
+
+    """
+
+    def __init__(self, dependencies):
+        self.names = []
+        self.ids = {}
+        self.direct = []
+        for file, deps in dependencies.items():
+            items = [deps] if isinstance(deps, str) else deps or []
+            idx = self._id(file)
+            self.direct[idx] = tuple(self._id(dep) for dep in items)
+        self._closures = [None] * len(self.names)
+        self._interned = {}
+
+    def _id(self, file):
+        idx = self.ids.get(file, None)
+        if idx is None:
+            idx = self.ids[file] = len(self.names)
+            self.names.append(file)
+            self.direct.append(())
+        return idx
+
+    def _closure(self, idx):
+        """
+        Return the upstream set of the file with id ``idx``.
+
+        """
+        if self._closures[idx] is not None:
+            return self._closures[idx]
+
+        # Depth-first search, computing closures in post-order
+        in_progress = set()
+        stack = [(idx, iter(self.direct[idx]))]
+        in_progress.add(idx)
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if self._closures[child] is not None:
+                    continue
+                if child in in_progress:
+                    path = [n for n, _ in stack]
+                    cycle = path[path.index(child) :] + [child]
+                    raise exceptions.CircularDependencyError(
+                        [self.names[n] for n in cycle]
+                    )
+                in_progress.add(child)
+                stack.append((child, iter(self.direct[child])))
+                break
+            else:
+                stack.pop()
+                in_progress.discard(node)
+                deps = self.direct[node]
+                closure = frozenset(deps).union(*(self._closures[dep] for dep in deps))
+                self._closures[node] = self._interned.setdefault(closure, closure)
+        return self._closures[idx]
+
+    def upstream(self, file):
+        """
+        Return the set of all files upstream of ``file``.
+
+        """
+        idx = self.ids.get(file, None)
+        if idx is None:
+            return set()
+        return set(self.names[n] for n in self._closure(idx))
+
+
+def get_upstream_dependencies(file, dependencies):
     """
     Collect user-defined dependencies of a file recursively.
     Returns a list of strings.
 
+    To query many files in the same graph, use ``UpstreamDependencies``
+    directly so the closure is only computed once.
+
     """
-    if deps := dependencies.get(file, []):
-        res = set()
-        for dep in deps:
-            res |= set([dep])
-            res |= get_upstream_dependencies(dep, dependencies, depth + 1)
-    else:
-        res = set()
-    if not depth:
-        return list(res)
-    else:
-        return res
+    return list(UpstreamDependencies(dependencies).upstream(file))
 
 
 def parse_overleaf():
@@ -268,10 +340,22 @@ def parse_config():
         #: Zenodo datasets
         config["datasets"] = as_dict(config.get("datasets", {}))
 
+        #: Machine-wide dataset store
+        config["dataset_store"] = as_dict(config.get("dataset_store", {}))
+        config["dataset_store"]["path"] = config["dataset_store"].get("path", None)
+        config["dataset_store"]["link"] = config["dataset_store"].get(
+            "link", "hardlink"
+        )
+
         #: Overleaf
         config["overleaf"] = as_dict(config.get("overleaf", {}))
         parse_overleaf()
 
+        #: Zenodo API connection settings
+        config["zenodo_api"] = as_dict(config.get("zenodo_api", {}))
+        for key, value in session.defaults.items():
+            config["zenodo_api"][key] = config["zenodo_api"].get(key, value)
+
         #: Require inputs to all rules to be present on disk for build to pass?
         config["require_inputs"] = config.get("require_inputs", True)
 
@@ -310,6 +394,15 @@ def parse_config():
                 "Setting `tectonic_args` must be a list of strings."
             )
         config["synctex"] = config.get("synctex", True)
+        config["tectonic_warm_start"] = config.get("tectonic_warm_start", True)
+
+        #: How to find the article structure in the preprocessing stage
+        config["preprocess_engine"] = config.get("preprocess_engine", "tectonic")
+        if config["preprocess_engine"] not in ["tectonic", "python"]:
+            raise exceptions.ConfigError(
+                "Error parsing the config. "
+                "Setting `preprocess_engine` must be one of `tectonic` or `python`."
+            )
 
         #: Optimize the DAG by removing jobs upstream of cache hits
         config["optimize_caching"] = config.get("optimize_caching", False)
@@ -396,6 +489,7 @@ def parse_config():
 
         # Overridden in the `preprocess` rule
         config["tree"] = {"figures": {}}
+        config["dataset_index"] = {}
 
         # Overridden in `userrules.py`
         config["cached_deps"] = []
@@ -414,13 +508,14 @@ def parse_config():
     # the user git-committed or changed branches in between builds.
 
     # Git info for the repo
-    config["git_sha"] = git.get_repo_sha()
-    config["git_url"] = git.get_repo_url()
-    config["git_slug"] = git.get_repo_slug()
-    config["git_branch"] = git.get_repo_branch()
+    snapshot = git.get_snapshot()
+    config["git_sha"] = snapshot.sha
+    config["git_url"] = snapshot.url
+    config["git_slug"] = snapshot.slug
+    config["git_branch"] = snapshot.branch
     config["github_actions"] = os.getenv("CI", "false") == "true"
     config["github_runid"] = os.getenv("GITHUB_RUN_ID", "")
-    config["git_tag"] = git.get_repo_tag()
+    config["git_tag"] = snapshot.tag
     config["cache"][config["git_branch"]] = config["cache"].get(
         config["git_branch"], {}
     )
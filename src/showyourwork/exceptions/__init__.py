@@ -21,6 +21,7 @@ from .latex import (
 )
 from .other import (
     CalledProcessError as CalledProcessError,
+    CircularDependencyError as CircularDependencyError,
     CondaNotFoundError as CondaNotFoundError,
     CondaVersionError as CondaVersionError,
     ConfigError as ConfigError,
@@ -28,8 +29,10 @@ from .other import (
     MissingConfigFile as MissingConfigFile,
     MissingDependencyError as MissingDependencyError,
     MissingFigureOutputError as MissingFigureOutputError,
+    NotImplementedError as NotImplementedError,
     RequestError as RequestError,
     ShowyourworkNotFoundError as ShowyourworkNotFoundError,
+    TarballExtractionError as TarballExtractionError,
 )
 from .overleaf import (
     MissingOverleafCredentials as MissingOverleafCredentials,
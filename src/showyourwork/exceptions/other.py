@@ -45,6 +45,13 @@ class MissingDependencyError(ShowyourworkException):
     pass
 
 
+class CircularDependencyError(ShowyourworkException):
+    def __init__(self, cycle):
+        super().__init__(
+            "Circular dependency detected: " + " -> ".join(str(file) for file in cycle)
+        )
+
+
 class FigureGenerationError(ShowyourworkException):
     pass
 
@@ -0,0 +1,163 @@
+"""
+Fingerprints of the inputs to the preprocessing stage, so the CLI can skip
+it when nothing it depends on has changed since the last build.
+
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from . import __version__, git, paths
+
+#: Files in the TeX directory whose contents the preprocessing stage reads
+_source_suffixes = {".tex", ".sty", ".cls", ".bib", ".bst"}
+
+#: Snakemake options that ask us to redo everything
+_force_args = {"-F", "--forceall"}
+
+
+def is_forced(snakemake_args):
+    """
+    Return True if the Snakemake arguments ask for everything to be redone
+    (``-F`` or ``--forceall``, including in a group of short options such as
+    ``-nF``).
+
+    """
+    for arg in snakemake_args:
+        if arg in _force_args:
+            return True
+        if arg.startswith("-") and not arg.startswith("--") and "F" in arg[1:]:
+            return True
+    return False
+
+
+def tex_files(tex, generated=()):
+    """
+    Return the TeX sources under the directory ``tex`` (following symlinks)
+    and the other files in it, each sorted by path.
+
+    The sources (``.tex``, ``.sty``, ``.cls``, ``.bib`` and ``.bst`` files)
+    are what the preprocessing stage reads. The other files (such as images)
+    and anything in the ``generated`` directories (the figures and
+    ``\\variable`` outputs the build writes) only matter to it by name.
+
+    """
+    generated = {Path(path) for path in generated}
+    sources = []
+    others = []
+    for root, dirs, names in os.walk(tex, followlinks=True):
+        dirs.sort()
+        in_generated = any(
+            Path(root) == path or path in Path(root).parents for path in generated
+        )
+        for name in sorted(names):
+            file = Path(root) / name
+            if not in_generated and file.suffix in _source_suffixes:
+                sources.append(file)
+            else:
+                others.append(file)
+    return sources, others
+
+
+def fingerprint_file():
+    """
+    Return the path to the file the fingerprint of the last preprocessing
+    run is stored in (next to the ``config.json`` it produced).
+
+    """
+    return paths.user().temp / "config.fingerprint"
+
+
+def _load_config():
+    try:
+        with open(paths.user().temp / "config.json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def get_prep_fingerprint(snakemake_args=()):
+    """
+    Return a fingerprint of everything the preprocessing stage depends on.
+
+    This covers the contents of the TeX sources and the names of the other
+    files in the TeX directory (see ``tex_files``), ``showyourwork.yml``,
+    ``zenodo.yml``, the names of the files in the static directory, the git
+    ``HEAD``, the showyourwork version and the command line arguments passed
+    to Snakemake.
+
+    Args:
+        snakemake_args (list, optional): Arguments passed to Snakemake.
+
+    Returns:
+        str: The fingerprint, or None if the inputs couldn't be read.
+    """
+    user = paths.user()
+    digest = hashlib.sha256()
+
+    def add(*items):
+        for item in items:
+            data = item.encode() if isinstance(item, str) else item
+            digest.update(len(data).to_bytes(8, "little"))
+            digest.update(data)
+
+    try:
+        snapshot = git.get_snapshot()
+        add(
+            __version__,
+            json.dumps(list(snakemake_args)),
+            snapshot.sha,
+            snapshot.branch,
+        )
+        for name in ["showyourwork.yml", "zenodo.yml"]:
+            file = user.repo / name
+            add(name, file.read_bytes() if file.exists() else b"")
+        sources, others = tex_files(user.tex, [user.figures, user.output])
+        add(str(len(sources)))
+        for file in sources:
+            add(file.relative_to(user.repo).as_posix(), file.read_bytes())
+        add(*(file.relative_to(user.repo).as_posix() for file in others))
+        if user.static.exists():
+            add(*sorted(file.name for file in user.static.iterdir()))
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def prep_is_current(fingerprint, snakemake_args=()):
+    """
+    Return True if the last preprocessing run is still up to date, i.e., if
+    it stored the same ``fingerprint`` (see ``get_prep_fingerprint``) and
+    Snakemake wasn't asked to redo everything.
+
+    """
+    if fingerprint is None or is_forced(snakemake_args):
+        return False
+    if _load_config() is None:
+        return False
+    try:
+        return fingerprint_file().read_text() == fingerprint
+    except OSError:
+        return False
+
+
+def record_prep_fingerprint(fingerprint):
+    """
+    Store the fingerprint of a successful preprocessing run, replacing that
+    of the previous one. This should be computed before the run, so changes
+    made while it was running aren't missed on the next one.
+
+    Nothing is stored (so the next run isn't skipped) if the run syncs
+    with Overleaf, since we can't tell whether there are new changes to pull.
+
+    """
+    fingerprint_file().unlink(missing_ok=True)
+    config = _load_config()
+    if fingerprint is None or config is None:
+        return
+    overleaf = config.get("overleaf", {})
+    if overleaf.get("id", None) and overleaf.get("pull", None):
+        return
+    fingerprint_file().write_text(fingerprint)
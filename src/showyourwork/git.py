@@ -3,7 +3,20 @@ Miscellaneous functions for interfacing with ``git``.
 
 """
 
-from .subproc import get_stdout
+import json
+import os
+import re
+import zlib
+from collections import namedtuple
+from pathlib import Path
+
+from .subproc import call_counts, get_stdout
+
+#: Environment variable used to pass a ``GitSnapshot`` to child processes
+SNAPSHOT_ENV = "SHOWYOURWORK_GIT_SNAPSHOT"
+
+# Snapshots computed in this process, keyed by git directory
+_snapshots = {}
 
 
 def callback(code, stdout, stderr):
@@ -36,12 +49,12 @@ def get_commit_message():
     return get_stdout("git log -1 --pretty=%B", shell=True, callback=callback)
 
 
-def get_repo_url():
+def format_url(url):
     """
-    Return the full repository URL.
+    Strip the ``.git`` suffix from a remote URL and convert SSH remotes
+    to their HTTPS equivalent.
 
     """
-    url = get_stdout(["git", "config", "--get", "remote.origin.url"], callback=callback)
     if url.endswith(".git"):
         url = url[:-4]
     # Fix for SSH authentication
@@ -49,6 +62,16 @@ def get_repo_url():
     return url
 
 
+def get_repo_url():
+    """
+    Return the full repository URL.
+
+    """
+    return format_url(
+        get_stdout(["git", "config", "--get", "remote.origin.url"], callback=callback)
+    )
+
+
 def get_repo_branch():
     """
     Return the current repository branch name.
@@ -85,3 +108,270 @@ def get_repo_tag():
     if tag == "unknown":
         tag = ""
     return tag
+
+
+def get_call_count():
+    """
+    Return the number of ``git`` subprocesses spawned by the current process.
+
+    """
+    return call_counts["git"]
+
+
+class GitSnapshot(namedtuple("GitSnapshot", ["sha", "url", "slug", "branch", "tag"])):
+    """
+    The repository metadata used by the workflow, collected in a single pass.
+
+    Fields have the same values as the corresponding ``get_repo_*`` functions.
+
+    """
+
+    __slots__ = ()
+
+    def to_json(self):
+        return json.dumps(self._asdict())
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(**json.loads(data))
+
+
+class _UnsupportedLayout(Exception):
+    """
+    Raised when the repository can't be read without calling ``git``.
+
+    """
+
+
+class _GitDirectory:
+    """
+    A minimal reader for the files in a ``.git`` directory.
+
+    Supports regular checkouts, worktrees and submodules with loose and packed
+    refs. Anything else (e.g., the reftable backend or a tag object stored in
+    a pack) raises ``_UnsupportedLayout``.
+
+    """
+
+    def __init__(self, path="."):
+        if "GIT_DIR" in os.environ or "GIT_COMMON_DIR" in os.environ:
+            raise _UnsupportedLayout()
+        path = Path(path).resolve()
+        for folder in [path, *path.parents]:
+            dotgit = folder / ".git"
+            if dotgit.is_dir():
+                self.git_dir = dotgit
+                break
+            elif dotgit.is_file():
+                # Worktrees and submodules point to the actual git directory
+                line = dotgit.read_text().strip()
+                if not line.startswith("gitdir:"):
+                    raise _UnsupportedLayout()
+                self.git_dir = (folder / line[len("gitdir:") :].strip()).resolve()
+                break
+        else:
+            raise _UnsupportedLayout()
+        commondir = self.git_dir / "commondir"
+        if commondir.exists():
+            self.common_dir = (self.git_dir / commondir.read_text().strip()).resolve()
+        else:
+            self.common_dir = self.git_dir
+        if (self.common_dir / "reftable").exists():
+            raise _UnsupportedLayout()
+        self._packed_refs = None
+
+    @property
+    def packed_refs(self):
+        """
+        Mapping of ref name to ``(sha, peeled sha)`` from ``packed-refs``.
+
+        """
+        if self._packed_refs is None:
+            self._packed_refs = {}
+            file = self.common_dir / "packed-refs"
+            if file.exists():
+                ref = None
+                for line in file.read_text().splitlines():
+                    if not line or line.startswith("#"):
+                        continue
+                    elif line.startswith("^") and ref is not None:
+                        self._packed_refs[ref] = (self._packed_refs[ref][0], line[1:])
+                    else:
+                        sha, ref = line.split(" ", 1)
+                        self._packed_refs[ref] = (sha, None)
+        return self._packed_refs
+
+    def resolve(self, ref, depth=0):
+        """
+        Return the SHA a ref points to, or ``None`` if it doesn't exist.
+
+        """
+        if depth > 5:
+            raise _UnsupportedLayout()
+        for folder in (self.git_dir, self.common_dir):
+            file = folder / ref
+            if file.is_file():
+                content = file.read_text().strip()
+                if content.startswith("ref:"):
+                    return self.resolve(content[4:].strip(), depth + 1)
+                return content
+        return self.packed_refs.get(ref, (None, None))[0]
+
+    def head(self):
+        """
+        Return the SHA and branch name of ``HEAD``.
+
+        """
+        head = (self.git_dir / "HEAD").read_text().strip()
+        if head.startswith("ref:"):
+            ref = head[4:].strip()
+            sha = self.resolve(ref)
+            if sha is None:
+                # Unborn branch (no commits yet)
+                return "unknown", "unknown"
+            if ref.startswith("refs/heads/"):
+                ref = ref[len("refs/heads/") :]
+            return sha, ref
+        else:
+            # Detached HEAD
+            return head, "HEAD"
+
+    def peel(self, sha):
+        """
+        Return the SHA of the object a loose tag object points to.
+
+        """
+        file = self.common_dir / "objects" / sha[:2] / sha[2:]
+        if not file.exists():
+            raise _UnsupportedLayout()
+        data = zlib.decompress(file.read_bytes())
+        header, _, body = data.partition(b"\0")
+        if not header.startswith(b"tag "):
+            return sha
+        return body.split(b"\n", 1)[0].split(b" ")[1].decode()
+
+    def tag(self, sha):
+        """
+        Return the name of a tag pointing at commit ``sha``, or ``""``.
+
+        """
+        tags = set()
+        folder = self.common_dir / "refs" / "tags"
+        loose = set()
+        if folder.exists():
+            for file in folder.rglob("*"):
+                if file.is_file():
+                    name = file.relative_to(folder).as_posix()
+                    loose.add(name)
+                    target = file.read_text().strip()
+                    if target == sha or self.peel(target) == sha:
+                        tags.add(name)
+        for ref, (target, peeled) in self.packed_refs.items():
+            if ref.startswith("refs/tags/"):
+                name = ref[len("refs/tags/") :]
+                if name not in loose and sha in (target, peeled):
+                    tags.add(name)
+        return sorted(tags)[0] if tags else ""
+
+    def config(self, section, subsection, key):
+        """
+        Return the last value of a key in the repository config, or ``None``.
+
+        """
+        file = self.common_dir / "config"
+        if not file.exists():
+            return None
+        value = None
+        current = None
+        for raw_line in file.read_text().splitlines():
+            line = raw_line.strip()
+            if not line or line[0] in "#;":
+                continue
+            match = re.match(r'\[\s*([^\s\]"]+)(?:\s+"(.*)")?\s*\]', line)
+            if match:
+                current = (match.group(1).lower(), match.group(2))
+                continue
+            if current != (section, subsection) or "=" not in line:
+                continue
+            name, val = line.split("=", 1)
+            if name.strip().lower() != key:
+                continue
+            val = val.strip()
+            if val.startswith('"'):
+                val = val[1 : val.find('"', 1)]
+            else:
+                val = re.split(r"\s[#;]", val)[0].strip()
+            value = val
+        return value
+
+
+def _read_snapshot(repo):
+    """
+    Collect a ``GitSnapshot`` by reading the git directory directly.
+
+    """
+    sha, branch = repo.head()
+    url = format_url(repo.config("remote", "origin", "url") or "unknown")
+    slug = "/".join(url.split("/")[-2:])
+    tag = repo.tag(sha) if sha != "unknown" else ""
+    return GitSnapshot(sha=sha, url=url, slug=slug, branch=branch, tag=tag)
+
+
+def _query_snapshot():
+    """
+    Collect a ``GitSnapshot`` by calling ``git``.
+
+    """
+    url = get_repo_url()
+    return GitSnapshot(
+        sha=get_repo_sha(),
+        url=url,
+        slug="/".join(url.split("/")[-2:]),
+        branch=get_repo_branch(),
+        tag=get_repo_tag(),
+    )
+
+
+def get_snapshot():
+    """
+    Return a ``GitSnapshot`` of the current repository.
+
+    The metadata is read straight from the ``.git`` directory, falling back to
+    calling ``git`` for layouts we can't parse. Snapshots are reused within a
+    process, and a snapshot passed down by the parent process in the
+    ``SHOWYOURWORK_GIT_SNAPSHOT`` environment variable is reused as long as
+    ``HEAD`` hasn't moved since.
+
+    Returns:
+        GitSnapshot:
+            The current commit SHA, remote URL, slug, branch and tag.
+    """
+    try:
+        repo = _GitDirectory()
+        head = repo.head()
+    except (_UnsupportedLayout, OSError):
+        repo = None
+        head = None
+
+    # Reuse a previous snapshot if HEAD still points to the same commit
+    key = repo.git_dir if repo else None
+    candidates = [_snapshots.get(key)]
+    if os.getenv(SNAPSHOT_ENV):
+        try:
+            candidates.append(GitSnapshot.from_json(os.environ[SNAPSHOT_ENV]))
+        except (TypeError, ValueError):
+            pass
+    for snapshot in candidates:
+        if snapshot is not None and head in (None, (snapshot.sha, snapshot.branch)):
+            _snapshots[key] = snapshot
+            return snapshot
+
+    # Collect a fresh one
+    try:
+        if repo is None:
+            raise _UnsupportedLayout()
+        snapshot = _read_snapshot(repo)
+    except (_UnsupportedLayout, OSError, ValueError, IndexError, zlib.error):
+        snapshot = _query_snapshot()
+    _snapshots[key] = snapshot
+    return snapshot
@@ -0,0 +1,191 @@
+"""
+Incremental mirroring of a directory tree, used to set up the temporary
+directories the manuscript is compiled in.
+
+Each mirror keeps a small manifest of the files it was given and of the
+state they were in, so later syncs only write files that changed and only
+remove files that were mirrored before (and not, e.g., the intermediate
+files ``tectonic`` leaves behind).
+
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+#: Name of the manifest file written at the root of a mirror
+MANIFEST = ".showyourwork-mirror.json"
+
+#: Ways of writing files to a mirror
+mirror_methods = ["reflink", "hardlink", "copy"]
+
+# ``ioctl`` request to clone a file on Linux (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def reflink(source, destination):
+    """
+    Clone ``source`` to ``destination`` without copying its data.
+
+    Raises:
+        OSError: If the file system (or platform) doesn't support it.
+
+    """
+    if fcntl is None:
+        raise OSError("Reflinks are not supported on this platform.")
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.unlink(destination)
+            raise
+
+
+def _digest(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _state(st):
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _write(source, destination, method):
+    if destination.is_symlink() or destination.exists():
+        # Never write through a link to someone else's file
+        destination.unlink()
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if method == "hardlink":
+            os.link(source, destination)
+            return
+        elif method == "reflink":
+            reflink(source, destination)
+            shutil.copystat(source, destination)
+            return
+    except OSError:
+        pass
+    shutil.copy2(source, destination)
+
+
+def _load_manifest(destination):
+    try:
+        with open(destination / MANIFEST) as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def update_file(path, contents):
+    """
+    Write ``contents`` (bytes) to ``path`` unless the file already holds
+    them, so its modification time only changes when its contents do.
+
+    Returns:
+        bool: Whether the file was written.
+    """
+    path = Path(path)
+    try:
+        if not path.is_symlink() and path.read_bytes() == contents:
+            return False
+    except OSError:
+        pass
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(contents)
+    os.replace(tmp, path)
+    return True
+
+
+def mirror_directory(source, destination, method="reflink", exclude=()):
+    """
+    Make ``destination`` a copy of the directory ``source``, writing only
+    what changed since the last time it was mirrored.
+
+    A file is written if its size or modification time differ from those
+    recorded on the last sync (or if its copy in ``destination`` was changed
+    since) and its contents differ from those of the copy. Files mirrored on
+    a previous sync that are no longer in ``source`` are removed; files in
+    ``destination`` that didn't come from ``source`` are left alone.
+
+    Args:
+        source (str or Path): The directory to mirror. Symlinks are followed.
+        destination (str or Path): The mirror.
+        method (str, optional): How files are written; one of
+            ``mirror_methods``. Reflinks and hardlinks fall back to a copy
+            when they're not supported. Note that hardlinked files share
+            their contents with ``source``, so anything that writes to them
+            in place changes the originals. Default ``reflink``.
+        exclude (iterable, optional): Paths (relative to ``source``) that
+            aren't mirrored, e.g. because they're generated separately.
+
+    Returns:
+        tuple: The lists of (relative) paths written and removed.
+    """
+    if method not in mirror_methods:
+        raise ValueError(f"Invalid mirror method `{method}`.")
+    source = Path(source)
+    destination = Path(destination)
+    destination.mkdir(parents=True, exist_ok=True)
+    exclude = {Path(path).as_posix() for path in exclude} | {MANIFEST}
+    manifest = _load_manifest(destination)
+    updated = {}
+    written = []
+
+    for root, dirs, files in os.walk(source, followlinks=True):
+        dirs.sort()
+        for name in sorted(files):
+            path = Path(root) / name
+            relpath = path.relative_to(source).as_posix()
+            if relpath in exclude:
+                continue
+            target = destination / relpath
+            src_state = _state(path.stat())
+            try:
+                dst_state = _state(target.stat())
+            except OSError:
+                dst_state = None
+            if dst_state is not None and manifest.get(relpath) != (
+                src_state + dst_state
+            ):
+                # Something changed, but the contents may not have
+                if dst_state[0] != src_state[0] or _digest(path) != _digest(target):
+                    dst_state = None
+            if dst_state is None:
+                _write(path, target, method)
+                dst_state = _state(target.stat())
+                written.append(relpath)
+            updated[relpath] = src_state + dst_state
+
+    removed = []
+    for relpath in sorted(set(manifest) - set(updated)):
+        target = destination / relpath
+        if target.is_symlink() or target.is_file():
+            target.unlink()
+            removed.append(relpath)
+        # Prune the directories that are now empty
+        parent = target.parent
+        while parent != destination:
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+            parent = parent.parent
+
+    tmp = destination / f"{MANIFEST}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(updated, f)
+    os.replace(tmp, destination / MANIFEST)
+    return sorted(written), removed
@@ -12,11 +12,15 @@ import logging
 import os
 import time
 import types
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
 from . import exceptions, paths
 from .logging import ColorizingStreamHandler, get_logger
-from .zenodo import Zenodo
+from .session import get_settings
+from .uploads import get_upload_queue
+from .zenodo import get_deposit
 
 try:
     import snakemake
@@ -24,6 +28,10 @@ except ModuleNotFoundError:
     snakemake = None
 
 
+# In-flight and completed prefetches of remote cache files, keyed by cache path
+_prefetches = {}
+
+
 class SnakemakeFormatter(logging.Formatter):
     """
     Format Snakemake errors before displaying them on stdout.
@@ -90,7 +98,7 @@ def patch_snakemake_cache(zenodo_doi, sandbox_doi):
 
     - Add custom logging messages
     - Attempt to download the cache file from Zenodo/Zenodo Sandbox on ``fetch()``
-    - Uploads the cache file to Zenodo Sandbox on ``store()``
+    - Queue the cache file for upload to Zenodo Sandbox on ``store()``
 
     Args:
         zenodo_doi (str): The Zenodo DOI for the cache. Can be ``None``.
@@ -107,14 +115,20 @@ def patch_snakemake_cache(zenodo_doi, sandbox_doi):
     if output_file_cache is not None:
         # Instantiate our interfaces
         if zenodo_doi is not None:
-            zenodo = Zenodo(zenodo_doi)
+            zenodo = get_deposit(zenodo_doi)
         else:
             zenodo = None
         if sandbox_doi is not None:
-            sandbox = Zenodo(sandbox_doi)
+            sandbox = get_deposit(sandbox_doi)
         else:
             sandbox = None
 
+        # Check credentials up front so the user knows right away
+        # whether we'll be able to update the cache
+        for deposit in [zenodo, sandbox]:
+            if deposit is not None:
+                logger.debug(f"User owns {deposit.doi}: {deposit.user_is_owner}")
+
         # Make a copy of the original methods
         _fetch = output_file_cache.fetch
         _store = output_file_cache.store
@@ -130,8 +144,11 @@ def patch_snakemake_cache(zenodo_doi, sandbox_doi):
             else:
                 tarball = False
             for outputfile, cachefile in self.get_outputfiles_and_cachefiles(job):
+                source = wait_for_prefetch(cachefile)
                 file_exists = cachefile.exists()
-                if not file_exists:
+                if file_exists and source:
+                    logger.info(f"Restoring from {source} cache: {outputfile}...")
+                elif not file_exists:
                     # Attempt to download from Zenodo and then Zenodo Sandbox
                     try:
                         logger.info(f"Searching remote file cache: {outputfile}...")
@@ -196,26 +213,23 @@ def patch_snakemake_cache(zenodo_doi, sandbox_doi):
                 # draft on Zenodo Sandbox is always fully up to date. Note that
                 # we check the hash before uploading, so if it's already up to
                 # date, this is a no-op. Note that GitHub Actions runs should
-                # never update the cache
-                if file_exists and not snakemake.workflow.config.get("github_actions"):
+                # never update the cache. Uploads happen in the background and
+                # are flushed at the end of the build.
+                if (
+                    file_exists
+                    and sandbox is not None
+                    and not snakemake.workflow.config.get("github_actions")
+                ):
                     logger.info(
                         f"Syncing file with Zenodo Sandbox cache: {outputfile}..."
                     )
-                    try:
-                        sandbox.upload_file(
-                            cachefile,
-                            job.rule.name,
-                            tarball=tarball,
-                        )
-                    except Exception as e:
-                        # NOTE: we treate all Zenodo caching errors as non-fatal
-                        exceptions.restore_trace()
-                        logger.warning(
-                            f"Failed to sync {outputfile} with Zenodo Sandbox cache. "
-                            "See logs for details."
-                        )
-                        if len(str(e)):
-                            logger.debug(str(e))
+                    get_upload_queue().submit(
+                        sandbox,
+                        cachefile,
+                        job.rule.name,
+                        tarball=tarball,
+                        label=str(outputfile),
+                    )
 
             # Call the original method
             return _fetch(job)
@@ -225,7 +239,9 @@ def patch_snakemake_cache(zenodo_doi, sandbox_doi):
             result = _store(job)
 
             # GitHub Actions runs should never update the cache
-            if not snakemake.workflow.config.get("github_actions"):
+            if sandbox is not None and not snakemake.workflow.config.get(
+                "github_actions"
+            ):
                 # See note in `fetch()` about tarballs
                 if job.output[0].is_directory:
                     tarball = True
@@ -237,17 +253,13 @@ def patch_snakemake_cache(zenodo_doi, sandbox_doi):
                     cachefile,
                 ) in self.get_outputfiles_and_cachefiles(job):
                     logger.info(f"Caching output file on remote: {outputfile}...")
-                    try:
-                        sandbox.upload_file(cachefile, job.rule.name, tarball=tarball)
-                    except Exception as e:
-                        # NOTE: we treate all Zenodo caching errors as non-fatal
-                        exceptions.restore_trace()
-                        logger.warning(
-                            f"Failed to upload {outputfile} to Zenodo Sandbox cache. "
-                            "See logs for details."
-                        )
-                        if len(str(e)):
-                            logger.debug(str(e))
+                    get_upload_queue().submit(
+                        sandbox,
+                        cachefile,
+                        job.rule.name,
+                        tarball=tarball,
+                        label=str(outputfile),
+                    )
 
                 return result
 
@@ -403,66 +415,317 @@ def patch_snakemake_wait_for_files():
     snakemake.jobs.wait_for_files = wait_for_files
 
 
-def job_is_cached(job):
+def _local_cache_state(cache, job):
     """
-    Return True if a job's outputs will be restored from cache.
+    Return whether the local cache has a job's outputs and the job's cache
+    files, or ``None`` if the job can't be cached.
 
     """
-    logger = get_logger()
-    cache = snakemake.workflow.workflow.output_file_cache
+    try:
+        cachefiles = [
+            cachefile for _, cachefile in cache.get_outputfiles_and_cachefiles(job)
+        ]
+        return cache.exists(job), cachefiles
+    except Exception:
+        # Job is not cacheable (no output files or multiple output files)
+        return None
+
 
-    # Check if user requested caching for job
-    if not snakemake.workflow.workflow.is_cached_rule(job.rule):
-        logger.debug(f"Job {job.name} is not cacheable.")
-        return False
+def _remote_cache_state(doi):
+    """
+    Fetch the manifest and published records of a remote cache deposit.
 
-    # Check for a local cache hit
+    """
+    deposit = get_deposit(doi)
     try:
-        if cache.exists(job):
+        # Grab the file listing now rather than on the first lookup
+        manifest = deposit.get_manifest()
+        if manifest is not None:
+            len(manifest.files)
+        deposit.get_records()
+    except Exception as e:
+        # NOTE: we treat all Zenodo caching errors as non-fatal
+        exceptions.restore_trace()
+        get_logger().debug(f"Unable to access the remote cache {doi}: {e}")
+        return None
+    return deposit
+
+
+def get_cached_jobs(jobs):
+    """
+    Return the jobs whose outputs will be restored from cache.
+
+    The local cache is checked first, in parallel, followed by the local
+    sync ledgers of the remote cache deposits. Only if some jobs miss both
+    is the state of each deposit fetched (once, and for all deposits at the
+    same time); every remote lookup is then answered from memory.
+
+    """
+    logger = get_logger()
+    cache = snakemake.workflow.workflow.output_file_cache
+
+    # Check if user requested caching for the jobs
+    cacheable = []
+    for job in jobs:
+        if snakemake.workflow.workflow.is_cached_rule(job.rule):
+            cacheable.append(job)
+        else:
+            logger.debug(f"Job {job.name} is not cacheable.")
+    if not cacheable:
+        return set()
+
+    # Check the local cache
+    workers = max(1, int(get_settings()["max_transfers"]))
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="syw-cache"
+    ) as executor:
+        local = list(executor.map(partial(_local_cache_state, cache), cacheable))
+
+    cached_jobs = set()
+    misses = []
+    for job, state in zip(cacheable, local):
+        if state is None:
+            logger.debug(f"Job {job.name} is not cacheable.")
+        elif state[0]:
             logger.debug(f"Local cache exists for job {job.name}.")
-            return True
+            cached_jobs.add(job)
         else:
-            pass
-    except Exception:
-        # Job is not cacheable (no output files or multiple output files)
-        logger.debug(f"Job {job.name} is not cacheable.")
-        return False
+            misses.append((job, state[1]))
+    if not misses:
+        return cached_jobs
 
-    # Check if a remote cache exists
+    # The remote caches
     branch = snakemake.workflow.config["git_branch"]
-    zenodo_doi = snakemake.workflow.config["cache"][branch]["zenodo"]
-    sandbox_doi = snakemake.workflow.config["cache"][branch]["sandbox"]
-    if not zenodo_doi and not sandbox_doi:
-        logger.debug(f"No cache hits for job {job.name}.")
-        return False
-
-    # Loop over cache files for the job (should really only be one)
-    for _outputfile, cachefile in cache.get_outputfiles_and_cachefiles(job):
-
-        def _file_exists(cachefile, doi):
-            """
-            Return True if the file exists in the deposit with given doi.
-
-            """
-            if doi:
-                try:
-                    Zenodo(doi).download_file(cachefile, job.rule.name, dry_run=True)
-                    return True
-                except exceptions.FileNotFoundOnZenodo:
-                    pass
-            return False
-
-        file_exists = partial(_file_exists, cachefile)
-        if file_exists(zenodo_doi) or file_exists(sandbox_doi):
-            continue
+    dois = [
+        doi
+        for doi in (
+            snakemake.workflow.config["cache"][branch]["zenodo"],
+            snakemake.workflow.config["cache"][branch]["sandbox"],
+        )
+        if doi
+    ]
+
+    # Files we recently synced are in the local ledgers of the deposits
+    ledgers = [get_deposit(doi).sync_ledger for doi in dois]
+    remaining = []
+    for job, cachefiles in misses:
+        if ledgers and all(
+            any(ledger.is_current(job.rule.name, cachefile.name) for ledger in ledgers)
+            for cachefile in cachefiles
+        ):
+            logger.debug(f"Remote cache exists for job {job.name} (sync ledger).")
+            cached_jobs.add(job)
+        else:
+            remaining.append((job, cachefiles))
+    misses = remaining
+    if not misses:
+        return cached_jobs
+
+    # Fetch the state of the remote caches
+    deposits = []
+    if dois:
+        with ThreadPoolExecutor(
+            max_workers=len(dois), thread_name_prefix="syw-cache"
+        ) as executor:
+            deposits = [
+                deposit
+                for deposit in executor.map(_remote_cache_state, dois)
+                if deposit
+            ]
+
+    for job, cachefiles in misses:
+        if deposits and all(
+            any(deposit.has_file(job.rule.name, cachefile.name) for deposit in deposits)
+            for cachefile in cachefiles
+        ):
+            logger.debug(f"Remote cache exists for job {job.name}.")
+            cached_jobs.add(job)
         else:
-            # No hit!
             logger.debug(f"No cache hits for job {job.name}.")
-            return False
 
-    # All cache files exist
-    logger.debug(f"Remote cache exists for job {job.name}.")
-    return True
+    return cached_jobs
+
+
+def job_is_cached(job):
+    """
+    Return True if a job's outputs will be restored from cache.
+
+    """
+    return job in get_cached_jobs([job])
+
+
+def _prefetch(cachefile, rule_name, tarball, dois):
+    """
+    Download a cache file from the first deposit in ``dois`` that has it.
+
+    Returns:
+        str: The name of the service the file was restored from, or ``None``
+        on a cache miss.
+    """
+    logger = get_logger()
+    for doi in dois:
+        if not doi:
+            continue
+        deposit = get_deposit(doi)
+        try:
+            deposit.download_file(cachefile, rule_name, tarball=tarball)
+        except exceptions.FileNotFoundOnZenodo:
+            exceptions.restore_trace()
+        except Exception as e:
+            # NOTE: we treat all Zenodo caching errors as non-fatal; ``fetch()``
+            # will try again and report the error
+            exceptions.restore_trace()
+            logger.debug(f"Unable to prefetch {cachefile} from {deposit.doi}: {e}")
+            return None
+        else:
+            return deposit.service
+    return None
+
+
+def prefetch_remote_cache(dag):
+    """
+    Start downloading the remote cache files for all cached jobs in the DAG
+    that need to run, so that ``fetch()`` finds them in the local cache.
+
+    Downloads run in the background on a bounded thread pool (see the
+    ``max_transfers`` setting under ``zenodo_api``); ``fetch()`` waits for
+    the download of the file it needs, if one is in progress.
+
+    """
+    logger = get_logger()
+    cache = snakemake.workflow.workflow.output_file_cache
+    if cache is None:
+        return
+
+    # The remote caches, in order of preference
+    branch = snakemake.workflow.config["git_branch"]
+    dois = [
+        snakemake.workflow.config["cache"][branch]["zenodo"],
+        snakemake.workflow.config["cache"][branch]["sandbox"],
+    ]
+    if not any(dois):
+        return
+
+    # Collect the cache files we don't have locally
+    missing = []
+    for job in dag.jobs:
+        if not snakemake.workflow.workflow.is_cached_rule(job.rule):
+            continue
+        if not dag.needrun(job):
+            continue
+        try:
+            for _outputfile, cachefile in cache.get_outputfiles_and_cachefiles(job):
+                if str(cachefile) not in _prefetches and not cachefile.exists():
+                    missing.append(
+                        (cachefile, job.rule.name, job.output[0].is_directory)
+                    )
+        except Exception:
+            # Job is not cacheable (no output files or multiple output files)
+            continue
+    if not missing:
+        return
+
+    # Download them in the background
+    workers = max(1, int(get_settings()["max_transfers"]))
+    logger.debug(
+        f"Prefetching {len(missing)} file(s) from the remote cache "
+        f"using {workers} thread(s)..."
+    )
+    executor = ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="syw-prefetch"
+    )
+    for cachefile, rule_name, tarball in missing:
+        _prefetches[str(cachefile)] = executor.submit(
+            _prefetch, cachefile, rule_name, tarball, dois
+        )
+    executor.shutdown(wait=False)
+
+
+def wait_for_prefetch(cachefile):
+    """
+    Wait for the prefetch of a cache file to finish, if there is one.
+
+    Returns:
+        str: The name of the service the file was restored from, or ``None``
+        if it wasn't prefetched.
+    """
+    future = _prefetches.get(str(cachefile), None)
+    if future is None:
+        return None
+    try:
+        return future.result()
+    except Exception:
+        return None
+
+
+def get_job_graph(jobs):
+    """
+    Return the producer/consumer relationships between jobs.
+
+    Jobs are linked through the files they share: a job consumes another if
+    one of its inputs is one of the other's outputs.
+
+    Args:
+        jobs (iterable): The jobs in the DAG.
+
+    Returns:
+        tuple: Two dicts mapping each job to the set of jobs that consume its
+        outputs and to the set of jobs that produce its inputs, respectively.
+    """
+    producers = defaultdict(set)
+    for job in jobs:
+        for file in job.output:
+            producers[str(file)].add(job)
+    consumers_of = {job: set() for job in jobs}
+    producers_of = {job: set() for job in jobs}
+    for job in jobs:
+        for file in job.input:
+            for producer in producers.get(str(file), ()):
+                consumers_of[producer].add(job)
+                producers_of[job].add(producer)
+    return consumers_of, producers_of
+
+
+def find_skippable_jobs(jobs, cached_jobs):
+    """
+    Return the jobs we can skip because everything downstream of them is
+    either cached or skippable itself.
+
+    A job is skippable if it has at least one consumer and all of its
+    consumers are cached or skippable. We decide this for every job in a
+    single sweep over the graph in reverse topological order, so each job is
+    only visited once all of its consumers have been.
+
+    Args:
+        jobs (iterable): The jobs in the DAG.
+        cached_jobs (set): The jobs whose outputs will be restored from cache.
+
+    Returns:
+        set: The skippable jobs (not including ``cached_jobs``).
+    """
+    consumers_of, producers_of = get_job_graph(jobs)
+
+    # Start from the jobs with no consumers
+    pending = {job: len(consumers) for job, consumers in consumers_of.items()}
+    ready = [job for job, count in pending.items() if count == 0]
+    skippable = set()
+    while ready:
+        job = ready.pop()
+        if (
+            job not in cached_jobs
+            and consumers_of[job]
+            and all(
+                child in cached_jobs or child in skippable
+                for child in consumers_of[job]
+            )
+        ):
+            skippable.add(job)
+        for parent in producers_of[job]:
+            pending[parent] -= 1
+            if pending[parent] == 0:
+                ready.append(parent)
+
+    return skippable
 
 
 def get_skippable_jobs(dag):
@@ -474,42 +737,11 @@ def get_skippable_jobs(dag):
     logger = get_logger()
 
     # Get all jobs (nodes) with cache hits
-    cached_jobs = set([job for job in dag.jobs if job_is_cached(job)])
+    cached_jobs = get_cached_jobs(dag.jobs)
     logger.debug("The following jobs have cache hits:")
     logger.debug("    " + " ".join([job.name for job in cached_jobs]))
 
-    # Nodes we can skip
-    nodes = set(cached_jobs)
-
-    # Loop until there are no changes to the graph
-    new_nodes = True
-    while new_nodes:
-        new_nodes = set()
-        for node in nodes:
-            # Find all parents that are in `nodes`
-            parents = set()
-            for file in node.input:
-                try:
-                    parents |= set(dag.file2jobs(file)).difference(nodes)
-                except snakemake.exceptions.MissingRuleException:
-                    # Not all files have producers
-                    pass
-
-            # Find parents whose children are all in `nodes`
-            for parent in parents:
-                children = set()
-                for file in parent.output:
-                    children |= set([job for job in dag.jobs if file in job.input])
-                if all([child in nodes for child in children]):
-                    new_nodes.add(parent)
-
-        # Add the new batch to the list of all skippable nodes
-        nodes |= new_nodes
-
-    # Exclude the cached jobs from the list we'll skip
-    nodes = nodes.difference(cached_jobs)
-
-    return nodes
+    return find_skippable_jobs(list(dag.jobs), cached_jobs)
 
 
 def patch_snakemake_cache_optimization(dag):
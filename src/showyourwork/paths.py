@@ -1,8 +1,19 @@
+import os
 from os.path import realpath
 from pathlib import Path
 
 from . import git
 
+#: Environment variable used to share the resolved repository root with
+#: child processes (Snakemake and the workflow scripts)
+REPO_ROOT_ENV = "SHOWYOURWORK_REPO_ROOT"
+
+# Repository roots resolved in this process, keyed by working directory
+_roots = {}
+
+# Repository contexts created in this process, keyed by resolved root
+_contexts = {}
+
 
 # showyourwork paths
 class showyourwork:
@@ -20,58 +31,109 @@ class showyourwork:
         self.cookiecutter = self.module / "cookiecutter-showyourwork"
 
 
+def get_repo_root():
+    """
+    Return the path to the top level of the user's repository.
+
+    The result is memoized per working directory, so ``git`` is called at
+    most once per directory per process. If the root was resolved by a
+    parent process and passed down in the environment, ``git`` is not
+    called at all.
+
+    Raises:
+        Exception: If not in a git repo.
+    """
+    cwd = realpath(os.getcwd())
+    root = _roots.get(cwd)
+    if root is None:
+        root = os.getenv(REPO_ROOT_ENV)
+        if not (root and (cwd == root or cwd.startswith(root.rstrip("/") + "/"))):
+            root = git.get_repo_root()
+            if root == "unknown":
+                raise Exception("Not in a git repo.")
+        _roots[cwd] = root
+    return root
+
+
+class _tempdir:
+    """
+    A temporary directory under the user's repository that is created the
+    first time it is accessed.
+
+    """
+
+    def __init__(self, parent, name):
+        self.parent = parent
+        self.name = name
+
+    def __set_name__(self, owner, attr):
+        self.attr = attr
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        path = getattr(instance, self.parent) / self.name
+        path.mkdir(exist_ok=True)
+        # Shadow the descriptor so we only hit the filesystem once
+        instance.__dict__[self.attr] = path
+        return path
+
+
 # User paths
 class user:
     """
     Paths to various directories within the user's repository.
 
+    Instances are shared across the process: calling ``user()`` repeatedly
+    returns the same context for a given repository root. Temporary
+    directories under ``.showyourwork`` are created on first access.
+
+    Args:
+        path (str, optional): The path to the top level of the user's
+            repository (if running outside of the repository).
     """
 
-    def __init__(self, path=None):
+    # Temporary paths
+    temp = _tempdir("repo", ".showyourwork")
+    cache = _tempdir("temp", "cache")
+    preprocess = _tempdir("temp", "preprocess")
+    compile = _tempdir("temp", "compile")
+    logs = _tempdir("temp", "logs")
+    zenodo = _tempdir("temp", "zenodo")
+    zenodo_ids = _tempdir("zenodo", "ids")
+    sandbox = _tempdir("temp", "sandbox")
+    sandbox_ids = _tempdir("sandbox", "ids")
+    overleaf = _tempdir("temp", "overleaf")
+    flags = _tempdir("temp", "flags")
+
+    def __new__(cls, path=None):
+        if path is None:
+            path = Path(get_repo_root()).absolute()
+        key = Path(path).resolve()
+        context = _contexts.get(key)
+        if context is None:
+            context = super().__new__(cls)
+
+            # Repo paths
+            context.repo = Path(path)
+            context.src = context.repo / "src"
+            context.tex = context.src / "tex"
+            context.data = context.src / "data"
+            context.scripts = context.src / "scripts"
+            context.static = context.src / "static"
+            context.figures = context.tex / "figures"
+            context.output = context.tex / "output"
+            context.snakemake = context.repo / ".snakemake"
+
+            _contexts[key] = context
+        return context
+
+    @classmethod
+    def cache_clear(cls):
         """
+        Forget all cached repository contexts (e.g., after deleting the
+        ``.showyourwork`` directory).
 
-        Args:
-            path (str): The path to the top level of the user's repository
-                (if running outside of the repository).
         """
-        if path is None:
-            root = git.get_repo_root()
-            if root == "unknown":
-                raise Exception("Not in a git repo.")
-            else:
-                path = Path(root).absolute()
-
-        # Repo paths
-        self.repo = Path(path)
-        self.src = self.repo / "src"
-        self.tex = self.src / "tex"
-        self.data = self.src / "data"
-        self.scripts = self.src / "scripts"
-        self.static = self.src / "static"
-        self.figures = self.tex / "figures"
-        self.output = self.tex / "output"
-
-        # Temporary paths
-        self.temp = self.repo / ".showyourwork"
-        self.temp.mkdir(exist_ok=True)
-        self.snakemake = self.repo / ".snakemake"
-        self.cache = self.temp / "cache"
-        self.cache.mkdir(exist_ok=True)
-        self.preprocess = self.temp / "preprocess"
-        self.preprocess.mkdir(exist_ok=True)
-        self.compile = self.temp / "compile"
-        self.compile.mkdir(exist_ok=True)
-        self.logs = self.temp / "logs"
-        self.logs.mkdir(exist_ok=True)
-        self.zenodo = self.temp / "zenodo"
-        self.zenodo.mkdir(exist_ok=True)
-        self.zenodo_ids = self.zenodo / "ids"
-        self.zenodo_ids.mkdir(exist_ok=True)
-        self.sandbox = self.temp / "sandbox"
-        self.sandbox.mkdir(exist_ok=True)
-        self.sandbox_ids = self.sandbox / "ids"
-        self.sandbox_ids.mkdir(exist_ok=True)
-        self.overleaf = self.temp / "overleaf"
-        self.overleaf.mkdir(exist_ok=True)
-        self.flags = self.temp / "flags"
-        self.flags.mkdir(exist_ok=True)
+        _roots.clear()
+        _contexts.clear()
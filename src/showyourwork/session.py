@@ -0,0 +1,260 @@
+"""
+Pooled, retrying HTTP session used by the Zenodo interface.
+
+"""
+
+import email.utils
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .logging import get_logger
+
+try:
+    import snakemake
+except ModuleNotFoundError:
+    snakemake = None
+
+
+#: Default settings for the session; override them with the ``zenodo_api``
+#: key in ``showyourwork.yml``
+defaults = {
+    "connect_timeout": 10,
+    "read_timeout": 300,
+    "max_retries": 5,
+    "backoff_factor": 1.0,
+    "max_backoff": 60,
+    "pool_size": 10,
+    "max_transfers": 4,
+    "sync_ttl": 86400,
+}
+
+# HTTP status codes worth retrying
+retry_statuses = {429, 500, 502, 503, 504}
+
+# Methods we can safely repeat if the server may have acted on the request
+idempotent_methods = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# The process-wide session
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_settings():
+    """
+    Return the session settings, taking user overrides from the config
+    if we're running inside Snakemake.
+
+    """
+    settings = dict(defaults)
+    try:
+        settings.update(snakemake.workflow.config.get("zenodo_api", None) or {})
+    except AttributeError:
+        pass
+    return settings
+
+
+class SessionStats:
+    """
+    Thread-safe request statistics for a ``Session``.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latencies = []
+
+    def record(self, latency, sent=0, received=0, failed=False):
+        with self._lock:
+            self.requests += 1
+            self.failures += int(failed)
+            self.bytes_sent += sent
+            self.bytes_received += received
+            self.latencies.append(latency)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_bytes(self, sent=0, received=0):
+        with self._lock:
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+    def percentile(self, q):
+        """
+        Return the ``q``-th percentile of the request latency in seconds.
+
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return 0.0
+        idx = min(len(latencies) - 1, int(round(q / 100 * (len(latencies) - 1))))
+        return latencies[idx]
+
+    def summary(self):
+        """
+        Return a one-line, human-readable summary of the statistics.
+
+        """
+        return (
+            f"{self.requests} request(s), {self.retries} retry(ies), "
+            f"{self.failures} failure(s); "
+            f"{self.bytes_sent / 1e6:.2f} MB sent, "
+            f"{self.bytes_received / 1e6:.2f} MB received; "
+            f"latency p50={self.percentile(50):.2f}s "
+            f"p90={self.percentile(90):.2f}s "
+            f"p99={self.percentile(99):.2f}s"
+        )
+
+
+def _retry_after(response):
+    """
+    Return the delay in seconds requested by a ``Retry-After`` header, if any.
+
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+def _body_size(body):
+    """
+    Return the size in bytes of a request body, if we can tell.
+
+    """
+    if body is None:
+        return 0
+    elif isinstance(body, (bytes, bytearray)):
+        return len(body)
+    elif isinstance(body, str):
+        return len(body.encode())
+    try:
+        return os.fstat(body.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+class Session(requests.Session):
+    """
+    A ``requests`` session with connection pooling, default timeouts and
+    exponential backoff on rate limiting and server errors.
+
+    Retries honor the ``Retry-After`` header. Non-idempotent requests
+    (``POST``) are only retried when the server tells us it didn't process
+    them (status 429) or when we never managed to connect.
+
+    """
+
+    def __init__(self, settings=None):
+        super().__init__()
+        self.settings = dict(defaults, **(settings or {}))
+        self.stats = SessionStats()
+        adapter = HTTPAdapter(
+            pool_connections=self.settings["pool_size"],
+            pool_maxsize=self.settings["pool_size"],
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.headers["Referer"] = "https://show-your.work"
+
+    def _backoff(self, attempt, response=None):
+        delay = None if response is None else _retry_after(response)
+        if delay is None:
+            delay = self.settings["backoff_factor"] * 2**attempt
+        return min(delay, self.settings["max_backoff"])
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault(
+            "timeout",
+            (self.settings["connect_timeout"], self.settings["read_timeout"]),
+        )
+        method = method.upper()
+        max_retries = self.settings["max_retries"]
+        body = kwargs.get("data")
+        start_pos = body.tell() if hasattr(body, "seek") else None
+        sent = _body_size(body)
+        if kwargs.get("json") is not None:
+            sent += _body_size(json.dumps(kwargs["json"]))
+        logger = get_logger()
+
+        for attempt in range(max_retries + 1):
+            if start_pos is not None:
+                body.seek(start_pos)
+            start = time.monotonic()
+            try:
+                response = super().request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.stats.record(time.monotonic() - start, sent=sent, failed=True)
+                retryable = isinstance(e, requests.exceptions.ConnectTimeout) or (
+                    method in idempotent_methods
+                    and isinstance(
+                        e,
+                        (
+                            requests.exceptions.ConnectionError,
+                            requests.exceptions.Timeout,
+                        ),
+                    )
+                )
+                if not retryable or attempt == max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.debug(
+                    f"{method} request failed ({e}); retrying in {delay:.1f}s..."
+                )
+            else:
+                if kwargs.get("stream"):
+                    received = int(response.headers.get("Content-Length", 0) or 0)
+                else:
+                    received = len(response.content)
+                failed = response.status_code > 204
+                self.stats.record(
+                    time.monotonic() - start,
+                    sent=sent,
+                    received=received,
+                    failed=failed,
+                )
+                retryable = response.status_code in retry_statuses and (
+                    method in idempotent_methods or response.status_code == 429
+                )
+                if not retryable or attempt == max_retries:
+                    return response
+                delay = self._backoff(attempt, response)
+                logger.debug(
+                    f"{method} request returned status {response.status_code}; "
+                    f"retrying in {delay:.1f}s..."
+                )
+                response.close()
+            self.stats.record_retry()
+            time.sleep(delay)
+
+
+def get_session():
+    """
+    Return the process-wide HTTP session, creating it if needed.
+
+    """
+    global _session  # noqa
+    with _session_lock:
+        if _session is None:
+            _session = Session(get_settings())
+        return _session
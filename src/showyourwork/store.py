@@ -0,0 +1,163 @@
+"""
+An optional machine-wide store for Zenodo datasets, shared by all projects.
+
+Files in the store are keyed by the DOI of the record they come from, their
+name, and their published checksum, so an entry never changes once it has
+been written. Projects get their copies of the files as links to the store
+(see ``link_methods``), so a dataset used by several projects is only
+downloaded, extracted, and stored once.
+
+"""
+
+import os
+import shutil
+import stat
+from pathlib import Path
+from urllib.parse import quote
+
+from . import exceptions
+from .archives import extract_members, normalize_member
+from .logging import get_logger
+from .mirror import reflink
+
+try:
+    import snakemake
+except ModuleNotFoundError:
+    snakemake = None
+
+
+#: Environment variable setting the store location for every project on the
+#: machine (overridden by ``dataset_store.path`` in ``showyourwork.yml``)
+STORE_ENV = "SHOWYOURWORK_DATASET_STORE"
+
+#: Ways of materializing store entries in a project
+link_methods = ["hardlink", "reflink", "symlink", "copy"]
+
+
+class DatasetStore:
+    """
+    A content-addressed store of dataset files.
+
+    Args:
+        root (str or Path): The directory the store lives in.
+        link (str, optional): How store entries are materialized in a
+            project; one of ``link_methods``. If that's not possible (e.g.,
+            hardlinks across file systems), the file is copied instead.
+            Default ``hardlink``.
+
+    """
+
+    def __init__(self, root, link="hardlink"):
+        if link not in link_methods:
+            raise exceptions.ConfigError(
+                f"Invalid value `{link}` for setting `dataset_store.link`. "
+                f"Options are: {', '.join(link_methods)}."
+            )
+        self.root = Path(root).expanduser().absolute()
+        self.link = link
+
+    def path(self, doi, name, checksum):
+        """
+        Return the location of a file in the store.
+
+        Args:
+            doi (str): The version DOI of the record the file belongs to.
+            name (str): The name of the file in the record. For files
+                extracted from an archive, this should be the name of the
+                archive followed by the path to the member inside it.
+            checksum (str): The published checksum of the file (or of the
+                archive it was extracted from), as ``algorithm:digest``.
+
+        """
+        algorithm, _, digest = checksum.rpartition(":")
+        key = f"{algorithm or 'md5'}-{digest}".lower()
+        return self.root / quote(doi, safe="") / key / name
+
+    def add(self, path):
+        """
+        Mark a file that was just written to the store as complete.
+
+        Entries are made read-only, since projects share them through
+        (hard)links and must not modify them in place.
+
+        """
+        mode = os.stat(path).st_mode
+        os.chmod(path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+    def materialize(self, source, destination):
+        """
+        Make the store entry ``source`` available at ``destination``,
+        replacing whatever is there.
+
+        """
+        destination = Path(destination)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        if destination.is_symlink() or destination.exists():
+            destination.unlink()
+        try:
+            if self.link == "hardlink":
+                os.link(source, destination)
+            elif self.link == "reflink":
+                reflink(source, destination)
+            elif self.link == "symlink":
+                os.symlink(source, destination)
+            else:
+                shutil.copyfile(source, destination)
+        except OSError as e:
+            get_logger().debug(
+                f"Unable to {self.link} {destination} to the dataset store ({e}); "
+                "copying it instead."
+            )
+            shutil.copyfile(source, destination)
+
+    def extract(self, doi, archive_name, checksum, archive, members, index_file=None):
+        """
+        Extract files from an archive into the store and materialize them.
+
+        Members already in the store aren't extracted again.
+
+        Args:
+            doi (str): The version DOI of the record the archive belongs to.
+            archive_name (str): The name of the archive in the record.
+            checksum (str): The published checksum of the archive.
+            archive (str or Path): The archive on disk.
+            members (dict): Mapping of member names in the archive to the
+                paths they should be materialized at.
+            index_file (str or Path, optional): Where to keep the member
+                index of the archive (see ``archives.extract_members``).
+
+        """
+        entries = {
+            name: self.path(
+                doi, f"{archive_name}.contents/{normalize_member(name)}", checksum
+            )
+            for name in members
+        }
+        missing = {name: entry for name, entry in entries.items() if not entry.exists()}
+        if missing:
+            extract_members(archive, missing, index_file=index_file)
+            for entry in missing.values():
+                if entry.is_file():
+                    self.add(entry)
+        for name, destination in members.items():
+            if entries[name].is_dir():
+                Path(destination).mkdir(parents=True, exist_ok=True)
+            else:
+                self.materialize(entries[name], destination)
+
+
+def get_dataset_store():
+    """
+    Return the dataset store configured for this workflow, or ``None`` if
+    the store is disabled.
+
+    """
+    settings = {}
+    try:
+        settings = snakemake.workflow.config.get("dataset_store", None) or {}
+    except AttributeError:
+        pass
+    root = settings.get("path", None) or os.getenv(STORE_ENV, None)
+    if not root:
+        return None
+    return DatasetStore(root, settings.get("link", None) or "hardlink")
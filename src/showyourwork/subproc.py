@@ -1,4 +1,10 @@
+import shlex
 import subprocess
+from collections import Counter
+from pathlib import Path
+
+#: Number of times each program was run via ``get_stdout`` in this process
+call_counts = Counter()
 
 
 def process_run_result(code, stdout, stderr):
@@ -34,6 +40,11 @@ def get_stdout(args, shell=False, cwd=None, secrets=(), callback=process_run_res
         callback (callable, optional): Callback to process the result.
 
     """
+    # Keep track of how often we shell out to each program
+    program = shlex.split(args)[:1] if isinstance(args, str) else list(args)[:1]
+    if program:
+        call_counts[Path(program[0]).name] += 1
+
     # Run the command and capture all output
     result = subprocess.run(
         args, shell=shell, cwd=cwd, capture_output=True, check=False
@@ -0,0 +1,404 @@
+r"""
+A fast, pure-Python alternative to the ``tectonic`` pass of the preprocessing
+stage.
+
+The scanner reads the manuscript (and the files it pulls in with ``\input``)
+and builds the same XML article tree the ``preprocess.tex`` stylesheet logs
+when the manuscript is compiled: ``figure`` environments, ``\includegraphics``,
+``\script``, ``\label``, ``\caption``, ``\variable``, ``\graphicspath`` and
+``\marginicon``. It doesn't expand macros, so whenever it runs into something
+it can't resolve on its own (custom macros wrapping any of these commands,
+conditionals, commands with macros in their arguments, ...) it gives up with
+an ``UnsupportedTeX`` error, and we compile the manuscript instead.
+
+"""
+
+import re
+from pathlib import Path
+from xml.etree.ElementTree import Element, SubElement
+
+#: Commands logged to the XML tree, mapped to their XML tags
+logged_commands = {
+    "includegraphics": "GRAPHICS",
+    "script": "SCRIPT",
+    "label": "LABEL",
+    "variable": "INPUT",
+    "graphicspath": "GRAPHICSPATH",
+    "marginicon": "MARGINICON",
+    "caption": "CAPTION",
+}
+
+#: Environments logged to the XML tree
+figure_environments = {"figure", "figure*"}
+
+#: Environments whose contents aren't TeX
+verbatim_environments = {"verbatim", "verbatim*", "lstlisting", "minted", "comment"}
+
+#: Commands (mostly from common document classes) known to wrap the commands
+#: we're looking for, or to pull in files in ways we don't follow
+unsupported_commands = {
+    "plotone",
+    "plottwo",
+    "gridline",
+    "fig",
+    "leftfig",
+    "rightfig",
+    "boxedfig",
+    "rotatefig",
+    "includepdf",
+    "import",
+    "subimport",
+    "subfile",
+    "inputfrom",
+    "includefrom",
+    "csname",
+    "expandafter",
+    "makeatletter",
+}
+
+#: Commands that define other commands (or environments)
+definition_commands = {
+    "newcommand",
+    "renewcommand",
+    "providecommand",
+    "DeclareRobustCommand",
+    "NewDocumentCommand",
+    "RenewDocumentCommand",
+    "ProvideDocumentCommand",
+    "DeclareDocumentCommand",
+    "def",
+    "gdef",
+    "edef",
+    "xdef",
+    "let",
+}
+
+#: Commands that define environments
+environment_definitions = {
+    "newenvironment",
+    "renewenvironment",
+    "NewDocumentEnvironment",
+    "RenewDocumentEnvironment",
+}
+
+# A control sequence
+_control_sequence = re.compile(r"\\([A-Za-z@]+\*?|.)", re.DOTALL)
+
+# Anything that means a definition is a wrapper for a command we care about
+_sensitive = re.compile(
+    r"\\(?:"
+    + "|".join(list(logged_commands) + ["input", "include"])
+    + r")(?![A-Za-z@])|\\begin\s*\{figure"
+)
+
+# Definitions in class and style files, roughly
+_class_definition = re.compile(
+    r"\\(?:(?:re)?newcommand\*?|providecommand\*?|DeclareRobustCommand\*?"
+    r"|[gex]?def|(?:re)?newenvironment)\s*\{?\\?([A-Za-z@]+\*?)"
+)
+
+
+class UnsupportedTeX(Exception):
+    """
+    Raised when the scanner finds something it can't resolve.
+
+    """
+
+
+def _strip_comments(text):
+    return re.sub(r"(?<!\\)%.*", "", text)
+
+
+class TexScanner:
+    """
+    Builds the XML article tree of a manuscript without compiling it.
+
+    Args:
+        ms_tex (str or Path): The manuscript file. Files it pulls in with
+            ``\\input`` are looked up relative to its directory.
+
+    Attributes:
+        root (Element): The root of the XML tree.
+        files (list): All the TeX files the scanner read.
+
+    """
+
+    def __init__(self, ms_tex):
+        self.ms_tex = Path(ms_tex)
+        self.tex_dir = self.ms_tex.parent
+        self.root = Element("HTML")
+        self.files = []
+        self._stack = [self.root]
+        self._active = False
+        self._done = False
+        self._wrappers = set(unsupported_commands)
+        self._wrapper_environments = set()
+
+    def scan(self):
+        """
+        Scan the manuscript.
+
+        Raises:
+            UnsupportedTeX: If the manuscript can't be scanned reliably.
+
+        Returns:
+            Element: The root of the XML tree.
+        """
+        for file in sorted(self.tex_dir.glob("*.cls")) + sorted(
+            self.tex_dir.glob("*.sty")
+        ):
+            self._scan_class(file)
+        self._scan_file(self.ms_tex)
+        if not self._active:
+            raise UnsupportedTeX(r"The manuscript doesn't load showyourwork.")
+        if len(self._stack) > 1:
+            raise UnsupportedTeX("Unterminated figure environment.")
+        return self.root
+
+    def _scan_class(self, file):
+        """
+        Record the commands and environments defined in a local class or
+        style file that wrap the commands we're looking for.
+
+        """
+        text = _strip_comments(file.read_text(errors="replace"))
+        matches = list(_class_definition.finditer(text))
+        for match, following in zip(matches, matches[1:] + [None]):
+            end = following.start() if following else len(text)
+            body = text[match.end() : end]
+            name = match.group(1)
+            if (
+                _sensitive.search(body)
+                # The stylesheet takes care of these
+                and name not in logged_commands
+                and name not in figure_environments
+            ):
+                self._wrappers.add(name)
+                self._wrapper_environments.add(name)
+
+    def _resolve(self, name):
+        for candidate in (self.tex_dir / name, self.tex_dir / f"{name}.tex"):
+            if candidate.is_file():
+                return candidate
+        raise UnsupportedTeX(f"Can't find input file `{name}`.")
+
+    def _scan_file(self, file):
+        if len(self.files) > 1000:
+            raise UnsupportedTeX("Too many nested input files.")
+        self.files.append(file)
+        _Reader(self, _strip_comments(file.read_text(errors="replace"))).run()
+
+    def _log(self, tag, text=None):
+        element = SubElement(self._stack[-1], tag)
+        element.text = text or None
+        return element
+
+
+class _Reader:
+    """
+    Reads the commands in a single TeX file.
+
+    """
+
+    def __init__(self, scanner, text):
+        self.scanner = scanner
+        self.text = text
+        self.pos = 0
+
+    def skip_space(self):
+        while self.pos < len(self.text) and self.text[self.pos].isspace():
+            self.pos += 1
+
+    def peek(self):
+        self.skip_space()
+        return self.text[self.pos] if self.pos < len(self.text) else ""
+
+    def read_delimited(self, open_char, close_char):
+        """
+        Read a balanced group starting at the current position and return
+        its contents.
+
+        """
+        self.skip_space()
+        if self.text[self.pos : self.pos + 1] != open_char:
+            raise UnsupportedTeX(f"Expected `{open_char}`.")
+        depth = 0
+        start = self.pos + 1
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            if char == "\\":
+                self.pos += 2
+                continue
+            elif char == open_char:
+                depth += 1
+            elif char == close_char:
+                depth -= 1
+                if depth == 0:
+                    self.pos += 1
+                    return self.text[start : self.pos - 1]
+            self.pos += 1
+        raise UnsupportedTeX(f"Unbalanced `{open_char}`.")
+
+    def read_group(self):
+        return self.read_delimited("{", "}")
+
+    def skip_optional(self):
+        while self.peek() == "[":
+            self.read_delimited("[", "]")
+
+    def read_argument(self):
+        """
+        Read the (literal) argument of a command we log.
+
+        """
+        argument = self.read_group()
+        if "\\" in argument or "#" in argument:
+            raise UnsupportedTeX(f"Can't expand `{argument}`.")
+        return argument.strip()
+
+    def read_name(self):
+        """
+        Read the name of a command or environment being defined.
+
+        """
+        if self.peek() == "{":
+            name = self.read_group().strip()
+            return name[1:] if name.startswith("\\") else name
+        match = _control_sequence.match(self.text, self.pos)
+        if not match:
+            raise UnsupportedTeX("Can't parse a definition.")
+        self.pos = match.end()
+        return match.group(1)
+
+    def run(self):
+        scanner = self.scanner
+        while not scanner._done:
+            self.pos = self.text.find("\\", self.pos)
+            if self.pos < 0:
+                return
+            match = _control_sequence.match(self.text, self.pos)
+            if match is None:
+                return
+            self.pos = match.end()
+            name = match.group(1)
+            if name == "endinput":
+                return
+            self.command(name)
+
+    def command(self, name):
+        scanner = self.scanner
+        if name in ("verb", "verb*"):
+            delimiter = self.text[self.pos : self.pos + 1]
+            end = self.text.find(delimiter, self.pos + 1)
+            self.pos = len(self.text) if end < 0 else end + 1
+        elif name == "begin":
+            environment = self.read_group().strip()
+            if environment in verbatim_environments:
+                end = self.text.find(f"\\end{{{environment}}}", self.pos)
+                if end < 0:
+                    raise UnsupportedTeX(f"Unterminated {environment} environment.")
+                self.pos = end + len(f"\\end{{{environment}}}")
+            elif environment in scanner._wrapper_environments:
+                raise UnsupportedTeX(f"Can't expand environment `{environment}`.")
+            elif environment in figure_environments and scanner._active:
+                scanner._stack.append(scanner._log("FIGURE"))
+        elif name == "end":
+            environment = self.read_group().strip()
+            if environment == "document":
+                scanner._done = True
+            elif environment in figure_environments and scanner._active:
+                if len(scanner._stack) == 1:
+                    raise UnsupportedTeX(f"Unmatched `\\end{{{environment}}}`.")
+                scanner._stack.pop()
+        elif name in ("input", "include"):
+            if self.peek() != "{":
+                raise UnsupportedTeX(f"Can't follow `\\{name}` without braces.")
+            scanner._scan_file(scanner._resolve(self.read_argument()))
+        elif name in ("usepackage", "RequirePackage"):
+            self.skip_optional()
+            packages = [package.strip() for package in self.read_group().split(",")]
+            if "showyourwork" in packages:
+                scanner._active = True
+        elif name.rstrip("*") in definition_commands | environment_definitions:
+            self.definition(name.rstrip("*"))
+        elif name in scanner._wrappers:
+            raise UnsupportedTeX(f"Can't expand `\\{name}`.")
+        elif name.startswith("if"):
+            raise UnsupportedTeX(f"Can't evaluate conditional `\\{name}`.")
+        elif name.rstrip("*") in logged_commands and scanner._active:
+            if name.endswith("*"):
+                raise UnsupportedTeX(f"Can't follow `\\{name}`.")
+            self.logged(name)
+
+    def logged(self, name):
+        scanner = self.scanner
+        tag = logged_commands[name]
+        if name == "caption":
+            # The stylesheet logs the caption, then typesets its contents
+            scanner._log(tag)
+        elif name == "marginicon":
+            self.read_group()
+            scanner._log(tag)
+        elif name == "graphicspath":
+            argument = self.read_group()
+            if "\\" in argument or "#" in argument:
+                raise UnsupportedTeX(f"Can't expand `{argument}`.")
+            scanner._log(tag, argument)
+        else:
+            if name == "includegraphics":
+                self.skip_optional()
+            scanner._log(tag, self.read_argument())
+
+    def definition(self, name):
+        scanner = self.scanner
+        if name == "let":
+            new = self.read_name()
+            if self.peek() == "=":
+                self.pos += 1
+            old = self.read_name()
+            body = f"\\{old}"
+        else:
+            new = self.read_name()
+            if name in ("def", "gdef", "edef", "xdef"):
+                # Skip the parameter text
+                start = self.pos
+                self.pos = self.text.find("{", self.pos)
+                if self.pos < 0 or "\\" in self.text[start : self.pos]:
+                    raise UnsupportedTeX(f"Can't parse the definition of `\\{new}`.")
+            elif "Document" in name:
+                self.read_group()
+            else:
+                self.skip_optional()
+            body = self.read_group()
+            if name in environment_definitions:
+                body += self.read_group()
+        if new in logged_commands or new in ("input", "include", "begin", "end"):
+            raise UnsupportedTeX(f"Can't follow the redefinition of `\\{new}`.")
+        if new in figure_environments:
+            raise UnsupportedTeX(f"Can't follow the redefinition of `{new}`.")
+        if _sensitive.search(body) or any(
+            re.search(rf"\\{re.escape(wrapper)}\b", body)
+            for wrapper in scanner._wrappers
+            if wrapper not in unsupported_commands
+        ):
+            if name in environment_definitions:
+                scanner._wrapper_environments.add(new)
+            else:
+                scanner._wrappers.add(new)
+
+
+def scan(ms_tex):
+    """
+    Build the XML article tree of a manuscript without compiling it.
+
+    Args:
+        ms_tex (str or Path): The manuscript file.
+
+    Raises:
+        UnsupportedTeX: If the manuscript can't be scanned reliably.
+
+    Returns:
+        tuple: The root of the XML tree and the list of TeX files read.
+    """
+    scanner = TexScanner(ms_tex)
+    return scanner.scan(), list(dict.fromkeys(scanner.files))
@@ -0,0 +1,657 @@
+"""
+Streaming file transfers over the shared HTTP session.
+
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from . import exceptions
+from .logging import get_logger
+from .session import get_session, get_settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+#: Size of the chunks read from and written to disk, in bytes
+chunk_size = 1 << 20
+
+
+class TransferProgress:
+    """
+    A single-line progress display shared by all transfers in the process.
+
+    Parallel transfers are aggregated into one line, so they don't garble
+    each other's output. Nothing is shown unless ``stderr`` is a terminal.
+
+    """
+
+    def __init__(self, stream=sys.stderr, interval=0.2):
+        self.stream = stream
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._transfers = {}
+        self._last = 0.0
+        self._width = 0
+
+    @property
+    def enabled(self):
+        isatty = getattr(self.stream, "isatty", None)
+        return bool(isatty and isatty())
+
+    def start(self, key, total):
+        with self._lock:
+            self._transfers[key] = [0, total or 0]
+
+    def update(self, key, size):
+        with self._lock:
+            self._transfers[key][0] += size
+            now = time.monotonic()
+            if now - self._last >= self.interval:
+                self._last = now
+                self._render()
+
+    def finish(self, key):
+        with self._lock:
+            self._transfers.pop(key, None)
+            self._render()
+
+    def _render(self):
+        if not self.enabled:
+            return
+        if self._transfers:
+            done = sum(value[0] for value in self._transfers.values())
+            total = sum(value[1] for value in self._transfers.values())
+            line = (
+                f"Transferring {len(self._transfers)} file(s): "
+                f"{done / 1e6:.1f} / {total / 1e6:.1f} MB"
+            )
+        else:
+            line = ""
+        self.stream.write("\r" + line.ljust(self._width) + ("" if line else "\r"))
+        self.stream.flush()
+        self._width = len(line)
+
+
+#: The process-wide progress display
+progress = TransferProgress()
+
+
+class _ProgressReader:
+    """
+    A read-only file wrapper that reports the bytes read to ``progress``
+    and keeps track of their size and MD5 digest.
+
+    """
+
+    def __init__(self, file, key, show_progress=True):
+        self.file = file
+        self.key = key
+        self.show_progress = show_progress
+        self.mode = file.mode
+        self.digest = hashlib.md5()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.file.read(chunk_size if size is None or size < 0 else size)
+        self.digest.update(data)
+        self.size += len(data)
+        if self.show_progress:
+            progress.update(self.key, len(data))
+        return data
+
+    def seek(self, *args):
+        position = self.file.seek(*args)
+        if position == 0:
+            # We're restarting the upload
+            self.digest = hashlib.md5()
+            self.size = 0
+            if self.show_progress:
+                progress.start(self.key, os.fstat(self.file.fileno()).st_size)
+        return position
+
+    def tell(self):
+        return self.file.tell()
+
+    def fileno(self):
+        return self.file.fileno()
+
+
+def parse_checksum(checksum):
+    """
+    Split a checksum of the form ``algorithm:digest`` (as reported by Zenodo)
+    into its algorithm and digest. A bare digest is assumed to be MD5.
+
+    """
+    algorithm, _, digest = checksum.rpartition(":")
+    return (algorithm or "md5").lower(), digest.lower()
+
+
+def file_checksum(path, algorithm="md5"):
+    """
+    Return the hex digest of a file on disk.
+
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _log_throughput(verb, path, size, elapsed):
+    rate = size / 1e6 / elapsed if elapsed > 0 else float("inf")
+    get_logger().debug(
+        f"{verb} {path} ({size / 1e6:.2f} MB in {elapsed:.2f}s, {rate:.2f} MB/s)."
+    )
+
+
+def part_path(path):
+    """
+    Return the path to the partial download of ``path``.
+
+    """
+    path = Path(path)
+    return path.with_name(f".{path.name}.part")
+
+
+def _lock(file):
+    """
+    Try to take an exclusive lock on an open file, so two processes never
+    write to the same partial download. Returns True if we got it.
+
+    """
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+class _Interrupted(Exception):
+    """
+    A download that stopped early and may be resumed.
+
+    """
+
+
+def _content_range(response):
+    """
+    Return the first byte and total size reported in the ``Content-Range``
+    header of a partial response (the total may be ``None``).
+
+    """
+    unit, _, spec = response.headers.get("Content-Range", "").partition(" ")
+    byte_range, _, total = spec.partition("/")
+    first = byte_range.partition("-")[0]
+    if unit != "bytes" or not first.isdigit():
+        return None, None
+    return int(first), int(total) if total.isdigit() else None
+
+
+def _fetch(session, url, params, file, digest, key, show_progress, name):
+    """
+    Request the rest of a partial download and append it to ``file``.
+
+    Returns the expected size of the complete file (or 0 if unknown) and
+    the digest of its contents so far.
+
+    """
+    offset = file.seek(0, os.SEEK_END)
+    headers = {"Accept-Encoding": "identity"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    try:
+        with session.get(url, params=params, headers=headers, stream=True) as r:
+            if r.status_code == 416 and offset:
+                # We can't resume this one; start over
+                file.truncate(0)
+                raise _Interrupted("The server rejected the requested range.")
+            elif r.status_code > 206:
+                get_logger().debug(
+                    f"Download of {name} failed with status {r.status_code}."
+                )
+                raise exceptions.ZenodoDownloadError()
+            elif r.status_code == 206:
+                first, total = _content_range(r)
+                if first != offset:
+                    file.truncate(0)
+                    raise _Interrupted("The server sent the wrong range.")
+                total = total or 0
+            else:
+                # The server sent the whole file
+                if offset:
+                    get_logger().debug(
+                        f"Server doesn't support resuming {name}; starting over."
+                    )
+                    file.seek(0)
+                    file.truncate(0)
+                    offset = 0
+                    if digest is not None:
+                        digest = hashlib.new(digest.name)
+                total = int(r.headers.get("Content-Length", 0) or 0)
+            if show_progress:
+                progress.start(key, total)
+                progress.update(key, offset)
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                file.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                if show_progress:
+                    progress.update(key, len(chunk))
+            size = file.tell()
+            if total and size != total and "Content-Encoding" not in r.headers:
+                raise _Interrupted(f"Got {size} out of {total} bytes.")
+    except requests.exceptions.RequestException as e:
+        raise _Interrupted(str(e))
+    return total, digest
+
+
+def download(url, path, params=None, show_progress=True, session=None, checksum=None):
+    """
+    Stream a remote file to disk, resuming where we left off if a previous
+    download of it was interrupted.
+
+    The file is written to a partial download next to it (see ``part_path``)
+    and only renamed to ``path`` once it has been downloaded in full and its
+    size (and ``checksum``, if given) verified, so an interrupted or corrupted
+    download never leaves a bad file behind. If the connection drops, the
+    download is resumed with an HTTP range request (up to ``max_retries``
+    times); the partial download is also kept if we give up, so the next
+    attempt only needs the missing bytes.
+
+    Args:
+        url (str): The URL of the file.
+        path (str or Path): The destination on disk.
+        params (dict, optional): Query parameters for the request.
+        show_progress (bool, optional): Show the transfer in the progress
+            display. Default ``True``.
+        session (requests.Session, optional): The session to use. Defaults to
+            the process-wide session.
+        checksum (str, optional): The expected checksum of the file, as
+            ``algorithm:digest`` (e.g., ``md5:...``).
+
+    Returns:
+        int: The size of the file in bytes.
+    """
+    logger = get_logger()
+    session = session or get_session()
+    settings = getattr(session, "settings", None) or get_settings()
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    key = object()
+    start = time.monotonic()
+    if checksum:
+        algorithm, expected = parse_checksum(checksum)
+    part = part_path(path)
+    file = open(part, "ab+")
+    if not _lock(file):
+        # Someone else is downloading the same file; don't get in their way
+        file.close()
+        fd, tmp = tempfile.mkstemp(
+            prefix=f".{path.name}.", suffix=".part", dir=path.parent
+        )
+        file = os.fdopen(fd, "wb+")
+        part = Path(tmp)
+    keep = part == part_path(path)
+    try:
+        with file:
+            offset = file.seek(0, os.SEEK_END)
+            if offset:
+                logger.debug(f"Resuming download of {path.name} at byte {offset}.")
+            digest = None
+            if checksum:
+                digest = hashlib.new(algorithm)
+                file.seek(0)
+                for chunk in iter(lambda: file.read(chunk_size), b""):
+                    digest.update(chunk)
+            attempts = int(settings["max_retries"]) + 1
+            for attempt in range(attempts):
+                try:
+                    total, digest = _fetch(
+                        session,
+                        url,
+                        params,
+                        file,
+                        digest,
+                        key,
+                        show_progress,
+                        path.name,
+                    )
+                    break
+                except _Interrupted as e:
+                    logger.debug(f"Download of {path.name} interrupted: {e}")
+                    if attempt == attempts - 1:
+                        raise exceptions.ZenodoDownloadError()
+                    time.sleep(
+                        min(
+                            settings["backoff_factor"] * 2**attempt,
+                            settings["max_backoff"],
+                        )
+                    )
+                    if checksum and not file.seek(0, os.SEEK_END):
+                        # We're starting over
+                        digest = hashlib.new(algorithm)
+            size = file.tell()
+        if digest is not None and digest.hexdigest() != expected:
+            logger.debug(
+                f"Checksum mismatch for {path.name}: expected {expected}, "
+                f"got {digest.hexdigest()}."
+            )
+            keep = False
+            raise exceptions.ZenodoDownloadError()
+        os.replace(part, path)
+    except BaseException:
+        if part.exists() and (not keep or not part.stat().st_size):
+            part.unlink()
+        raise
+    finally:
+        if show_progress:
+            progress.finish(key)
+    _log_throughput("Downloaded", path, size, time.monotonic() - start)
+    return size
+
+
+class _ProgressStream:
+    """
+    A wrapper for streams of unknown length (see ``upload``) that reports
+    the bytes read to ``progress`` and keeps track of their size and MD5
+    digest.
+
+    """
+
+    def __init__(self, stream, key, show_progress=True):
+        self.stream = stream
+        self.key = key
+        self.show_progress = show_progress
+        self.digest = hashlib.md5()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        if self.show_progress:
+            progress.update(self.key, len(data))
+        return data
+
+    def __iter__(self):
+        return iter(lambda: self.read(chunk_size), b"")
+
+    def tell(self):
+        return self.stream.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        position = self.stream.seek(offset, whence)
+        if position == 0:
+            # We're restarting the upload
+            self.digest = hashlib.md5()
+            self.size = 0
+            if self.show_progress:
+                progress.start(self.key, 0)
+        return position
+
+
+class _ResponseReader:
+    """
+    A read-only file object over the body of a streamed response, which
+    keeps track of its size and digest.
+
+    """
+
+    def __init__(self, response, digest, key, show_progress=True):
+        self._chunks = response.iter_content(chunk_size=chunk_size)
+        self._buffer = b""
+        self.digest = digest
+        self.key = key
+        self.show_progress = show_progress
+        self.size = 0
+
+    def read(self, size=-1):
+        chunks = []
+        while size is None or size < 0 or size > 0:
+            if not self._buffer:
+                self._buffer = next(self._chunks, b"")
+                if not self._buffer:
+                    break
+                self.size += len(self._buffer)
+                if self.digest is not None:
+                    self.digest.update(self._buffer)
+                if self.show_progress:
+                    progress.update(self.key, len(self._buffer))
+            n = len(self._buffer) if size is None or size < 0 else size
+            chunks.append(self._buffer[:n])
+            self._buffer = self._buffer[n:]
+            if size is not None and size > 0:
+                size -= len(chunks[-1])
+        return b"".join(chunks)
+
+    def drain(self):
+        """
+        Read (and discard) whatever is left of the body.
+
+        """
+        while self.read(chunk_size):
+            pass
+
+
+def stream(url, consume, params=None, show_progress=True, session=None, checksum=None):
+    """
+    Stream a remote file into ``consume`` without writing it to disk.
+
+    ``consume`` is called with a read-only file object over the body of the
+    response. The size (and ``checksum``, if given) of the file is verified
+    once it returns, so it should not make the result of reading the file
+    visible until ``stream`` has returned. If the connection drops, the
+    request is repeated (up to ``max_retries`` times) and ``consume`` is
+    called again, so it must be safe to call repeatedly.
+
+    Args:
+        url (str): The URL of the file.
+        consume (callable): Called with the file object.
+        params (dict, optional): Query parameters for the request.
+        show_progress (bool, optional): Show the transfer in the progress
+            display. Default ``True``.
+        session (requests.Session, optional): The session to use. Defaults to
+            the process-wide session.
+        checksum (str, optional): The expected checksum of the file, as
+            ``algorithm:digest`` (e.g., ``md5:...``).
+
+    Returns:
+        int: The size of the file in bytes.
+    """
+    logger = get_logger()
+    session = session or get_session()
+    settings = getattr(session, "settings", None) or get_settings()
+    name = url.rstrip("/").rsplit("/", 1)[-1]
+    key = object()
+    start = time.monotonic()
+    if checksum:
+        algorithm, expected = parse_checksum(checksum)
+    attempts = int(settings["max_retries"]) + 1
+    try:
+        for attempt in range(attempts):
+            digest = hashlib.new(algorithm) if checksum else None
+            try:
+                with session.get(
+                    url,
+                    params=params,
+                    headers={"Accept-Encoding": "identity"},
+                    stream=True,
+                ) as r:
+                    if r.status_code > 204:
+                        logger.debug(
+                            f"Download of {name} failed with status {r.status_code}."
+                        )
+                        raise exceptions.ZenodoDownloadError()
+                    total = int(r.headers.get("Content-Length", 0) or 0)
+                    if show_progress:
+                        progress.start(key, total)
+                    reader = _ResponseReader(r, digest, key, show_progress)
+                    try:
+                        consume(reader)
+                    except exceptions.ShowyourworkException:
+                        raise
+                    except requests.exceptions.RequestException:
+                        raise
+                    except Exception as e:
+                        if total and reader.size < total:
+                            # The body was cut short
+                            raise _Interrupted(str(e))
+                        raise
+                    reader.drain()
+                    if total and reader.size != total:
+                        raise _Interrupted(f"Got {reader.size} out of {total} bytes.")
+                break
+            except (requests.exceptions.RequestException, _Interrupted) as e:
+                logger.debug(f"Download of {name} interrupted: {e}")
+                if attempt == attempts - 1:
+                    raise exceptions.ZenodoDownloadError()
+                time.sleep(
+                    min(
+                        settings["backoff_factor"] * 2**attempt,
+                        settings["max_backoff"],
+                    )
+                )
+    finally:
+        if show_progress:
+            progress.finish(key)
+    if digest is not None and digest.hexdigest() != expected:
+        logger.debug(
+            f"Checksum mismatch for {name}: expected {expected}, "
+            f"got {digest.hexdigest()}."
+        )
+        raise exceptions.ZenodoDownloadError()
+    _log_throughput("Downloaded", name, reader.size, time.monotonic() - start)
+    return reader.size
+
+
+#: Statuses with which servers reject request bodies sent in chunks
+chunked_rejected = (400, 411)
+
+
+def _put(session, url, params, body, name, size=None):
+    headers = {"Content-Type": "application/octet-stream"}
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    try:
+        return session.put(url, params=params, data=body, headers=headers)
+    except requests.exceptions.RequestException as e:
+        get_logger().debug(f"Upload of {name} failed: {e}")
+        raise exceptions.ZenodoUploadError()
+
+
+def _verify_upload(session, url, params, r, name, body):
+    """
+    Compare the size and checksum the remote reports for an upload (if it
+    reports any) to those of the bytes we sent, and remove the upload if
+    they differ.
+
+    """
+    try:
+        info = r.json()
+    except Exception:
+        info = None
+    if not isinstance(info, dict):
+        return
+    problems = []
+    if info.get("size") is not None and int(info["size"]) != body.size:
+        problems.append(f"sent {body.size} bytes, but got {info['size']}")
+    if info.get("checksum"):
+        algorithm, digest = parse_checksum(info["checksum"])
+        if algorithm == "md5" and digest != body.digest.hexdigest():
+            problems.append(
+                f"sent checksum {body.digest.hexdigest()}, but got {digest}"
+            )
+    if problems:
+        logger = get_logger()
+        logger.debug(f"Upload of {name} is corrupt: {'; '.join(problems)}.")
+        try:
+            session.delete(url, params=params)
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"Unable to remove the corrupt upload of {name}: {e}")
+        raise exceptions.ZenodoUploadError()
+
+
+def upload(url, path, params=None, show_progress=True, session=None):
+    """
+    Stream a file on disk to a remote with a ``PUT`` request.
+
+    If the response reports the size and checksum of what the remote
+    received, they are checked against those of the bytes that were sent.
+
+    Args:
+        url (str): The destination URL.
+        path (str, Path or file object): The file to upload. This may also be
+            a readable stream of unknown length that can be rewound to the
+            start (such as an ``archives.TarballStream``), which is then
+            sent in chunks. If the remote rejects chunked bodies, the stream
+            is spooled to a temporary file and sent again.
+        params (dict, optional): Query parameters for the request.
+        show_progress (bool, optional): Show the transfer in the progress
+            display. Default ``True``.
+        session (requests.Session, optional): The session to use. Defaults to
+            the process-wide session.
+
+    Returns:
+        requests.Response: The response to the request.
+    """
+    logger = get_logger()
+    session = session or get_session()
+    key = object()
+    start = time.monotonic()
+    try:
+        if hasattr(path, "read"):
+            name = Path(getattr(path, "path", "stream")).name
+            if show_progress:
+                progress.start(key, 0)
+            body = _ProgressStream(path, key, show_progress)
+            r = _put(session, url, params, body, name)
+            if r.status_code in chunked_rejected:
+                logger.debug(
+                    f"Chunked upload of {name} rejected with status "
+                    f"{r.status_code}; retrying with a known length."
+                )
+                with tempfile.TemporaryFile() as spool:
+                    path.seek(0)
+                    for chunk in iter(lambda: path.read(chunk_size), b""):
+                        spool.write(chunk)
+                    size = spool.tell()
+                    spool.seek(0)
+                    if show_progress:
+                        progress.start(key, size)
+                    body = _ProgressReader(spool, key, show_progress)
+                    r = _put(session, url, params, body, name, size)
+        else:
+            path = Path(path)
+            name = path.name
+            size = path.stat().st_size
+            with open(path, "rb") as f:
+                if show_progress:
+                    progress.start(key, size)
+                body = _ProgressReader(f, key, show_progress)
+                r = _put(session, url, params, body, name, size)
+    finally:
+        if show_progress:
+            progress.finish(key)
+    if r.status_code > 204:
+        logger.debug(f"Upload of {name} failed with status {r.status_code}.")
+        try:
+            logger.debug(r.json()["message"])
+        except Exception:
+            pass
+        raise exceptions.ZenodoUploadError()
+    _verify_upload(session, url, params, r, name, body)
+    _log_throughput("Uploaded", name, body.size, time.monotonic() - start)
+    return r
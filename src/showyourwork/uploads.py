@@ -0,0 +1,178 @@
+"""
+Background queue for uploads to the remote cache.
+
+"""
+
+import atexit
+import queue
+import threading
+
+from . import exceptions
+from .logging import get_logger
+from .session import get_settings
+
+#: Maximum number of uploads waiting for a worker before ``submit`` blocks
+max_pending = 64
+
+# The process-wide queue
+_queue = None
+_queue_lock = threading.Lock()
+
+
+class UploadQueue:
+    """
+    Uploads files to Zenodo deposits on a pool of background threads.
+
+    Uploads are coalesced per deposit and rule name: if a newer file for the
+    same rule is submitted before the previous one is picked up by a worker,
+    only the newer one is uploaded.
+
+    Args:
+        workers (int): The number of worker threads.
+
+    """
+
+    def __init__(self, workers):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.uploaded = []
+        self.skipped = []
+        self.failed = []
+        self._workers = [
+            threading.Thread(target=self._work, name=f"syw-upload-{n}", daemon=True)
+            for n in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, deposit, file, rule_name, tarball=False, label=None):
+        """
+        Queue a file for upload to a deposit.
+
+        Args:
+            deposit (Zenodo): The deposit to upload to.
+            file (Path): The file to upload.
+            rule_name (str): The name of the rule that produced the file.
+            tarball (bool, optional): Whether ``file`` is a directory that
+                should be uploaded as a tarball. Default ``False``.
+            label (str, optional): How to refer to the file in messages.
+                Defaults to ``file``.
+
+        """
+        key = (deposit.doi, rule_name)
+        task = (deposit, file, rule_name, tarball, label or str(file))
+        with self._lock:
+            superseded = self._pending.get(key, None)
+            self._pending[key] = task
+        if superseded is None:
+            self._queue.put(key)
+        else:
+            get_logger().debug(
+                f"Upload of {superseded[4]} superseded by a newer file "
+                f"for rule {rule_name}."
+            )
+            with self._lock:
+                self.skipped.append(superseded[4])
+
+    def _work(self):
+        while True:
+            key = self._queue.get()
+            with self._lock:
+                task = self._pending.pop(key)
+            try:
+                self._upload(*task)
+            finally:
+                self._queue.task_done()
+
+    def _upload(self, deposit, file, rule_name, tarball, label):
+        logger = get_logger()
+        try:
+            uploaded = deposit.upload_file(file, rule_name, tarball=tarball)
+        except Exception as e:
+            # NOTE: we treat all Zenodo caching errors as non-fatal
+            exceptions.restore_trace()
+            logger.warning(
+                f"Failed to upload {label} to {deposit.service} cache. "
+                "See logs for details."
+            )
+            if len(str(e)):
+                logger.debug(str(e))
+            result = self.failed
+        else:
+            if uploaded:
+                logger.debug(f"Uploaded {label} to {deposit.service} cache.")
+                result = self.uploaded
+            elif uploaded is None:
+                result = self.failed
+            else:
+                logger.debug(f"{deposit.service} cache for {label} is up to date.")
+                result = self.skipped
+        with self._lock:
+            result.append(label)
+
+    @property
+    def busy(self):
+        """
+        Whether there are uploads queued or in progress.
+
+        """
+        return self._queue.unfinished_tasks > 0
+
+    def flush(self):
+        """
+        Wait for all queued uploads to finish.
+
+        Returns:
+            str: A one-line summary of the uploads.
+        """
+        self._queue.join()
+        with self._lock:
+            return (
+                f"{len(self.uploaded)} uploaded, {len(self.skipped)} skipped, "
+                f"{len(self.failed)} failed"
+            )
+
+
+def get_upload_queue():
+    """
+    Return the process-wide upload queue, creating it if needed.
+
+    """
+    global _queue  # noqa
+    with _queue_lock:
+        if _queue is None:
+            _queue = UploadQueue(max(1, int(get_settings()["max_transfers"])))
+            # The workers are daemon threads, so make sure we don't exit
+            # (and drop their uploads) before they're done
+            atexit.register(_flush_at_exit)
+        return _queue
+
+
+def flush_uploads():
+    """
+    Wait for all queued uploads to finish and log a summary.
+
+    Does nothing if no uploads were ever queued.
+
+    """
+    with _queue_lock:
+        upload_queue = _queue
+    if upload_queue is None:
+        return
+    logger = get_logger()
+    logger.info("Waiting for uploads to the remote cache to finish...")
+    summary = upload_queue.flush()
+    logger.info(f"Remote cache uploads: {summary}.")
+    if upload_queue.failed:
+        logger.warning(
+            "Failed to upload the following files to the remote cache: "
+            + ", ".join(upload_queue.failed)
+        )
+
+
+def _flush_at_exit():
+    with _queue_lock:
+        upload_queue = _queue
+    if upload_queue is not None and upload_queue.busy:
+        flush_uploads()
@@ -1,6 +1,5 @@
 from . import exceptions
 from .config import get_run_type
-from .git import get_repo_branch
 from .logging import get_logger
 from .patches import patch_snakemake_cache
 
@@ -26,7 +25,7 @@ def process_user_rules():
 
     # Patch the Snakemake caching functionality so we
     # can cache things on Zenodo
-    branch = get_repo_branch()
+    branch = snakemake.workflow.config["git_branch"]
     cache_zenodo_doi = snakemake.workflow.config["cache"][branch]["zenodo"]
     cache_sandbox_doi = snakemake.workflow.config["cache"][branch]["sandbox"]
     cached_deps = []
@@ -7,7 +7,9 @@ from showyourwork.patches import patch_snakemake_wait_for_files, patch_snakemake
 from showyourwork.config import parse_config, get_run_type
 from showyourwork.logging import get_logger
 from showyourwork.userrules import process_user_rules
-from showyourwork.git import get_repo_branch
+from showyourwork.git import get_call_count
+from showyourwork.session import get_session
+from showyourwork.uploads import flush_uploads
 import snakemake
 
 
@@ -96,10 +98,35 @@ else:
 onsuccess:
 
 
+    # Wait for uploads to the remote cache
+    flush_uploads()
+
+
     # Overleaf sync: push changes
-    if run_type == "build" and get_repo_branch() == "main":
+    if run_type == "build" and config["git_branch"] == "main":
         overleaf.push_files(config["overleaf"]["push"], config["overleaf"]["id"])
 
 
+    # Keep track of how often we had to shell out to git
+    get_logger().debug(f"Spawned {get_call_count()} git subprocess(es) in this run.")
+
+
+    # Zenodo API usage
+    if get_session().stats.requests:
+        get_logger().debug(f"Zenodo API usage: {get_session().stats.summary()}")
+
+
     # We're done
     get_logger().info("Done!")
+
+
+onerror:
+
+
+    # Wait for uploads to the remote cache
+    flush_uploads()
+
+
+    # Zenodo API usage
+    if get_session().stats.requests:
+        get_logger().debug(f"Zenodo API usage: {get_session().stats.summary()}")
@@ -16,7 +16,6 @@ rule:
     input:
         temporary_tex_files(),
         (paths.user().compile / f'{config["ms_name"]}.pdf').as_posix(),
-        compile_dir=paths.user().compile.as_posix()
     output:
         "arxiv.tar.gz",
     script:
@@ -2,12 +2,12 @@ from pathlib import Path
 from showyourwork import paths
 
 def temporary_tex_files(root=paths.user().compile):
+    # The stylesheet and its metadata file aren't listed here: Snakemake
+    # deletes the outputs of a job before running it, and ``compile_setup``
+    # only rewrites them when their contents change
     files = [
         Path(config["ms_tex"]).relative_to(
             paths.user().tex.relative_to(paths.user().repo)
         ),
-        config["stylesheet"],
     ] + [Path(f).name for f in config["tex_files_in"]]
-    if root == paths.user().compile:
-        files.append(config["stylesheet_meta_file"])
     return [(root / f).as_posix() for f in files]
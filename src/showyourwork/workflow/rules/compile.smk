@@ -12,6 +12,13 @@ tectonic_yml = paths.user().repo / "tectonic.yml"
 if not tectonic_yml.exists():
     tectonic_yml = paths.showyourwork().envs / "tectonic.yml"
 
+# Compile in a single pass first if the cross-references from the last build
+# can be reused, unless the user sets the number of passes themselves
+warm_start = config["tectonic_warm_start"] and not any(
+    arg in ("-r", "--reruns") or arg.startswith("--reruns=")
+    for arg in config["user_args"]
+)
+
 rule:
     """
     Setup the temporary files for compilation.
@@ -32,8 +39,8 @@ rule:
         stylesheet=(paths.showyourwork().resources / "styles" / "build.tex").as_posix()
     output:
         temporary_tex_files(),
-        compile_dir=directory(paths.user().compile.as_posix()),
     params:
+        compile_dir=paths.user().compile.as_posix(),
         metadata=True
     script:
         "../scripts/compile_setup.py"
@@ -54,25 +61,30 @@ rule:
         WORKFLOW_GRAPH,
         "showyourwork.yml",
         "zenodo.yml" if (paths.user().repo / "zenodo.yml").exists() else [],
-        compile_dir=paths.user().compile.as_posix()
     output:
         (paths.user().compile / f'{config["ms_name"]}.pdf').as_posix(),
         (paths.user().compile / f'{config["ms_name"]}.synctex.gz').as_posix() if config["synctex"] else [],
     conda:
         tectonic_yml.as_posix()
     params:
+        compile_dir=paths.user().compile.as_posix(),
         maybe_synctex="--synctex" if config["synctex"] else "",
-        user_args=" ".join(config["user_args"])
+        user_args=" ".join(config["user_args"]),
+        warm_start="true" if warm_start else "false",
+        xref_state=".showyourwork-xref",
+        script=(paths.showyourwork().workflow / "scripts" / "tectonic.sh").as_posix()
     shell:
         """
-        cd "{input.compile_dir}"
-        tectonic                      \\
-            --chatter minimal         \\
-            --keep-logs               \\
-            --keep-intermediates      \\
-            {params.maybe_synctex}    \\
-            {params.user_args}        \\
-            "{input[0]}"
+        cd "{params.compile_dir}"
+        bash "{params.script}"            \\
+            "{params.xref_state}"         \\
+            "{params.warm_start}"         \\
+            "{input[0]}"                  \\
+            --chatter minimal             \\
+            --keep-logs                   \\
+            --keep-intermediates          \\
+            {params.maybe_synctex}        \\
+            {params.user_args}
         """
 
 # TODO: Add config options for verbosity?
@@ -7,13 +7,18 @@ itself.
 
 """
 from showyourwork import paths, logging
-from showyourwork.config import get_upstream_dependencies
-from showyourwork.patches import get_snakemake_variable, patch_snakemake_cache_optimization
+from showyourwork.config import UpstreamDependencies
+from showyourwork.patches import (
+    get_snakemake_variable,
+    patch_snakemake_cache_optimization,
+    prefetch_remote_cache,
+)
 from showyourwork.zenodo import get_dataset_urls
 import snakemake
 import os
 import re
 from collections import defaultdict
+from functools import lru_cache
 
 
 def infer_additional_figure_dependencies():
@@ -59,7 +64,7 @@ def infer_additional_figure_dependencies():
 
         # Add those datasets back to the config
         datasets = list(
-            set(datasets) | set(get_dataset_urls(upstream, config["datasets"]))
+            set(datasets) | set(get_dataset_urls(upstream, config["dataset_index"]))
         )
         config["tree"]["figures"][label]["datasets"] = datasets
 
@@ -110,19 +115,38 @@ def add_dag_metadata_to_config(dag):
         dependencies[key] = list(dependencies[key])
     dependencies = dict(dependencies)
 
-    # Find recursive input-output dependencies
+    # Find recursive input-output dependencies. We only keep them for the
+    # files figures depend on, since that's all we need downstream, and
+    # storing them for every file grows quadratically with the DAG
+    config = snakemake.workflow.config
+    upstream = UpstreamDependencies(dependencies)
     recursive_dependencies = {}
-    for output in dependencies.keys():
-        recursive_dependencies[output] = get_upstream_dependencies(
-            output, dependencies
-        )
+    for value in config["tree"]["figures"].values():
+        for dep in value["dependencies"]:
+            if dep in dependencies and dep not in recursive_dependencies:
+                recursive_dependencies[dep] = sorted(upstream.upstream(dep))
 
     # Add to the global config
-    config = snakemake.workflow.config
     config["dag_dependencies"] = dependencies
     config["dag_dependencies_recursive"] = recursive_dependencies
 
 
+@lru_cache(maxsize=None)
+def get_rule_line_numbers(snakefile):
+    """
+    Return a mapping of rule name to the line number where the rule is
+    defined in a Snakefile. Each Snakefile is only read once.
+
+    """
+    line_numbers = {}
+    with open(snakefile, "r") as f:
+        for n, line in enumerate(f):
+            match = re.match(r"\s*rule\s*(\w+)\s*:", line)
+            if match:
+                line_numbers.setdefault(match.group(1), n + 1)
+    return line_numbers
+
+
 def infer_variable_provenance(dag):
     """
     Try to infer the Snakefiles and line numbers where the rules generating
@@ -134,25 +158,34 @@ def infer_variable_provenance(dag):
 
     # Gather \variable provenance info so we can access it on the TeX side
     config["variables"] = {}
+    if not config["tree"]["files"]:
+        return
+
+    # Index the jobs by the files they generate
+    producers = {}
+    for job in dag.jobs:
+        for output in job.output:
+            producers[Path(str(output)).resolve()] = job
 
     # Loop over all files defined in \variable commands
     for file in config["tree"]["files"]:
         file = Path(file).resolve()
-        for job in dag.jobs:
-            # Find the job (and rule) that generates `file`
-            if file in [Path(str(file)).resolve() for file in job.output]:
-                # Get the path to the Snakefile that defines that rule
-                rulepath = str(Path(job.rule.snakefile).relative_to(paths.user().repo))
-                # Try to find the line number; if we can't, simply link to the
-                # Snakefile, without line number highlighting
-                with open(job.rule.snakefile, "r") as f:
-                    for n, line in enumerate(f.readlines()):
-                        if re.match(rf"\s*rule\s*{job.rule.name}:", line):
-                            rulepath += rf"\#L{n+1}"
-                            break
-                pre = Path(os.path.commonprefix([file, paths.user().tex]))
-                filename = str(file.relative_to(pre))
-                config["variables"][f"{filename}_rule"] = rulepath
+        job = producers.get(file, None)
+        if job is None:
+            continue
+
+        # Get the path to the Snakefile that defines the rule generating `file`
+        rulepath = str(Path(job.rule.snakefile).relative_to(paths.user().repo))
+
+        # Try to find the line number; if we can't, simply link to the
+        # Snakefile, without line number highlighting. Note that we can't use
+        # `job.rule.lineno`, which refers to the compiled Snakefile
+        line_number = get_rule_line_numbers(job.rule.snakefile).get(job.rule.name)
+        if line_number is not None:
+            rulepath += rf"\#L{line_number}"
+        pre = Path(os.path.commonprefix([file, paths.user().tex]))
+        filename = str(file.relative_to(pre))
+        config["variables"][f"{filename}_rule"] = rulepath
 
 
 def WORKFLOW_GRAPH(*args):
@@ -196,6 +229,9 @@ def WORKFLOW_GRAPH(*args):
             logger.debug("Optimizing jobs upstream of cache hits...")
             patch_snakemake_cache_optimization(dag)
 
+        # Start downloading the remote cache files we'll need
+        prefetch_remote_cache(dag)
+
     # Dummy output
     return []
 
@@ -6,7 +6,8 @@ Runs the script :doc:`preprocess` to generate the ``.showyourwork/config.json``
 file containing metadata about the build and the workflow graph.
 
 """
-from showyourwork import paths
+from showyourwork import paths, texscan
+from showyourwork.logging import get_logger
 
 
 # Allow user to define their own tectonic.yml file in their repo:
@@ -14,6 +15,17 @@ tectonic_yml = paths.user().repo / "tectonic.yml"
 if not tectonic_yml.exists():
     tectonic_yml = paths.showyourwork().envs / "tectonic.yml"
 
+
+# Scan the manuscript ourselves if we can, instead of compiling it
+scanned_tex_files = None
+if config["preprocess_engine"] == "python":
+    try:
+        _, scanned_tex_files = texscan.scan(config["ms_tex"])
+    except (texscan.UnsupportedTeX, OSError) as e:
+        get_logger().info(
+            f"Preprocess: Unable to scan the manuscript ({e}); compiling it instead."
+        )
+
 rule:
     """
     Setup the temporary files for compilation.
@@ -31,8 +43,8 @@ rule:
         stylesheet=(paths.showyourwork().resources / "styles" / "preprocess.tex").as_posix()
     output:
         temporary_tex_files(root=paths.user().preprocess),
-        compile_dir=directory(paths.user().preprocess.as_posix()),
     params:
+        compile_dir=paths.user().preprocess.as_posix(),
         metadata=False
     script:
         "../scripts/compile_setup.py"
@@ -49,16 +61,16 @@ rule:
     input:
         temporary_tex_files(root=paths.user().preprocess),
         "showyourwork.yml",
-        compile_dir=paths.user().preprocess.as_posix()
     output:
         (paths.user().preprocess / "showyourwork.xml").as_posix()
     conda:
         tectonic_yml.as_posix()
     params:
+        compile_dir=paths.user().preprocess.as_posix(),
         user_args=" ".join(config["user_args"])
     shell:
         """
-        cd "{input.compile_dir}"
+        cd "{params.compile_dir}"
         tectonic                      \\
             --chatter minimal         \\
             --keep-logs               \\
@@ -91,8 +103,14 @@ rule:
     message:
         "Preprocess: Setting up the workflow..."
     input:
-        (paths.user().preprocess / "showyourwork.xml").as_posix()
+        (
+            [file.as_posix() for file in scanned_tex_files] + ["showyourwork.yml"]
+            if scanned_tex_files is not None
+            else (paths.user().preprocess / "showyourwork.xml").as_posix()
+        )
     output:
         config["config_json"],
+    params:
+        scanned=scanned_tex_files is not None
     script:
         "../scripts/preprocess.py"
@@ -1,7 +1,7 @@
 """
 Defines the rules ``syw__downloadX`` and ``syw__extractX`` to download
 and tar-extract files from Zenodo deposits, where ``X`` is the number of
-the file.
+the deposit (for downloads) or of the archive (for extractions).
 
 Runs the scripts :doc:`download` and :doc:`extract`.
 
@@ -19,13 +19,13 @@ for doi, entry in config["datasets"].items():
     zip_files = entry["zip_files"]
 
 
-    # Rules to download files individually
-    for remote_file, local_file in contents.items():
+    # Rule to download all the files we need from the deposit at once
+    if contents:
         rulename = f"syw__download{dnum}"
         dnum += 1
         rule:
             """
-            Download a Zenodo-hosted file.
+            Download Zenodo-hosted files.
 
             """
             name:
@@ -33,10 +33,13 @@ for doi, entry in config["datasets"].items():
             message:
                 "Downloading {output} from Zenodo..."
             output:
-                report(local_file, category="Dataset")
+                [
+                    report(local_file, category="Dataset")
+                    for local_file in contents.values()
+                ]
             params:
                 doi=doi,
-                remote_file=remote_file
+                files=contents
             script:
                 "../scripts/download.py"
 
@@ -49,24 +52,28 @@ for doi, entry in config["datasets"].items():
         local_zip_file = contents[zip_file]
 
 
-        # Rules to extract files individually
-        for compressed_file, extracted_file in zip_contents.items():
-            rulename = f"syw__extract{xnum}"
-            xnum += 1
-            rule:
-                """
-                Extract a dataset from a zip file or tarball downloaded from Zenodo.
-
-                """
-                name:
-                    rulename
-                message:
-                    "Extracting {output}..."
-                input:
-                    local_zip_file
-                output:
+        # Rule to extract all the files we need from the archive at once
+        rulename = f"syw__extract{xnum}"
+        xnum += 1
+        rule:
+            """
+            Extract datasets from a zip file or tarball downloaded from Zenodo.
+
+            """
+            name:
+                rulename
+            message:
+                "Extracting {output}..."
+            input:
+                local_zip_file
+            output:
+                [
                     report(extracted_file, category="Dataset")
-                params:
-                    compressed_file=compressed_file
-                script:
-                    "../scripts/extract.py"
+                    for extracted_file in zip_contents.values()
+                ]
+            params:
+                doi=doi,
+                archive=zip_file,
+                members=zip_contents
+            script:
+                "../scripts/extract.py"
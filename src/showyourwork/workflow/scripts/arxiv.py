@@ -12,6 +12,7 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 
 from showyourwork import paths
+from showyourwork.mirror import MANIFEST
 
 if __name__ == "__main__":
     # Snakemake config (available automagically)
@@ -29,6 +30,9 @@ if __name__ == "__main__":
         f"{ms_name}.fls",
         f"{ms_name}.synctex.gz",
         f"{ms_name}.fdb_latexmk",
+        # Build bookkeeping
+        MANIFEST,
+        ".showyourwork-xref",
     ]
 
     with TemporaryDirectory() as tmpdir:
@@ -9,16 +9,21 @@ from pathlib import Path
 from jinja2 import BaseLoader, Environment
 
 from showyourwork import paths
+from showyourwork.mirror import mirror_directory, update_file
 
 if __name__ == "__main__":
     # Snakemake config (available automagically)
     config = snakemake.config  # type:ignore
 
-    # Create the compile directory
-    compile_dir = Path(snakemake.output.compile_dir)
+    # The compile directory
+    compile_dir = Path(snakemake.params.compile_dir)
 
-    # Copy over the source files
-    shutil.copytree(paths.user().tex, compile_dir, dirs_exist_ok=True)
+    # Sync the source files, leaving alone those that haven't changed and
+    # the files generated below
+    generated = [config["stylesheet"]]
+    if snakemake.params.metadata:
+        generated.append(config["stylesheet_meta_file"])
+    mirror_directory(paths.user().tex, compile_dir, exclude=generated)
 
     if snakemake.params.metadata:
         # Metadata file jinja template
@@ -95,13 +100,12 @@ if __name__ == "__main__":
 
         # Generate the stylesheet metadata file
         p = compile_dir / config["stylesheet_meta_file"]
-        with open(p, "w") as f:
-            meta = ENV.from_string(TEMPLATE).render(**config)
-            print(meta, file=f)
+        meta = ENV.from_string(TEMPLATE).render(**config)
+        update_file(p, f"{meta}\n".encode())
 
     # Copy over stylesheet
     p = compile_dir / config["stylesheet"]
-    shutil.copy(snakemake.input.stylesheet, p)
+    update_file(p, Path(snakemake.input.stylesheet).read_bytes())
 
     # Copy over TeX auxiliaries
     for file in config["tex_files_in"]:
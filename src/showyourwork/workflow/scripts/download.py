@@ -1,13 +1,9 @@
 """
-Downloads a publically available file from a Zenodo or Zenodo Sandbox record.
+Downloads publically available files from a Zenodo or Zenodo Sandbox record.
 
 """
 
-import subprocess
-
-from showyourwork import exceptions
-from showyourwork.logging import get_logger
-from showyourwork.zenodo import Zenodo
+from showyourwork.zenodo import get_deposit
 
 if __name__ == "__main__":
     # Snakemake config (available automagically)
@@ -15,27 +11,7 @@ if __name__ == "__main__":
 
     # Get params
     doi = snakemake.params["doi"]
-    remote_file = snakemake.params["remote_file"]
-    output = snakemake.output[0]
-
-    # Initialize the logger
-    logger = get_logger()
-
-    # Get the zenodo interface
-    deposit = Zenodo(doi)
+    files = snakemake.params["files"]
 
-    # Download it
-    progress_bar = ["--progress-bar"] if not config["github_actions"] else []
-    result = subprocess.run(
-        [
-            "curl",
-            "-f",
-            f"https://{deposit.url}/records/{deposit.deposit_id}/files/{remote_file}",
-            *progress_bar,
-            "--output",
-            output,
-        ],
-        check=False,
-    )
-    if result.returncode != 0:
-        raise exceptions.ZenodoDownloadError()
+    # Download them all (in parallel)
+    get_deposit(doi).download_files(files, show_progress=not config["github_actions"])
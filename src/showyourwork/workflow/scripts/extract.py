@@ -1,16 +1,12 @@
 """
-Extracts a single file from a tarball or zipfile.
+Extracts all the requested files from a tarball or zipfile.
 
 """
 
-import shutil
-import tarfile
-import tempfile
-from pathlib import Path
-from zipfile import ZipFile
-
-from showyourwork import exceptions
+from showyourwork.archives import extract_members
 from showyourwork.logging import get_logger
+from showyourwork.store import get_dataset_store
+from showyourwork.zenodo import get_deposit
 
 if __name__ == "__main__":
     # Snakemake config (available automagically)
@@ -19,40 +15,26 @@ if __name__ == "__main__":
     # Initialize the logger
     logger = get_logger()
 
-    # Input/output file names
-    zipfile = Path(snakemake.input[0])
-    extracted_file = Path(snakemake.output[0])
-    compressed_file = snakemake.params["compressed_file"]
-
-    # Tar balls
-    if zipfile.name.endswith(".tar") or zipfile.name.endswith(".tar.gz"):
-        # Open the tarball
-        with tarfile.open(zipfile) as f:
-            # Extract into a temp folder
-            with tempfile.TemporaryDirectory() as TEMP:
-                try:
-                    f.extract(compressed_file, TEMP)
-
-                except Exception as e:
-                    raise exceptions.TarballExtractionError(str(e))
-
-                # Move it to target destination
-                shutil.move(Path(TEMP) / compressed_file, extracted_file)
-
-    # Zip files
-    elif zipfile.name.endswith(".zip"):
-        # Open the tarball
-        with ZipFile(zipfile, "r") as f:
-            # Extract into a temp folder
-            with tempfile.TemporaryDirectory() as TEMP:
-                try:
-                    f.extract(compressed_file, TEMP)
-
-                except Exception as e:
-                    raise exceptions.TarballExtractionError(str(e))
-
-                # Move it to target destination
-                shutil.move(Path(TEMP) / compressed_file, extracted_file)
-
+    # Get params
+    doi = snakemake.params["doi"]
+    archive = snakemake.params["archive"]
+    members = snakemake.params["members"]
+
+    # The member index of the archive lives with the rest of the deposit's
+    # local state, outside the user's tree
+    deposit = get_deposit(doi)
+    index_file = deposit.archive_index_path(archive)
+
+    # Extract into the dataset store, if there is one and we know which
+    # version of the archive this is
+    store = get_dataset_store()
+    checksum = None
+    if store is not None:
+        checksum = deposit.get_record_files().get(archive, {}).get("checksum")
+    if checksum:
+        store.extract(
+            doi, archive, checksum, snakemake.input[0], members, index_file=index_file
+        )
     else:
-        raise exceptions.NotImplementedError("Unsupported archive file type.")
+        # Extract every member in a single pass over the archive
+        extract_members(snakemake.input[0], members, index_file=index_file)
@@ -14,11 +14,14 @@ import json
 import re
 from collections.abc import MutableMapping
 from pathlib import Path
-from xml.etree.ElementTree import parse as ParseXMLTree
+from xml.etree.ElementTree import XMLPullParser
 
-from showyourwork import exceptions, paths, zenodo
-from showyourwork.config import get_upstream_dependencies
-from showyourwork.zenodo import Zenodo, get_dataset_urls
+from showyourwork import exceptions, paths, texscan, zenodo
+from showyourwork.config import UpstreamDependencies
+from showyourwork.zenodo import get_dataset_urls, get_deposit
+
+# Top-level elements of the XML tree that go into the article tree
+xml_tree_tags = {"FIGURE", "GRAPHICS", "GRAPHICSPATH", "INPUT"}
 
 
 def flatten_dataset_contents(d, parent_key="", default_path=None):
@@ -79,7 +82,7 @@ def parse_datasets():
 
     for doi, entry in config["datasets"].items():
         # Parse the DOI to get the Zenodo ID
-        deposit = Zenodo(doi)
+        deposit = get_deposit(doi)
 
         # Require that this is a static *version* ID
         entry["id_type"] = deposit.get_id_type()
@@ -139,6 +142,9 @@ def parse_datasets():
 
         entry["contents"] = contents
 
+    # Index the local files provided by the datasets
+    config["dataset_index"] = zenodo.get_dataset_index(config["datasets"])
+
 
 def check_figure_format(figure):
     """
@@ -219,40 +225,60 @@ def check_figure_format(figure):
 
 
 def get_xml_tree(xmlfile):
-    """Compiles the TeX file to generate the XML tree.
+    """Loads the XML tree logged when compiling the TeX file.
+
+    The log is a sequence of elements with no root, so we wrap it in
+    ``<HTML></HTML>`` tags as we stream it into the parser. Top-level elements
+    that don't go into the article tree (labels, equations, etc. outside of
+    figures) are dropped as soon as they're parsed, so memory use doesn't grow
+    with the length of the manuscript.
 
     Returns:
-        xml.etree.ElementTree.ElementTree: The XML tree.
+        xml.etree.ElementTree.Element: The root of the XML tree.
     """
 
     xmlfile = Path(xmlfile)
-
-    # Add <HTML></HTML> tags to the XML file
-    if xmlfile.exists():
-        with open(xmlfile) as f:
-            contents = f.read()
-    else:
+    if not xmlfile.exists():
         raise exceptions.MissingXMLFile(
             r"Article parsing failed. Did you forget to `\usepackage{showyourwork}`?"
         )
 
-    contents = "<HTML>\n" + contents + "</HTML>"
-    with open(xmlfile, "w") as f:
-        print(contents, file=f)
+    parser = XMLPullParser(events=("start", "end"))
+    parser.feed(b"<HTML>")
+    depth = 0
+    root = None
+
+    def consume():
+        nonlocal depth, root
+        for event, element in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = element
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 1 and element.tag not in xml_tree_tags:
+                    root.remove(element)
 
-    # Load the XML tree
-    return ParseXMLTree(paths.user().preprocess / "showyourwork.xml").getroot()
+    with open(xmlfile, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            parser.feed(chunk)
+            consume()
+    parser.feed(b"</HTML>")
+    consume()
+    parser.close()
+    return root
 
 
-def get_json_tree(xmlfile):
+def get_json_tree(xml_tree):
     """Builds a dictionary containing mappings between input and output files.
 
+    Args:
+        xml_tree: The root of the XML article tree.
+
     Returns:
         dict: The JSON dependency tree for the article.
     """
-    # Get the XML article tree
-    xml_tree = get_xml_tree(xmlfile)
-
     # Parse the \graphicspath command
     # Note that if there are multiple graphicspath calls, only the first one
     # is read. Same for multiple directories within a graphicspath call.
@@ -266,6 +292,9 @@ def get_json_tree(xmlfile):
     except Exception:
         raise exceptions.GraphicsPathError()
 
+    # The recursive user-defined dependencies of every file
+    upstream_dependencies = UpstreamDependencies(config["dependencies"])
+
     # Parse labeled graphics inside `figure` environments
     figures = {}
     unlabeled_graphics = []
@@ -365,11 +394,11 @@ def get_json_tree(xmlfile):
 
         # Same, but recursing all the way up the graph
         # (i.e., including dependendencies of dependencies, and so forth)
-        upstream = get_upstream_dependencies(script, config["dependencies"])
+        upstream = list(upstream_dependencies.upstream(script))
 
         # If any of the upstream dependencies exist in a Zenodo deposit, infer
         # their URLs so we can add margin links to the PDF
-        datasets = get_dataset_urls(upstream, config["datasets"])
+        datasets = get_dataset_urls(upstream, config["dataset_index"])
 
         # Format the command by replacing placeholders
         if command is not None:
@@ -475,8 +504,15 @@ if __name__ == "__main__":
     # Parse the `datasets` key in the config
     parse_datasets()
 
+    # Get the XML article tree, either by scanning the manuscript
+    # or from the log of its compilation
+    if snakemake.params["scanned"]:
+        xml_tree, _ = texscan.scan(config["ms_tex"])
+    else:
+        xml_tree = get_xml_tree(snakemake.input[0])
+
     # Get the article tree
-    config["tree"] = get_json_tree(snakemake.input[0])
+    config["tree"] = get_json_tree(xml_tree)
 
     # Make all of the graphics dependencies of the article
     config["dependencies"][config["ms_tex"]] = config["dependencies"].get(
@@ -62,22 +62,12 @@ def convert_to_png(file):
         return aspect
 
 
-def get_dataset_dois(files, datasets):
+def get_dataset_dois(files, index):
     """
     Local version of this function copied from `showyourwork/zenodo.py`
 
     """
-    result = []
-    for doi in datasets:
-        for file in files:
-            if file in datasets[doi]["contents"].values():
-                result.append(doi)
-            else:
-                for zip_file in datasets[doi]["zip_files"]:
-                    if file in datasets[doi]["zip_files"][zip_file].values():
-                        result.append(doi)
-                        break
-    return list(set(result))
+    return list(set(index[file]["doi"] for file in files if file in index))
 
 
 def should_ignore(ignore, path):
@@ -212,7 +202,7 @@ if __name__ == "__main__":
             label="https://doi.org/",
         )
         # Static
-        for doi in get_dataset_dois(datasets, config["datasets"]):
+        for doi in get_dataset_dois(datasets, config["dataset_index"]):
             c.node(
                 doi,
                 URL=f"https://doi.org/{doi}",
@@ -249,7 +239,7 @@ if __name__ == "__main__":
                 style="filled",
                 fillcolor="white",
             )
-            for _url in get_dataset_dois([file], config["datasets"]):
+            for doi in get_dataset_dois([file], config["dataset_index"]):
                 c.edge(doi, file)
 
     # Script nodes
@@ -0,0 +1,53 @@
+#!/usr/bin/env bash
+#
+# Compiles the manuscript with tectonic in the current directory, reusing the
+# cross-reference state (.aux, .bbl, .toc, .lof and .lot files) left behind
+# by the previous build when it's still valid.
+#
+# Usage: tectonic.sh STATE_FILE WARM_START MS_TEX [TECTONIC_ARGS...]
+#
+# STATE_FILE holds a checksum of the cross-reference state and of the
+# bibliography sources (.bib and .bst files) at the end of the last
+# successful build. If WARM_START is "true" and nothing changed since, the
+# manuscript is compiled in a single pass, and that's it unless the pass
+# changed the state. Otherwise, tectonic runs as many passes as it needs.
+#
+set -euo pipefail
+
+state_file=$1
+warm_start=$2
+ms_tex=$3
+shift 3
+args=("$@")
+
+compile() {
+    tectonic "${args[@]}" "$@" "$ms_tex"
+}
+
+xref_state() {
+    find . -type f \( \
+        -name '*.aux' -o -name '*.bbl' -o -name '*.toc' -o -name '*.lof' \
+        -o -name '*.lot' -o -name '*.bib' -o -name '*.bst' \
+    \) | LC_ALL=C sort | while IFS= read -r file; do
+        echo "$file"
+        cat "$file"
+    done | cksum
+}
+
+# The state at the end of the last successful build
+previous=$(cat "$state_file" 2>/dev/null || true)
+rm -f "$state_file"
+
+# If it's intact, a single pass is enough unless it changes it
+stable=false
+if [ "$warm_start" = true ] && [ -n "$previous" ] \
+    && [ "$(xref_state)" = "$previous" ]; then
+    compile -r 0
+    if [ "$(xref_state)" = "$previous" ]; then
+        stable=true
+    fi
+fi
+if [ "$stable" = false ]; then
+    compile
+fi
+xref_state > "$state_file"
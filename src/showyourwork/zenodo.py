@@ -3,18 +3,23 @@ Main Zenodo interface.
 
 """
 
+import hashlib
 import json
 import os
 import shutil
-import subprocess
 import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import requests
-
-from . import exceptions, git, paths
+from . import exceptions, git, paths, transfer
+from .archives import TarballStream
 from .config import get_run_type
 from .logging import get_logger
+from .session import get_session, get_settings
+from .store import get_dataset_store
 from .subproc import parse_request
 
 try:
@@ -42,46 +47,62 @@ def require_access_token(method):
     return wrapper
 
 
-def get_dataset_urls(files, datasets):
+def get_dataset_index(datasets):
+    """
+    Map every local file provided by a dataset to where it comes from.
+
+    Args:
+        datasets (dict): The parsed ``datasets`` config entry.
+
+    Returns:
+        dict: Mapping of each local file to a dict with the ``doi`` of the
+        deposit it comes from, the name of the ``archive`` it is extracted
+        from (``None`` if it's downloaded directly) and its name in the
+        deposit or archive (``member``).
+    """
+    index = {}
+    for doi, entry in datasets.items():
+        for remote_file, local_file in entry["contents"].items():
+            index[local_file] = {"doi": doi, "archive": None, "member": remote_file}
+        for zip_file, zip_contents in entry["zip_files"].items():
+            for compressed_file, extracted_file in zip_contents.items():
+                index[extracted_file] = {
+                    "doi": doi,
+                    "archive": zip_file,
+                    "member": compressed_file,
+                }
+    return index
+
+
+def get_dataset_dois(files, index):
     """
     Given a list of `files`, return all associated Zenodo and/or Zenodo Sandbox
-    URLs.
+    DOIs.
 
-    This is used to populate the figure margin icons in the article.
+    Args:
+        files (list): The local files.
+        index (dict): The dataset index (see ``get_dataset_index``).
 
     """
-    result = []
-    for doi in datasets:
-        deposit = Zenodo(doi)
-        url = f"https://{deposit.url}/records/{deposit.deposit_id}"
-        for file in files:
-            if file in datasets[doi]["contents"].values():
-                result.append(url)
-            else:
-                for zip_file in datasets[doi]["zip_files"]:
-                    if file in datasets[doi]["zip_files"][zip_file].values():
-                        result.append(url)
-                        break
-    return list(set(result))
+    return list(set(index[file]["doi"] for file in files if file in index))
 
 
-def get_dataset_dois(files, datasets):
+def get_dataset_urls(files, index):
     """
     Given a list of `files`, return all associated Zenodo and/or Zenodo Sandbox
-    DOIs.
+    URLs.
+
+    This is used to populate the figure margin icons in the article.
+
+    Args:
+        files (list): The local files.
+        index (dict): The dataset index (see ``get_dataset_index``).
 
     """
     result = []
-    for doi in datasets:
-        Zenodo(doi)
-        for file in files:
-            if file in datasets[doi]["contents"].values():
-                result.append(doi)
-            else:
-                for zip_file in datasets[doi]["zip_files"]:
-                    if file in datasets[doi]["zip_files"][zip_file].values():
-                        result.append(doi)
-                        break
+    for doi in get_dataset_dois(files, index):
+        deposit = get_deposit(doi)
+        result.append(f"https://{deposit.url}/records/{deposit.deposit_id}")
     return list(set(result))
 
 
@@ -103,6 +124,144 @@ services = {
 }
 
 
+# Shared ``Zenodo`` interfaces, keyed by DOI
+_deposits = {}
+_deposits_lock = threading.Lock()
+
+
+def get_deposit(doi):
+    """
+    Return the ``Zenodo`` interface for a given DOI.
+
+    A single instance is shared per DOI across the process, so ownership and
+    id type lookups happen at most once per deposit.
+
+    """
+    with _deposits_lock:
+        if doi not in _deposits:
+            _deposits[doi] = Zenodo(doi)
+        return _deposits[doi]
+
+
+class DepositManifest:
+    """
+    An in-memory copy of the latest draft of a deposit: its metadata, the
+    rule hashes recorded in its ``notes`` field and the files it contains.
+
+    Args:
+        deposit (Zenodo): The deposit the draft belongs to.
+        draft (dict): The draft, as returned by the API.
+
+    """
+
+    def __init__(self, deposit, draft):
+        self.deposit = deposit
+        self.draft = draft
+        self.lock = threading.RLock()
+        notes = draft["metadata"].get("notes", "{}")
+        try:
+            self.rule_hashes = json.loads(notes)
+        except json.JSONDecodeError:
+            raise exceptions.InvalidZenodoNotesField()
+        self._files = None
+
+    @property
+    def files(self):
+        """
+        Mapping of file name to file entry for all files in the draft.
+
+        """
+        with self.lock:
+            if self._files is None:
+                data = parse_request(
+                    self.deposit.session.get(
+                        self.draft["links"]["files"],
+                        params={"access_token": self.deposit.access_token},
+                    )
+                )
+                self._files = {entry["key"]: entry for entry in data["entries"]}
+            return self._files
+
+    def update(self, draft):
+        """
+        Record the new state of the draft after we modified it.
+
+        """
+        with self.lock:
+            self.draft = draft
+            self._files = None
+
+
+class SyncLedger:
+    """
+    A local record of which cache files we know to be on a deposit, so we
+    don't have to ask the API every time we sync a file.
+
+    The ledger maps rule names to the hash of the file last confirmed to be
+    in the latest draft and the time we confirmed it. Entries older than
+    ``ttl`` seconds are revalidated against the API.
+
+    Args:
+        path (Path): The JSON file the ledger is stored in.
+        ttl (float): How long to trust an entry, in seconds.
+
+    """
+
+    def __init__(self, path, ttl):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._entries = None
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def is_current(self, rule_name, file_hash):
+        """
+        Return True if the file was recently confirmed to be on the deposit.
+
+        """
+        with self.lock:
+            entry = self.entries.get(rule_name, None)
+        return (
+            entry is not None
+            and entry["hash"] == file_hash
+            and time.time() - entry["time"] < self.ttl
+        )
+
+    def record(self, rule_name, file_hash):
+        """
+        Record that the file is on the deposit.
+
+        """
+        with self.lock:
+            self.entries[rule_name] = {"hash": file_hash, "time": time.time()}
+            self._save()
+
+    def clear(self):
+        """
+        Forget everything we know about the deposit.
+
+        """
+        with self.lock:
+            self._entries = {}
+            self._save()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{threading.get_ident()}")
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+
+
 class Zenodo:
     """
     A Zenodo or Zenodo Sandbox interface for ``showyourwork``.
@@ -119,6 +278,13 @@ class Zenodo:
             kwargs: Forwarded to ``Zenodo._create``.
 
         """
+        # Shared HTTP session for all API calls
+        self.session = get_session()
+
+        # State of the deposit on the remote, fetched on demand
+        self._manifest_lock = threading.RLock()
+        self._record_files = None
+        self.invalidate()
 
         # Parse input
         if str(doi_or_service).lower() in services.keys():
@@ -132,7 +298,7 @@ class Zenodo:
             self.service = service["name"]
             self.doi = self._create(**kwargs)
             self.deposit_id = self.doi.split(self.doi_prefix)[1]
-            self.user_is_owner = True
+            self._user_is_owner = True
 
         else:
             # Parse the DOI
@@ -153,15 +319,31 @@ class Zenodo:
             except Exception:
                 raise exceptions.InvalidZenodoDOI(self.doi)
 
-            # Check if the user is an owner
+            # We'll check if the user is an owner when we need to know
+            self._user_is_owner = None
+
+        # Local record of the files we know are on the deposit
+        self.sync_ledger = SyncLedger(
+            self.path() / f"{self.deposit_id}" / "sync.json",
+            float(get_settings()["sync_ttl"]),
+        )
+
+    @property
+    def user_is_owner(self):
+        """
+        Whether the user is authenticated to edit this deposit.
+
+        """
+        if self._user_is_owner is None:
             try:
-                self.user_is_owner = self.check_if_user_is_owner()
+                self._user_is_owner = self.check_if_user_is_owner()
             except Exception as e:
                 # Fail silently on connection errors
                 logger = get_logger()
                 logger.debug(f"Error accessing the {self.url} API:")
                 logger.debug(str(e))
-                self.user_is_owner = False
+                self._user_is_owner = False
+        return self._user_is_owner
 
     def _get_access_token(self):
         """
@@ -177,6 +359,9 @@ class Zenodo:
         Caches the result locally.
 
         """
+        if getattr(self, "_id_type", None) is not None:
+            return self._id_type
+
         cache_file = self.path() / f"{self.deposit_id}" / "id_type.txt"
 
         if cache_file.exists():
@@ -186,8 +371,9 @@ class Zenodo:
 
         else:
             # Try to find a published record (no authentication needed)
+            url = f"https://{self.url}/api/records/{self.deposit_id}"
             try:
-                r = requests.get(f"https://{self.url}/api/records/{self.deposit_id}")
+                r = self.session.get(url)
                 data = r.json()
             except Exception as e:
                 r = None
@@ -210,6 +396,7 @@ class Zenodo:
             with open(cache_file, "w") as f:
                 print(id_type, file=f)
 
+        self._id_type = id_type
         return id_type
 
     def _create(self, slug=None, branch=None):
@@ -222,14 +409,14 @@ class Zenodo:
 
         # Get the deposit title
         if branch is None:
-            branch = git.get_repo_branch()
+            branch = git.get_snapshot().branch
         if slug is None:
-            slug = git.get_repo_slug()
+            slug = git.get_snapshot().slug
         title = f"Data for {slug} [{branch}]"
 
         # Create the draft
         data = parse_request(
-            requests.post(
+            self.session.post(
                 f"https://{self.url}/api/deposit/depositions",
                 params={
                     "access_token": self.access_token,
@@ -257,7 +444,7 @@ class Zenodo:
             }
         }
         data = parse_request(
-            requests.put(
+            self.session.put(
                 data["links"]["latest_draft"],
                 params={"access_token": self.access_token},
                 data=json.dumps(metadata),
@@ -272,13 +459,20 @@ class Zenodo:
         # Logger
         logger = get_logger()
 
-        # Check if we've tested this already for the given API
-        # token **in this session**. These flags get automatically
-        # deleted during the preprocessing step of every build.
-        cache_file_true = paths.user().flags / f"{self.deposit_id}_AUTH_VALID"
+        # Check if we've already validated the current API token for this
+        # deposit. We store a fingerprint of each token that worked, so a
+        # new token is always re-tested.
+        owners_file = self.path() / f"{self.deposit_id}" / "owners.txt"
+        if self.access_token:
+            fingerprint = hashlib.sha256(self.access_token.encode()).hexdigest()
+            if owners_file.exists():
+                with open(owners_file) as f:
+                    if fingerprint in f.read().split():
+                        return True
+
+        # Check if we've tested this already and failed **in this session**.
+        # These flags get automatically deleted at the start of every build.
         cache_file_false = paths.user().flags / f"{self.deposit_id}_AUTH_INVALID"
-        if cache_file_true.exists():
-            return True
         if cache_file_false.exists():
             return False
 
@@ -286,7 +480,7 @@ class Zenodo:
             logger.debug(f"Testing if user is authenticated for {self.doi}...")
 
             # Search for both concept and version DOIs
-            r = requests.get(
+            r = self.session.get(
                 f"https://{self.url}/api/deposit/depositions",
                 params={
                     "q": f"recid:{self.deposit_id} conceptrecid:{self.deposit_id}",
@@ -302,7 +496,9 @@ class Zenodo:
                         logger.info(f"User authentication for {self.doi} is valid.")
                     else:
                         logger.debug(f"User authentication for {self.doi} is valid.")
-                    cache_file_true.touch()
+                    owners_file.parents[0].mkdir(exist_ok=True)
+                    with open(owners_file, "a") as f:
+                        print(fingerprint, file=f)
                     return True
                 else:
                     logger.debug("Error establishing whether user is authenticated.")
@@ -315,100 +511,71 @@ class Zenodo:
         return False
 
     @require_access_token
-    def upload_file_to_draft(self, draft, file, rule_name, tarball=False):
+    def upload_file_to_draft(self, manifest, file, rule_name, tarball=False):
         """
         Upload a file to a Zenodo draft. Delete the current file
         produced by the same rule, if present.
 
+        Returns:
+            bool: ``True`` if the file was uploaded, ``False`` if the draft
+            was already up to date.
         """
-        # Get rule hashes for the files currently on Zenodo
-        metadata = draft["metadata"]
-        notes = metadata.get("notes", "{}")
-        try:
-            rule_hashes = json.loads(notes)
-        except json.JSONDecodeError:
-            raise exceptions.InvalidZenodoNotesField()
-
         # Search for an existing file on Zenodo
-        rule_hash_on_zenodo = rule_hashes.get(rule_name, None)
+        rule_hash_on_zenodo = manifest.rule_hashes.get(rule_name, None)
         if rule_hash_on_zenodo == file.name:
             # The file is up to date
-            return
+            return False
         elif rule_hash_on_zenodo:
             # Delete the existing file
-            files_url = draft["links"]["files"]
-            data = parse_request(
-                requests.get(
-                    files_url,
-                    params={"access_token": self.access_token},
-                )
-            )
-            for entry in data["entries"]:
-                if entry["key"] == rule_name:
-                    file_id = entry["id"]
-                    parse_request(
-                        requests.delete(
-                            f"{files_url}/{file_id}",
-                            params={"access_token": self.access_token},
-                        )
+            entry = manifest.files.get(rule_name, None)
+            if entry is not None:
+                parse_request(
+                    self.session.delete(
+                        f"{manifest.draft['links']['files']}/{entry['id']}",
+                        params={"access_token": self.access_token},
                     )
-                    break
+                )
 
-        # If it's a directory, tar it up
+        # If it's a directory, tar it up as we upload it
         if tarball:
-            with tarfile.open(f"{file}.tar.gz", "w:gz") as tb:
-                tb.add(file, arcname=".")
-            file_to_upload = Path(f"{file}.tar.gz")
+            file_to_upload = TarballStream(file)
         else:
             file_to_upload = file
 
-        # Use curl to upload the file so we have a progress bar
-        bucket_url = draft["links"]["bucket"]
-        progress_bar = (
-            ["--progress-bar"]
-            if not snakemake.workflow.config["github_actions"]
-            else []
-        )
+        # Upload the file. If this fails, we never record its hash below
+        bucket_url = manifest.draft["links"]["bucket"]
         try:
-            subprocess.run(
-                [
-                    "curl",
-                    "--referer",
-                    "https://show-your.work",
-                    "-f",
-                    *progress_bar,
-                    "-o",
-                    "/dev/null",
-                    "--upload-file",
-                    str(file_to_upload),
-                    "--request",
-                    "PUT",
-                    f"{bucket_url}/{rule_name}?access_token={self.access_token}",
-                ],
-                check=False,
+            transfer.upload(
+                f"{bucket_url}/{rule_name}",
+                file_to_upload,
+                params={"access_token": self.access_token},
+                show_progress=not snakemake.workflow.config["github_actions"],
+                session=self.session,
             )
-        except Exception:
-            raise exceptions.ZenodoUploadError()
-
-        # Delete the tarball if we created it
-        if tarball:
-            file_to_upload.unlink()
+        finally:
+            if tarball:
+                file_to_upload.close()
 
         # Update the provenance
-        rule_hashes[rule_name] = file.name
-        metadata["notes"] = json.dumps(rule_hashes, indent=4)
-        parse_request(
-            requests.put(
-                draft["links"]["latest_draft"],
-                params={"access_token": self.access_token},
-                data=json.dumps({"metadata": metadata}),
-                headers={"Content-Type": "application/json"},
+        with manifest.lock:
+            manifest.rule_hashes[rule_name] = file.name
+            metadata = dict(manifest.draft["metadata"])
+            metadata["notes"] = json.dumps(manifest.rule_hashes, indent=4)
+            draft = parse_request(
+                self.session.put(
+                    manifest.draft["links"]["latest_draft"],
+                    params={"access_token": self.access_token},
+                    data=json.dumps({"metadata": metadata}),
+                    headers={"Content-Type": "application/json"},
+                )
             )
-        )
+            manifest.update(draft)
+
+        return True
 
     @require_access_token
     def download_file_from_draft(
-        self, draft, file, rule_name, tarball=False, dry_run=False
+        self, manifest, file, rule_name, tarball=False, dry_run=False
     ):
         """
         Downloads a file from a Zenodo draft.
@@ -417,84 +584,87 @@ class Zenodo:
         # Logger
         logger = get_logger()
 
-        # Get rule hashes for the files currently on Zenodo
-        metadata = draft["metadata"]
-        notes = metadata.get("notes", "{}")
-        try:
-            rule_hashes = json.loads(notes)
-        except json.JSONDecodeError:
-            raise exceptions.InvalidZenodoNotesField()
-
-        # Get the files currently on the remote
-        data = parse_request(
-            requests.get(
-                draft["links"]["files"],
-                params={"access_token": self.access_token},
-            )
-        )
-
         # Look for a match
         logger.debug(f"Searching for file `{rule_name}` with hash `{file.name}`...")
-        for entry in data["entries"]:
+        entry = manifest.files.get(rule_name, None)
+        rule_hash = manifest.rule_hashes.get(rule_name, None)
+        if entry is not None:
             logger.debug(
-                f"Inspecting candidate file `{entry['key']}` with hash "
-                f"`{rule_hashes.get(rule_name, None)}`..."
+                f"Inspecting candidate file `{entry['key']}` with hash `{rule_hash}`..."
             )
 
-            if (
-                entry["key"] == rule_name
-                and rule_hashes.get(rule_name, None) == file.name
-            ):
+            if rule_hash == file.name:
                 # Download it
                 logger.debug("File name and hash both match.")
                 if not dry_run:
                     logger.debug("Downloading...")
-                    url = entry["links"]["content"]
-                    progress_bar = (
-                        ["--progress-bar"]
-                        if not snakemake.workflow.config["github_actions"]
-                        else []
+                    self._download(
+                        entry["links"]["content"],
+                        file,
+                        tarball=tarball,
+                        params={"access_token": self.access_token},
+                        checksum=entry.get("checksum", None),
                     )
-                    try:
-                        subprocess.run(
-                            [
-                                "curl",
-                                "--referer",
-                                "https://show-your.work",
-                                "-f",
-                                f"{url}?access_token={self.access_token}",
-                                *progress_bar,
-                                "--output",
-                                str(file),
-                            ],
-                            check=False,
-                        )
-                    except Exception:
-                        raise exceptions.ZenodoDownloadError()
-
-                    # If it's a directory tarball, extract it
-                    if tarball:
-                        os.rename(file, f"{file}.tar.gz")
-                        with tarfile.open(f"{file}.tar.gz") as tb:
-                            tb.extractall(file)
-                        Path(f"{file}.tar.gz").unlink()
+                self.sync_ledger.record(rule_name, file.name)
 
                 return
 
-            elif entry["key"] == rule_name:
-                # We're done with this deposit
+            else:
                 logger.debug(
                     f"File {rule_name} found, but it has the wrong hash. Skipping..."
                 )
-                break
-
-            else:
-                # Keep looking in this deposit for a file with the right name
-                logger.debug(f"Cache miss for file {entry['key']}. Skipping...")
 
         # This is caught in the enclosing scope and treated as a cache miss
         raise exceptions.FileNotFoundOnZenodo(rule_name)
 
+    def _download(self, url, file, tarball=False, params=None, checksum=None):
+        """
+        Download a cached file, extracting it if it's a directory tarball.
+
+        Interrupted downloads are resumed (see ``transfer.download``), and the
+        file is verified against ``checksum`` if we have one.
+
+        """
+        show_progress = not snakemake.workflow.config["github_actions"]
+        if tarball:
+            # Extract next to the destination as we download it, and move it
+            # into place once verified, so a partially extracted directory is
+            # never visible
+            file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = Path(tempfile.mkdtemp(prefix=f".{file.name}.", dir=file.parent))
+
+            def extract(stream):
+                # Start from scratch if the download is being retried
+                shutil.rmtree(tmp)
+                tmp.mkdir()
+                with tarfile.open(fileobj=stream, mode="r|gz") as tb:
+                    tb.extractall(tmp)
+
+            try:
+                transfer.stream(
+                    url,
+                    extract,
+                    params=params,
+                    show_progress=show_progress,
+                    session=self.session,
+                    checksum=checksum,
+                )
+                if file.exists():
+                    shutil.rmtree(file)
+                os.replace(tmp, file)
+            finally:
+                if tmp.exists():
+                    shutil.rmtree(tmp)
+        else:
+            transfer.download(
+                url,
+                file,
+                params=params,
+                show_progress=show_progress,
+                session=self.session,
+                checksum=checksum,
+            )
+
     def download_file_from_record(
         self, record, file, rule_name, tarball=False, dry_run=False
     ):
@@ -523,31 +693,12 @@ class Zenodo:
                 logger.debug("File name and hash both match.")
                 if not dry_run:
                     logger.debug("Downloading...")
-                    url = entry["links"]["self"]
-                    progress_bar = (
-                        ["--progress-bar"]
-                        if not snakemake.workflow.config["github_actions"]
-                        else []
+                    self._download(
+                        entry["links"]["self"],
+                        file,
+                        tarball=tarball,
+                        checksum=entry.get("checksum", None),
                     )
-                    subprocess.run(
-                        [
-                            "curl",
-                            "--referer",
-                            "https://show-your.work",
-                            url,
-                            *progress_bar,
-                            "--output",
-                            str(file),
-                        ],
-                        check=False,
-                    )
-
-                    # If it's a directory tarball, extract it
-                    if tarball:
-                        os.rename(file, f"{file}.tar.gz")
-                        with tarfile.open(f"{file}.tar.gz") as tb:
-                            tb.extractall(file)
-                        Path(f"{file}.tar.gz").unlink()
 
                 return
 
@@ -571,7 +722,7 @@ class Zenodo:
 
         # Grab the version id
         logger.info(f"Deleting {self.service} deposit with concept DOI {self.doi}...")
-        r = requests.get(
+        r = self.session.get(
             f"https://{self.url}/api/deposit/depositions",
             params={
                 "q": f"conceptrecid:{self.deposit_id}",
@@ -589,7 +740,7 @@ class Zenodo:
             raise exceptions.ZenodoRecordNotFound(self.deposit_id)
         version_id = data["id"]
         parse_request(
-            requests.delete(
+            self.session.delete(
                 f"https://{self.url}/api/deposit/depositions/{version_id}",
                 params={
                     "access_token": self.access_token,
@@ -597,6 +748,8 @@ class Zenodo:
             )
         )
         logger.info(f"Successfully deleted deposit {self.doi}.")
+        self.sync_ledger.clear()
+        self.invalidate()
 
     @require_access_token
     def publish(self):
@@ -609,7 +762,7 @@ class Zenodo:
 
         # Grab the version id
         logger.info(f"Publishing {self.service} deposit with concept DOI {self.doi}...")
-        r = requests.get(
+        r = self.session.get(
             f"https://{self.url}/api/deposit/depositions",
             params={
                 "q": f"conceptrecid:{self.deposit_id}",
@@ -627,7 +780,7 @@ class Zenodo:
             raise exceptions.ZenodoRecordNotFound(self.deposit_id)
         version_id = data["id"]
         parse_request(
-            requests.post(
+            self.session.post(
                 f"https://{self.url}/api/deposit/depositions/{version_id}/actions/publish",
                 params={
                     "access_token": self.access_token,
@@ -635,93 +788,151 @@ class Zenodo:
             )
         )
         logger.info(f"Successfully published deposit {self.doi}.")
+        self.invalidate()
 
-    def download_file(self, file, rule_name, tarball=False, dry_run=False):
+    def invalidate(self):
         """
-        Download a file from the record, deposit or deposit draft.
+        Forget everything we know about the state of the deposit on the remote.
+
+        """
+        with self._manifest_lock:
+            self._manifest_fetched = False
+            self._manifest = None
+            self._deposition = None
+            self._draft_url = None
+            self._records = None
+
+    def get_manifest(self, create=False):
+        """
+        Return the ``DepositManifest`` of the latest draft of this deposit, or
+        ``None`` if there's no draft we can access.
+
+        The draft is only fetched from the API the first time this is called;
+        after that, lookups are answered from memory.
+
+        Args:
+            create (bool, optional): Create a new draft if the deposit has
+                been published and there's no open draft. Default ``False``.
+
+        """
+        with self._manifest_lock:
+            if not self._manifest_fetched:
+                self._fetch_manifest()
+                self._manifest_fetched = True
+
+            if (
+                create
+                and self._manifest is None
+                and self._deposition is not None
+                and self._draft_url is None
+            ):
+                # Create a new draft
+                data = parse_request(
+                    self.session.post(
+                        f"https://{self.url}/api/deposit/depositions/"
+                        f"{self._deposition['id']}/actions/newversion",
+                        params={"access_token": self.access_token},
+                    )
+                )
+                self._draft_url = data["links"]["latest_draft"]
+                self._manifest = DepositManifest(
+                    self,
+                    parse_request(
+                        self.session.get(
+                            self._draft_url,
+                            params={"access_token": self.access_token},
+                        )
+                    ),
+                )
+
+            return self._manifest
+
+    def _fetch_manifest(self):
+        """
+        Query the API for the deposit and its latest draft.
 
         """
         # Logger
         logger = get_logger()
 
-        # Check if there's a draft (and the user has access), and check for
-        # a file match. If not, check for existing published versions, and
-        # check for a match in each one. If no file is found, raise a cache
-        # miss exception, which is caught in the enclosing scope.
+        # Drafts are only accessible to their owners
+        if not self.access_token:
+            logger.debug(
+                f"Unable to access {self.service} deposit drafts without "
+                f"`{self.token_name}`."
+            )
+            return
 
-        # Check for an existing draft; if found, check for the file in
-        # that draft and return if found.
-        concept_id = self.deposit_id
+        # Find the deposit
         logger.debug(
             f"Attempting to access {self.service} deposit with DOI {self.doi}..."
         )
-        r = requests.get(
+        r = self.session.get(
             f"https://{self.url}/api/deposit/depositions",
             params={
-                "q": f"conceptrecid:{concept_id}",
+                "q": f"conceptrecid:{self.deposit_id}",
                 "all_versions": 1,
                 "access_token": self.access_token,
             },
         )
-        if r.status_code <= 204:
-            try:
-                data = r.json()
-            except Exception:
-                data = []
-            if len(data):
-                data = data[0]
-                draft_url = data.get("links", {}).get("latest_draft", None)
-                if draft_url:
-                    r = requests.get(
-                        draft_url,
-                        params={"access_token": self.access_token},
-                    )
-                    if r.status_code <= 204:
-                        try:
-                            draft = r.json()
-                            self.download_file_from_draft(
-                                draft,
-                                file,
-                                rule_name,
-                                tarball=tarball,
-                                dry_run=dry_run,
-                            )
-                        except exceptions.FileNotFoundOnZenodo:
-                            exceptions.restore_trace()
-                            logger.debug(
-                                f"File {rule_name} not found in deposit with DOI "
-                                f"{self.doi}."
-                            )
-                        else:
-                            return
-                    else:
-                        logger.debug(f"Something went wrong accessing {draft_url}.")
-                        try:
-                            data = r.json()
-                        except Exception:
-                            pass
-                        else:
-                            logger.debug(data["message"])
-            else:
-                logger.debug(
-                    f"Failed to access {self.service} deposit with DOI {self.doi}."
-                )
-        else:
+        try:
+            data = r.json()
+        except Exception:
+            data = []
+        if r.status_code > 204 or not isinstance(data, list) or not len(data):
             logger.debug(
                 f"Failed to access {self.service} deposit with DOI {self.doi}."
             )
+            if isinstance(data, dict) and "message" in data:
+                logger.debug(data["message"])
+            return
+        self._deposition = data[0]
+
+        # Find its latest draft
+        draft_url = self._deposition.get("links", {}).get("latest_draft", None)
+        if not draft_url and not self._deposition["submitted"]:
+            draft_url = self._deposition["links"]["self"]
+        self._draft_url = draft_url
+        if not draft_url:
+            return
+
+        # Grab the draft
+        r = self.session.get(draft_url, params={"access_token": self.access_token})
+        if r.status_code > 204:
+            logger.debug(f"Something went wrong accessing {draft_url}.")
             try:
-                data = r.json()
+                logger.debug(r.json()["message"])
             except Exception:
                 pass
-            else:
-                logger.debug(data["message"])
+            return
+        self._manifest = DepositManifest(self, r.json())
+
+    def get_records(self):
+        """
+        Return all published versions of this deposit, oldest first.
+
+        The records are only fetched from the API the first time this is called.
+
+        """
+        with self._manifest_lock:
+            if self._records is None:
+                self._records = self._fetch_records()
+            return self._records
+
+    def _fetch_records(self):
+        """
+        Query the API for all published versions of this deposit.
+
+        """
+        # Logger
+        logger = get_logger()
 
         # Check for a published record
+        concept_id = self.deposit_id
         logger.debug(
             f"Attempting to access {self.service} record with DOI {self.doi}..."
         )
-        r = requests.get(f"https://{self.url}/api/records/{concept_id}")
+        r = self.session.get(f"https://{self.url}/api/records/{concept_id}")
         if r.status_code > 204:
             try:
                 data = r.json()
@@ -729,7 +940,7 @@ class Zenodo:
                 data = {}
             if "PID is not registered" in data.get("message", ""):
                 # There is no published record with this id
-                pass
+                return []
             else:
                 # Something unexpected happened
                 raise exceptions.ZenodoError(
@@ -739,132 +950,275 @@ class Zenodo:
                         f"An error occurred while accessing {self.service}.",
                     ),
                 )
+
+        # There's a published record. Let's grab all its versions.
+        r = self.session.get(
+            f"https://{self.url}/api/records",
+            params={
+                "q": f'conceptdoi:"{self.doi_prefix}{concept_id}"',
+                "access_token": self.access_token,
+                "all_versions": 1,
+            },
+        )
+        if r.status_code <= 204:
+            try:
+                return r.json().get("hits", {}).get("hits", [])
+            except Exception:
+                logger.debug(f"Unable to parse records for DOI {self.doi}.")
+                return []
         else:
-            # There's a published record. Let's search all versions for
-            # a file match.
-            r = requests.get(
-                f"https://{self.url}/api/records",
-                params={
-                    "q": f'conceptdoi:"{self.doi_prefix}{concept_id}"',
-                    "access_token": self.access_token,
-                    "all_versions": 1,
-                },
+            # Something unexpected happened
+            try:
+                data = r.json()
+            except Exception:
+                data = {}
+            raise exceptions.ZenodoError(
+                status=data.get("status", "unknown"),
+                message=data.get(
+                    "message",
+                    f"An error occurred while accessing {self.service}.",
+                ),
             )
-            if r.status_code <= 204:
+
+    def archive_index_path(self, archive_name):
+        """
+        Return where we keep the member index of one of the archives in this
+        deposit (see ``archives.extract_members``).
+
+        """
+        return self.path() / f"{self.deposit_id}" / "index" / f"{archive_name}.json"
+
+    def get_record_files(self):
+        """
+        Return the files in the published record with this (version) DOI,
+        keyed by file name.
+
+        The listing is only fetched from the API the first time this is called.
+        If it can't be fetched, an empty dict is returned.
+
+        """
+        with self._manifest_lock:
+            if self._record_files is None:
+                self._record_files = {}
+                url = f"https://{self.url}/api/records/{self.deposit_id}"
+                r = self.session.get(url)
                 try:
-                    records = r.json().get("hits", {}).get("hits", [])
-                except Exception:
-                    records = []
-                    logger.debug(
-                        f"File {rule_name} not found in record with DOI {self.doi}."
+                    data = r.json()
+                    if r.status_code > 204:
+                        raise Exception(data.get("message", r.status_code))
+                    for entry in data.get("files", []):
+                        name = entry.get("key", entry.get("filename", None))
+                        self._record_files[name] = entry
+                except Exception as e:
+                    get_logger().debug(
+                        f"Unable to list the files in record {self.doi}: {e}"
                     )
-                for record in records[::-1]:
-                    try:
-                        self.download_file_from_record(
-                            record,
-                            file,
-                            rule_name,
-                            tarball=tarball,
-                            dry_run=dry_run,
-                        )
-                    except exceptions.FileNotFoundOnZenodo:
-                        exceptions.restore_trace()
-                        logger.debug(
-                            f"File {rule_name} not found in record with DOI {self.doi}."
-                        )
-                    else:
-                        return
+            return self._record_files
+
+    def download_files(self, files, show_progress=True):
+        """
+        Download files from the published record with this (version) DOI.
+
+        Files are downloaded concurrently (see the ``max_transfers`` setting
+        under ``zenodo_api``) into a local copy of the record and verified
+        against the checksums published with it. Files whose local copy already
+        matches are not downloaded again. Each file is then linked (or copied,
+        if that fails) to its destination.
+
+        If a dataset store is configured (see ``store.get_dataset_store``),
+        the files are kept there instead, and shared with other projects.
+
+        Args:
+            files (dict): Mapping of file names in the record to local paths.
+            show_progress (bool, optional): Show the progress of the downloads.
+                Default ``True``.
+
+        """
+        logger = get_logger()
+        record_files = self.get_record_files()
+        store = get_dataset_store()
+        folder = self.path() / f"{self.deposit_id}" / "files"
+        ledger = SyncLedger(folder / ".checksums.json", float("inf"))
+
+        def is_valid(remote_file, file, checksum):
+            if not file.exists():
+                return False
+            stat = file.stat()
+            signature = f"{checksum}:{stat.st_size}:{stat.st_mtime_ns}"
+            if ledger.is_current(remote_file, signature):
+                return True
+            algorithm, digest = transfer.parse_checksum(checksum)
+            if transfer.file_checksum(file, algorithm) == digest:
+                ledger.record(remote_file, signature)
+                return True
+            return False
+
+        def fetch(remote_file, local_file):
+            url = f"https://{self.url}/records/{self.deposit_id}/files/{remote_file}"
+            checksum = record_files.get(remote_file, {}).get("checksum", None)
+            if store is not None and checksum:
+                stored = store.path(self.doi, remote_file, checksum)
+                if stored.exists():
+                    logger.debug(f"Using {remote_file} from the dataset store.")
+                else:
+                    transfer.download(
+                        url,
+                        stored,
+                        show_progress=show_progress,
+                        session=self.session,
+                        checksum=checksum,
+                    )
+                    store.add(stored)
+                store.materialize(stored, local_file)
+                return
+            cached = folder / remote_file
+            if checksum and is_valid(remote_file, cached, checksum):
+                logger.debug(f"Local copy of {remote_file} is up to date.")
             else:
-                # Something unexpected happened
-                try:
-                    data = r.json()
-                except Exception:
-                    data = {}
-                raise exceptions.ZenodoError(
-                    status=data.get("status", "unknown"),
-                    message=data.get(
-                        "message",
-                        f"An error occurred while accessing {self.service}.",
-                    ),
+                if not checksum:
+                    logger.debug(f"No checksum available for {remote_file}.")
+                transfer.download(
+                    url,
+                    cached,
+                    show_progress=show_progress,
+                    session=self.session,
+                    checksum=checksum,
                 )
+                if checksum:
+                    stat = cached.stat()
+                    ledger.record(
+                        remote_file, f"{checksum}:{stat.st_size}:{stat.st_mtime_ns}"
+                    )
+            local_file = Path(local_file)
+            local_file.parent.mkdir(parents=True, exist_ok=True)
+            if local_file.exists():
+                local_file.unlink()
+            try:
+                os.link(cached, local_file)
+            except OSError:
+                shutil.copyfile(cached, local_file)
+
+        workers = max(1, int(get_settings()["max_transfers"]))
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="syw-download"
+        ) as executor:
+            futures = [
+                executor.submit(fetch, remote_file, local_file)
+                for remote_file, local_file in files.items()
+            ]
+        for future in futures:
+            future.result()
+
+    def has_file(self, rule_name, file_hash):
+        """
+        Return True if the deposit has the file with the given hash for a rule,
+        either in its latest draft or in one of its published versions.
 
-        # This is caught in the enclosing scope and treated as a cache miss
-        raise exceptions.FileNotFoundOnZenodo(file.name)
+        The local sync ledger is consulted first, so files we recently
+        confirmed to be on the deposit don't cost any API requests.
 
-    @require_access_token
-    def upload_file(self, file, rule_name, tarball=False):
         """
-        Upload a file to the latest deposit draft.
+        if self.sync_ledger.is_current(rule_name, file_hash):
+            return True
+        manifest = self.get_manifest()
+        if (
+            manifest is not None
+            and manifest.rule_hashes.get(rule_name, None) == file_hash
+            and rule_name in manifest.files
+        ):
+            return True
+        for record in self.get_records():
+            try:
+                rule_hashes = json.loads(record["metadata"].get("notes", "{}"))
+            except json.JSONDecodeError:
+                continue
+            if rule_hashes.get(rule_name, None) == file_hash and any(
+                entry["key"] == rule_name for entry in record.get("files", [])
+            ):
+                return True
+        return False
+
+    def download_file(self, file, rule_name, tarball=False, dry_run=False):
+        """
+        Download a file from the record, deposit or deposit draft.
 
         """
         # Logger
         logger = get_logger()
 
-        # Check if a draft already exists, and create it if not.
-        # If authentication fails, return with a gentle warning
-        concept_id = self.deposit_id
-        r = requests.get(
-            f"https://{self.url}/api/deposit/depositions",
-            params={
-                "q": f"conceptrecid:{concept_id}",
-                "all_versions": 1,
-                "access_token": self.access_token,
-            },
-        )
-        if r.status_code > 204:
-            logger.warning(
-                f"{self.service} authentication failed. Unable to upload cache for "
-                f"rule {rule_name}."
-            )
+        # Check if there's a draft (and the user has access), and check for
+        # a file match. If not, check for existing published versions, and
+        # check for a match in each one. If no file is found, raise a cache
+        # miss exception, which is caught in the enclosing scope.
+        manifest = self.get_manifest()
+        if manifest is not None:
             try:
-                data = r.json()
-            except Exception:
-                pass
+                self.download_file_from_draft(
+                    manifest,
+                    file,
+                    rule_name,
+                    tarball=tarball,
+                    dry_run=dry_run,
+                )
+            except exceptions.FileNotFoundOnZenodo:
+                exceptions.restore_trace()
+                logger.debug(
+                    f"File {rule_name} not found in deposit with DOI {self.doi}."
+                )
             else:
-                logger.debug(data["message"])
-            return
+                return
 
-        try:
-            data = r.json()
-        except Exception:
-            data = []
-        if len(data):
-            data = data[0]
-        else:
-            logger.warning(
-                f"{self.service} authentication failed. Unable to upload cache for "
-                f"rule {rule_name}."
-            )
-            return
-        draft_url = data.get("links", {}).get("latest_draft", None)
-        if not draft_url and not data["submitted"]:
-            draft_url = data["links"]["self"]
-        if draft_url:
-            # Draft exists
-            draft = parse_request(
-                requests.get(
-                    draft_url,
-                    params={"access_token": self.access_token},
+        # Search all published versions for a file match
+        for record in self.get_records()[::-1]:
+            try:
+                self.download_file_from_record(
+                    record,
+                    file,
+                    rule_name,
+                    tarball=tarball,
+                    dry_run=dry_run,
                 )
-            )
-
-        else:
-            # Create a new draft
-            data = parse_request(
-                requests.post(
-                    f"https://{self.url}/api/deposit/depositions/{data['id']}/actions/newversion",
-                    params={"access_token": self.access_token},
+            except exceptions.FileNotFoundOnZenodo:
+                exceptions.restore_trace()
+                logger.debug(
+                    f"File {rule_name} not found in record with DOI {self.doi}."
                 )
+            else:
+                return
+
+        # This is caught in the enclosing scope and treated as a cache miss
+        raise exceptions.FileNotFoundOnZenodo(file.name)
+
+    @require_access_token
+    def upload_file(self, file, rule_name, tarball=False):
+        """
+        Upload a file to the latest deposit draft.
+
+        Returns:
+            bool: ``True`` if the file was uploaded, ``False`` if the draft
+            was already up to date, or ``None`` if we couldn't access it.
+        """
+        # Skip the API entirely if we recently confirmed the file is there
+        if self.sync_ledger.is_current(rule_name, file.name):
+            get_logger().debug(
+                f"File {rule_name} is up to date on {self.service} "
+                "according to the local sync ledger."
             )
-            draft_url = data["links"]["latest_draft"]
-            draft = parse_request(
-                requests.get(
-                    draft_url,
-                    params={"access_token": self.access_token},
-                )
+            return False
+
+        # Get the latest draft, and create it if needed.
+        # If authentication fails, return with a gentle warning
+        manifest = self.get_manifest(create=True)
+        if manifest is None:
+            get_logger().warning(
+                f"{self.service} authentication failed. Unable to upload cache for "
+                f"rule {rule_name}."
             )
+            return None
 
-        self.upload_file_to_draft(draft, file, rule_name, tarball=tarball)
+        uploaded = self.upload_file_to_draft(manifest, file, rule_name, tarball=tarball)
+        self.sync_ledger.record(rule_name, file.name)
+        return uploaded
 
     @require_access_token
     def _download_latest_draft(self):
@@ -876,7 +1230,7 @@ class Zenodo:
         logger.debug(
             f"Attempting to access {self.service} deposit with DOI {self.doi}..."
         )
-        r = requests.get(
+        r = self.session.get(
             f"https://{self.url}/api/deposit/depositions",
             params={
                 "q": f"conceptrecid:{concept_id}",
@@ -901,7 +1255,7 @@ class Zenodo:
 
                 # Create a new draft if needed
                 if not draft_url:
-                    r = requests.post(
+                    r = self.session.post(
                         f"https://{self.url}/api/deposit/depositions/{data['id']}/actions/newversion",
                         params={"access_token": self.access_token},
                     )
@@ -914,7 +1268,7 @@ class Zenodo:
                     draft_url = data["links"]["latest_draft"]
 
                 # Grab the draft
-                r = requests.get(
+                r = self.session.get(
                     draft_url,
                     params={"access_token": self.access_token},
                 )
@@ -946,30 +1300,19 @@ class Zenodo:
 
         # Download all files
         data = parse_request(
-            requests.get(
+            self.session.get(
                 draft["links"]["files"],
                 params={"access_token": self.access_token},
             )
         )
         for entry in data["entries"]:
-            url = entry["links"]["content"]
-            try:
-                subprocess.run(
-                    [
-                        "curl",
-                        "--referer",
-                        "https://show-your.work",
-                        "-f",
-                        f"{url}?access_token={self.access_token}",
-                        "--progress-bar",
-                        "--output",
-                        entry["key"],
-                    ],
-                    cwd=cache_folder,
-                    check=False,
-                )
-            except Exception:
-                raise exceptions.ZenodoDownloadError()
+            transfer.download(
+                entry["links"]["content"],
+                cache_folder / entry["key"],
+                params={"access_token": self.access_token},
+                session=self.session,
+                checksum=entry.get("checksum", None),
+            )
 
         # Return path to cache folder
         return cache_folder
@@ -992,7 +1335,7 @@ class Zenodo:
         target_deposit = Zenodo(target_doi_or_service, **kwargs)
 
         # Grab the target deposit
-        r = requests.get(
+        r = self.session.get(
             f"https://{target_deposit.url}/api/deposit/depositions",
             params={
                 "q": f"conceptrecid:{target_deposit.deposit_id}",
@@ -1018,7 +1361,7 @@ class Zenodo:
 
                 # Create a new draft if needed
                 if not draft_url:
-                    r = requests.post(
+                    r = self.session.post(
                         f"https://{target_deposit.url}/api/deposit/depositions/{data['id']}/actions/newversion",
                         params={"access_token": target_deposit.access_token},
                     )
@@ -1032,7 +1375,7 @@ class Zenodo:
                     draft_url = data["links"]["latest_draft"]
 
                 # Grab the draft
-                r = requests.get(
+                r = self.session.get(
                     draft_url,
                     params={"access_token": target_deposit.access_token},
                 )
@@ -1069,7 +1412,7 @@ class Zenodo:
             }
         }
         parse_request(
-            requests.put(
+            self.session.put(
                 draft["links"]["latest_draft"],
                 params={"access_token": target_deposit.access_token},
                 data=json.dumps(metadata),
@@ -1083,27 +1426,12 @@ class Zenodo:
             if file.name == ".metadata.json":
                 continue
 
-            try:
-                subprocess.run(
-                    [
-                        "curl",
-                        "--referer",
-                        "https://show-your.work",
-                        "-f",
-                        "--progress-bar",
-                        "-o",
-                        "/dev/null",
-                        "--upload-file",
-                        file.name,
-                        "--request",
-                        "PUT",
-                        f"{bucket_url}/{file.name}?access_token={target_deposit.access_token}",
-                    ],
-                    cwd=cache_folder,
-                    check=False,
-                )
-            except Exception:
-                raise exceptions.ZenodoUploadError()
+            transfer.upload(
+                f"{bucket_url}/{file.name}",
+                file,
+                params={"access_token": target_deposit.access_token},
+                session=self.session,
+            )
 
         # We're done
         logger.info(f"Successfully copied {self.doi} to {target_deposit.doi}.")
@@ -0,0 +1,235 @@
+"""
+Random access into gzip streams, after ``examples/zran.c`` in the zlib
+sources.
+
+A deflate stream can only be decompressed from the start, since each block
+may refer back to the 32 KiB of output before it. We can still resume
+decompressing at the start of any block if we saved that output (the
+*window*) when we first got there, but Python's ``zlib`` module can neither
+tell us where the blocks end nor start decompressing in the middle of a
+byte, so we talk to the zlib library directly with ``ctypes``. If it can't
+be loaded, ``available()`` is False and ``inflater`` falls back to the
+``zlib`` module (without block boundaries).
+
+"""
+
+import ctypes
+import ctypes.util
+import functools
+import zlib
+
+#: Size of the deflate window, in bytes
+window_size = 1 << 15
+
+# Constants from ``zlib.h``
+Z_OK = 0
+Z_STREAM_END = 1
+Z_BLOCK = 5
+Z_BUF_ERROR = -5
+
+
+class _ZStream(ctypes.Structure):
+    _fields_ = [
+        ("next_in", ctypes.c_void_p),
+        ("avail_in", ctypes.c_uint),
+        ("total_in", ctypes.c_ulong),
+        ("next_out", ctypes.c_void_p),
+        ("avail_out", ctypes.c_uint),
+        ("total_out", ctypes.c_ulong),
+        ("msg", ctypes.c_char_p),
+        ("state", ctypes.c_void_p),
+        ("zalloc", ctypes.c_void_p),
+        ("zfree", ctypes.c_void_p),
+        ("opaque", ctypes.c_void_p),
+        ("data_type", ctypes.c_int),
+        ("adler", ctypes.c_ulong),
+        ("reserved", ctypes.c_ulong),
+    ]
+
+
+@functools.lru_cache
+def _library():
+    # Python's own ``zlib`` module is usually linked against the library, so
+    # we can find its symbols through it if it's not on the search path
+    for name in [ctypes.util.find_library("z"), getattr(zlib, "__file__", None)]:
+        if not name:
+            continue
+        stream = ctypes.POINTER(_ZStream)
+        try:
+            lib = ctypes.CDLL(name)
+            lib.zlibVersion.restype = ctypes.c_char_p
+            lib.inflateInit2_.argtypes = [
+                stream,
+                ctypes.c_int,
+                ctypes.c_char_p,
+                ctypes.c_int,
+            ]
+            lib.inflate.argtypes = [stream, ctypes.c_int]
+            lib.inflateEnd.argtypes = [stream]
+            lib.inflatePrime.argtypes = [stream, ctypes.c_int, ctypes.c_int]
+            lib.inflateSetDictionary.argtypes = [
+                stream,
+                ctypes.c_char_p,
+                ctypes.c_uint,
+            ]
+        except (OSError, AttributeError):
+            continue
+        return lib
+    return None
+
+
+def available():
+    """
+    Return True if we can resume decompressing at block boundaries.
+
+    """
+    return _library() is not None
+
+
+class Inflater:
+    """
+    A deflate decompressor that stops at the end of every block.
+
+    Input is given to it with ``feed`` (whenever ``needs_input``), and output
+    taken from it with ``inflate``. After each call to ``inflate``,
+    ``boundary`` is the number of bits of the last byte consumed that belong
+    to the next block if we stopped at the end of a block (that isn't the
+    last one), or ``None`` otherwise.
+
+    Args:
+        wbits (int): As for ``zlib.decompressobj``: ``31`` for a gzip member
+            (with its header and trailer), ``-15`` for raw deflate data.
+        window (bytes, optional): The output preceding the point we start
+            decompressing at (up to ``window_size`` bytes).
+        prime (tuple, optional): The ``(bits, value)`` of the last byte
+            before the point we start at, if it's in the middle of a byte.
+
+    """
+
+    def __init__(self, wbits, window=b"", prime=None):
+        self._open = False
+        self._lib = _library()
+        self._strm = _ZStream()
+        self._input = b""
+        self._output = ctypes.create_string_buffer(0)
+        self.eof = False
+        self.boundary = None
+        self._check(
+            self._lib.inflateInit2_(
+                ctypes.byref(self._strm),
+                wbits,
+                self._lib.zlibVersion(),
+                ctypes.sizeof(_ZStream),
+            )
+        )
+        self._open = True
+        if prime is not None:
+            self._check(self._lib.inflatePrime(ctypes.byref(self._strm), *prime))
+        if window:
+            self._check(
+                self._lib.inflateSetDictionary(
+                    ctypes.byref(self._strm), window, len(window)
+                )
+            )
+
+    def _check(self, status):
+        if status not in (Z_OK, Z_STREAM_END, Z_BUF_ERROR):
+            message = self._strm.msg.decode() if self._strm.msg else status
+            raise zlib.error(f"Error while decompressing: {message}")
+        return status
+
+    @property
+    def needs_input(self):
+        return self._strm.avail_in == 0
+
+    @property
+    def pending(self):
+        """The number of bytes fed in that haven't been consumed yet."""
+        return self._strm.avail_in
+
+    @property
+    def unused_data(self):
+        """The bytes fed in past the end of the stream."""
+        return self._input[len(self._input) - self._strm.avail_in :]
+
+    def feed(self, data):
+        self._input = data
+        self._strm.next_in = ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p)
+        self._strm.avail_in = len(data)
+
+    def inflate(self, max_length):
+        if self.eof:
+            return b""
+        if len(self._output) < max_length:
+            self._output = ctypes.create_string_buffer(max_length)
+        self._strm.next_out = ctypes.addressof(self._output)
+        self._strm.avail_out = max_length
+        status = self._check(self._lib.inflate(ctypes.byref(self._strm), Z_BLOCK))
+        output = ctypes.string_at(self._output, max_length - self._strm.avail_out)
+        data_type = self._strm.data_type
+        self.boundary = None
+        if status == Z_STREAM_END:
+            self.eof = True
+            self.close()
+        elif data_type & 128 and not data_type & 64:
+            self.boundary = data_type & 7
+        return output
+
+    def close(self):
+        if self._open:
+            self._lib.inflateEnd(ctypes.byref(self._strm))
+            self._open = False
+
+    def __del__(self):
+        self.close()
+
+
+class _ZlibInflater:
+    """
+    The same interface as ``Inflater``, over the ``zlib`` module (which
+    never reports block boundaries).
+
+    """
+
+    boundary = None
+
+    def __init__(self, wbits):
+        self._decompressor = zlib.decompressobj(wbits)
+        self._input = b""
+
+    @property
+    def eof(self):
+        return self._decompressor.eof
+
+    @property
+    def needs_input(self):
+        return not self._input
+
+    @property
+    def pending(self):
+        return len(self._input) + len(self._decompressor.unused_data)
+
+    @property
+    def unused_data(self):
+        return self._decompressor.unused_data
+
+    def feed(self, data):
+        self._input = data
+
+    def inflate(self, max_length):
+        output = self._decompressor.decompress(self._input, max_length)
+        self._input = self._decompressor.unconsumed_tail
+        return output
+
+    def close(self):
+        pass
+
+
+def inflater(wbits):
+    """
+    Return a decompressor for a stream starting at the start of a gzip member
+    (``wbits=31``) or deflate stream (``wbits=-15``), which reports block
+    boundaries if we can.
+
+    """
+    return Inflater(wbits) if available() else _ZlibInflater(wbits)
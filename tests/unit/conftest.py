@@ -0,0 +1,24 @@
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        dest="benchmark",
+        default=False,
+        help="enable benchmarks",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: a slow timing benchmark")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skipper = pytest.mark.skip(reason="need --benchmark option to run")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skipper)
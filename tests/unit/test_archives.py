@@ -0,0 +1,137 @@
+import gzip
+import random
+import tarfile
+import zipfile
+
+import pytest
+
+from showyourwork import archives, exceptions, zran
+from showyourwork.archives import GzipReader, extract_members, load_index
+
+
+@pytest.fixture(params=["tar.gz", "tar", "zip"])
+def archive(request, tmp_path):
+    source = tmp_path / "source"
+    (source / "data").mkdir(parents=True)
+    for name in ["a.txt", "data/b.txt", "data/c.txt"]:
+        (source / name).write_text(name)
+    path = tmp_path / f"archive.{request.param}"
+    if request.param == "zip":
+        with zipfile.ZipFile(path, "w") as f:
+            for name in ["a.txt", "data/b.txt", "data/c.txt"]:
+                f.write(source / name, name)
+    else:
+        with tarfile.open(path, "w:gz" if request.param == "tar.gz" else "w") as f:
+            f.add(source, arcname=".")
+    return path
+
+
+def test_extract_members(archive, tmp_path):
+    out = tmp_path / "out"
+    extract_members(
+        archive, {"a.txt": out / "a.txt", "./data/c.txt": out / "nested" / "c.txt"}
+    )
+    assert (out / "a.txt").read_text() == "a.txt"
+    assert (out / "nested" / "c.txt").read_text() == "data/c.txt"
+    assert sorted(p.name for p in out.rglob("*")) == ["a.txt", "c.txt", "nested"]
+
+
+def test_missing_member(archive, tmp_path):
+    with pytest.raises(exceptions.TarballExtractionError):
+        extract_members(archive, {"nope.txt": tmp_path / "nope.txt"})
+    exceptions.restore_trace()
+
+
+def test_member_index(tmp_path):
+    # A multi-member gzip stream, like those written by `bgzip` or `pigz -i`
+    source = tmp_path / "source"
+    source.mkdir()
+    for n in range(20):
+        (source / f"{n}.txt").write_bytes(bytes([n]) * 5000)
+    tar = tmp_path / "archive.tar"
+    with tarfile.open(tar, "w") as f:
+        f.add(source, arcname=".")
+    data = tar.read_bytes()
+    archive = tmp_path / "archive.tar.gz"
+    archive.write_bytes(
+        b"".join(gzip.compress(data[i : i + 20000]) for i in range(0, len(data), 20000))
+    )
+
+    # The first extraction indexes the archive
+    out = tmp_path / "out"
+    index_file = tmp_path / "index" / "archive.tar.gz.json"
+    extract_members(archive, {"3.txt": out / "3.txt"}, index_file=index_file)
+    index = load_index(archive, index_file)
+    assert len(index["members"]) == 21
+    assert len(index["restart_points"]) == -(-len(data) // 20000)
+
+    # Later ones seek to the members they need
+    extract_members(
+        archive,
+        {"19.txt": out / "19.txt", "7.txt": out / "7.txt"},
+        index_file=index_file,
+    )
+    for n in [3, 7, 19]:
+        assert (out / f"{n}.txt").read_bytes() == bytes([n]) * 5000
+    with pytest.raises(exceptions.TarballExtractionError):
+        extract_members(archive, {"20.txt": out / "20.txt"}, index_file=index_file)
+    exceptions.restore_trace()
+
+    # The index is dropped if the archive changes, and not rebuilt for a
+    # single-member gzip stream too short to have restart points in it
+    archive.write_bytes(gzip.compress(data))
+    assert load_index(archive, index_file) is None
+    extract_members(archive, {"12.txt": out / "12.txt"}, index_file=index_file)
+    assert (out / "12.txt").read_bytes() == bytes([12]) * 5000
+    assert not index_file.exists()
+
+    # Uncompressed tarballs are always indexed
+    extract_members(tar, {"12.txt": out / "12.txt"}, index_file=index_file)
+    assert load_index(tar, index_file)["restart_points"] == [(0, 0)]
+    assert not list(tmp_path.glob("*.json"))
+
+
+@pytest.mark.skipif(not zran.available(), reason="requires the zlib library")
+def test_single_member_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(archives, "restart_span", 1 << 16)
+    rng = random.Random(0)
+    words = [f"word{n}" for n in range(500)]
+    source = tmp_path / "source"
+    source.mkdir()
+    contents = {}
+    for n in range(10):
+        contents[n] = " ".join(rng.choices(words, k=30000)).encode()
+        (source / f"{n}.txt").write_bytes(contents[n])
+    archive = tmp_path / "archive.tar.gz"
+    with tarfile.open(archive, "w:gz") as f:
+        f.add(source, arcname=".")
+
+    # The first extraction records restart points in the middle of the stream
+    out = tmp_path / "out"
+    index_file = tmp_path / "index" / "archive.tar.gz.json"
+    extract_members(archive, {"0.txt": out / "0.txt"}, index_file=index_file)
+    points = load_index(archive, index_file)["restart_points"]
+    assert points[0] == (0, 0)
+    assert len(points) > 10
+    assert {point[2] for point in points[1:]} - {0}
+
+    # We can resume decompressing from each of them
+    with open(archive, "rb") as f:
+        data = GzipReader(f).read()
+    with open(archive, "rb") as f:
+        for point in points:
+            stream = GzipReader(f, start=point)
+            assert stream.read() == data[point[1] :]
+
+    # Later extractions start from the last one before the member they need
+    starts = []
+
+    class Reader(GzipReader):
+        def __init__(self, file, start=(0, 0), restart_points=None):
+            starts.append(start[1])
+            super().__init__(file, start, restart_points)
+
+    monkeypatch.setattr(archives, "GzipReader", Reader)
+    extract_members(archive, {"9.txt": out / "9.txt"}, index_file=index_file)
+    assert (out / "9.txt").read_bytes() == contents[9]
+    assert starts[0] > len(data) // 2
@@ -0,0 +1,89 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import snakemake
+
+from showyourwork import patches
+from showyourwork.zenodo import SyncLedger
+
+
+class FakeCache:
+    def __init__(self, local):
+        self.local = local
+
+    def exists(self, job):
+        return job.name in self.local
+
+    def get_outputfiles_and_cachefiles(self, job):
+        return [(job.name, Path(f"hash-{job.name}"))]
+
+
+class FakeDeposit:
+    def __init__(self, remote):
+        self.remote = remote
+
+    def has_file(self, rule_name, file_hash):
+        return file_hash == f"hash-{rule_name}" and rule_name in self.remote
+
+
+@pytest.fixture
+def cache_setup(monkeypatch, tmp_path):
+    def setup(local=(), remote=(), synced=()):
+        workflow = SimpleNamespace(
+            output_file_cache=FakeCache(set(local)),
+            is_cached_rule=lambda rule: True,
+        )
+        config = {
+            "git_branch": "main",
+            "cache": {"main": {"zenodo": "10.5281/zenodo.1", "sandbox": None}},
+        }
+        monkeypatch.setattr(snakemake.workflow, "workflow", workflow, raising=False)
+        monkeypatch.setattr(snakemake.workflow, "config", config, raising=False)
+        queried = []
+
+        def remote_cache_state(doi):
+            queried.append(doi)
+            return FakeDeposit(set(remote))
+
+        monkeypatch.setattr(patches, "_remote_cache_state", remote_cache_state)
+        ledger = SyncLedger(tmp_path / "sync.json", 3600)
+        for name in synced:
+            ledger.record(name, f"hash-{name}")
+        monkeypatch.setattr(
+            patches, "get_deposit", lambda doi: SimpleNamespace(sync_ledger=ledger)
+        )
+        return queried
+
+    return setup
+
+
+class Job:
+    def __init__(self, name):
+        self.name = name
+        self.rule = SimpleNamespace(name=name)
+
+
+def make_jobs(*names):
+    return [Job(name) for name in names]
+
+
+def test_local_hits_need_no_remote_queries(cache_setup):
+    queried = cache_setup(local=["a", "b"])
+    jobs = make_jobs("a", "b")
+    assert patches.get_cached_jobs(jobs) == set(jobs)
+    assert queried == []
+
+
+def test_remote_is_only_queried_for_local_misses(cache_setup):
+    queried = cache_setup(local=["a"], remote=["b"])
+    a, b, c = make_jobs("a", "b", "c")
+    assert patches.get_cached_jobs([a, b, c]) == {a, b}
+    assert queried == ["10.5281/zenodo.1"]
+
+
+def test_synced_files_need_no_remote_queries(cache_setup):
+    queried = cache_setup(local=["a"], synced=["b"])
+    jobs = make_jobs("a", "b")
+    assert patches.get_cached_jobs(jobs) == set(jobs)
+    assert queried == []
@@ -0,0 +1,31 @@
+from showyourwork.zenodo import get_dataset_dois, get_dataset_index
+
+
+def test_dataset_index():
+    datasets = {
+        "10.5281/zenodo.1": {
+            "contents": {
+                "a.dat": "src/data/a.dat",
+                "b.tar.gz": ".showyourwork/zenodo/1/b.tar.gz",
+            },
+            "zip_files": {"b.tar.gz": {"b/c.dat": "src/data/b/c.dat"}},
+        },
+        "10.5281/zenodo.2": {
+            "contents": {"d.dat": "src/data/d.dat"},
+            "zip_files": {},
+        },
+    }
+    index = get_dataset_index(datasets)
+    assert index["src/data/b/c.dat"] == {
+        "doi": "10.5281/zenodo.1",
+        "archive": "b.tar.gz",
+        "member": "b/c.dat",
+    }
+    assert index["src/data/a.dat"]["archive"] is None
+    assert get_dataset_dois(["src/data/b/c.dat", "src/other.dat"], index) == [
+        "10.5281/zenodo.1"
+    ]
+    assert sorted(get_dataset_dois(list(index), index)) == [
+        "10.5281/zenodo.1",
+        "10.5281/zenodo.2",
+    ]
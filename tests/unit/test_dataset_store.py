@@ -0,0 +1,55 @@
+import os
+import stat
+import tarfile
+
+import pytest
+
+from showyourwork import exceptions
+from showyourwork.store import DatasetStore
+
+
+def test_path_is_keyed_by_doi_name_and_checksum(tmp_path):
+    store = DatasetStore(tmp_path)
+    path = store.path("10.5281/zenodo.123", "data.csv", "md5:ABC")
+    assert path == tmp_path / "10.5281%2Fzenodo.123" / "md5-abc" / "data.csv"
+    assert path != store.path("10.5281/zenodo.123", "data.csv", "md5:def")
+
+
+@pytest.mark.parametrize("link", ["hardlink", "symlink", "copy"])
+def test_materialize(tmp_path, link):
+    store = DatasetStore(tmp_path / "store", link=link)
+    entry = store.path("10.5281/zenodo.123", "data.csv", "md5:abc")
+    entry.parent.mkdir(parents=True)
+    entry.write_text("hello")
+    store.add(entry)
+    destination = tmp_path / "project" / "data.csv"
+    destination.parent.mkdir()
+    destination.write_text("old")
+    store.materialize(entry, destination)
+    assert destination.read_text() == "hello"
+    assert os.path.samefile(entry, destination) == (link != "copy")
+    assert not entry.stat().st_mode & stat.S_IWUSR
+
+
+def test_extract_only_once(tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_text("a")
+    archive = tmp_path / "archive.tar.gz"
+    with tarfile.open(archive, "w:gz") as f:
+        f.add(source, arcname="dir/a.txt")
+    store = DatasetStore(tmp_path / "store")
+    members = {"dir/a.txt": tmp_path / "project" / "a.txt"}
+    args = ("10.5281/zenodo.123", "archive.tar.gz", "md5:abc")
+    store.extract(*args, archive, members)
+    assert (tmp_path / "project" / "a.txt").read_text() == "a"
+    # Once the members are in the store, the archive isn't read again
+    os.remove(tmp_path / "project" / "a.txt")
+    os.remove(archive)
+    store.extract(*args, archive, members)
+    assert (tmp_path / "project" / "a.txt").read_text() == "a"
+
+
+def test_invalid_link_method(tmp_path):
+    with pytest.raises(exceptions.ConfigError):
+        DatasetStore(tmp_path, link="teleport")
+    exceptions.restore_trace()
@@ -0,0 +1,98 @@
+import pytest
+
+from showyourwork import fingerprint, git, paths
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    tex = tmp_path / "src" / "tex"
+    (tex / "sections").mkdir(parents=True)
+    (tex / "ms.tex").write_text("\\input{sections/intro}\n")
+    (tex / "sections" / "intro.tex").write_text("\\variable{output/num.txt}\n")
+    (tex / "custom.sty").write_text("\\ProvidesPackage{custom}\n")
+    (tex / "figures").mkdir()
+    (tex / "figures" / "fig.pdf").write_bytes(b"figure")
+    (tex / "figures" / "fig.tex").write_text("generated")
+    (tex / "output").mkdir()
+    (tex / "output" / "num.txt").write_text("42")
+    (tmp_path / "showyourwork.yml").write_text("version: 0.4.0\n")
+    user = paths.user(tmp_path)
+    monkeypatch.setattr(fingerprint.paths, "user", lambda: user)
+    monkeypatch.setattr(
+        fingerprint.git,
+        "get_snapshot",
+        lambda: git.GitSnapshot("abc", "url", "slug", "main", ""),
+    )
+    return tex
+
+
+def test_tex_files(project):
+    generated = [project / "figures", project / "output"]
+    assert fingerprint.tex_files(project, generated) == (
+        [
+            project / "custom.sty",
+            project / "ms.tex",
+            project / "sections" / "intro.tex",
+        ],
+        [
+            project / "figures" / "fig.pdf",
+            project / "figures" / "fig.tex",
+            project / "output" / "num.txt",
+        ],
+    )
+
+
+def test_fingerprint_tracks_inputs(project):
+    first = fingerprint.get_prep_fingerprint()
+    assert fingerprint.get_prep_fingerprint() == first
+
+    # Changes to any TeX source matter
+    (project / "sections" / "intro.tex").write_text("\\variable{output/other.txt}\n")
+    second = fingerprint.get_prep_fingerprint()
+    assert second != first
+    (project / "custom.sty").write_text("\\ProvidesPackage{custom}[v2]\n")
+    assert fingerprint.get_prep_fingerprint() != second
+    assert fingerprint.get_prep_fingerprint(["--forceall"]) != second
+
+
+@pytest.mark.parametrize(
+    "args, forced",
+    [
+        ([], False),
+        (["-F"], True),
+        (["--forceall"], True),
+        (["-nF"], True),
+        (["--force", "-n"], False),
+    ],
+)
+def test_is_forced(args, forced):
+    assert fingerprint.is_forced(args) == forced
+
+
+def test_prep_is_current(project):
+    current = fingerprint.get_prep_fingerprint()
+    assert not fingerprint.prep_is_current(current)
+    (paths.user().temp / "config.json").write_text("{}")
+    fingerprint.record_prep_fingerprint(current)
+    assert fingerprint.prep_is_current(current)
+    assert not fingerprint.prep_is_current(current, ["-F"])
+
+    # A change made while the run was going isn't missed
+    (project / "ms.tex").write_text("\\input{sections/intro}\nEdited.\n")
+    assert not fingerprint.prep_is_current(fingerprint.get_prep_fingerprint())
+
+
+def test_generated_files_only_matter_by_name(project):
+    current = fingerprint.get_prep_fingerprint()
+    (paths.user().temp / "config.json").write_text("{}")
+    fingerprint.record_prep_fingerprint(current)
+
+    # Rewriting a figure or an output leaves the last run up to date...
+    (project / "figures" / "fig.pdf").write_bytes(b"new figure")
+    (project / "figures" / "fig.tex").write_text("regenerated")
+    (project / "output" / "num.txt").write_text("43")
+    assert fingerprint.prep_is_current(fingerprint.get_prep_fingerprint())
+
+    # ...but a new one doesn't
+    (project / "figures" / "other.pdf").write_bytes(b"figure")
+    assert not fingerprint.prep_is_current(fingerprint.get_prep_fingerprint())
@@ -0,0 +1,69 @@
+import subprocess
+
+import pytest
+
+from showyourwork import git
+
+
+def run(*args, cwd):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@test", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+    )
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    run("init", "-q", "-b", "main", cwd=tmp_path)
+    run("remote", "add", "origin", "git@github.com:user/repo.git", cwd=tmp_path)
+    (tmp_path / "file.txt").write_text("hello")
+    run("add", "file.txt", cwd=tmp_path)
+    run("commit", "-q", "-m", "first", cwd=tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv(git.SNAPSHOT_ENV, raising=False)
+    git._snapshots.clear()
+    yield tmp_path
+    git._snapshots.clear()
+
+
+def assert_matches_git():
+    snapshot = git._read_snapshot(git._GitDirectory())
+    assert snapshot == git._query_snapshot()
+    return snapshot
+
+
+def test_loose_refs(repo):
+    snapshot = assert_matches_git()
+    assert snapshot.branch == "main"
+    assert snapshot.slug == "user/repo"
+    assert snapshot.tag == ""
+
+
+def test_tags_and_packed_refs(repo):
+    run("tag", "-a", "v1.0", "-m", "annotated", cwd=repo)
+    assert assert_matches_git().tag == "v1.0"
+    run("pack-refs", "--all", cwd=repo)
+    assert assert_matches_git().tag == "v1.0"
+    run("checkout", "-q", "-b", "feature/x", cwd=repo)
+    run("commit", "-q", "--allow-empty", "-m", "second", cwd=repo)
+    assert assert_matches_git().branch == "feature/x"
+
+
+def test_detached_head(repo):
+    run("checkout", "-q", "--detach", cwd=repo)
+    assert assert_matches_git().branch == "HEAD"
+
+
+def test_snapshot_from_environment(repo, monkeypatch):
+    snapshot = git.get_snapshot()
+    git._snapshots.clear()
+    monkeypatch.setenv(git.SNAPSHOT_ENV, snapshot._replace(tag="env").to_json())
+    count = git.get_call_count()
+    assert git.get_snapshot().tag == "env"
+
+    # Moving HEAD invalidates the inherited snapshot
+    run("commit", "-q", "--allow-empty", "-m", "second", cwd=repo)
+    assert git.get_snapshot().tag == ""
+    assert git.get_call_count() == count
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from showyourwork.mirror import mirror_directory, update_file
+
+
+@pytest.fixture
+def source(tmp_path):
+    source = tmp_path / "tex"
+    (source / "figures").mkdir(parents=True)
+    (source / "ms.tex").write_text("manuscript")
+    (source / "figures" / "fig.pdf").write_text("figure")
+    return source
+
+
+def test_mirror_only_writes_changes(tmp_path, source):
+    destination = tmp_path / "compile"
+    written, removed = mirror_directory(source, destination, method="copy")
+    assert written == ["figures/fig.pdf", "ms.tex"]
+    assert removed == []
+    assert (destination / "figures" / "fig.pdf").read_text() == "figure"
+
+    # Nothing changed
+    assert mirror_directory(source, destination, method="copy") == ([], [])
+
+    # Touched, but with the same contents
+    os.utime(source / "ms.tex", ns=(0, 0))
+    assert mirror_directory(source, destination, method="copy") == ([], [])
+
+    # Modified
+    (source / "ms.tex").write_text("new manuscript")
+    assert mirror_directory(source, destination, method="copy") == (["ms.tex"], [])
+    assert (destination / "ms.tex").read_text() == "new manuscript"
+
+    # Changed (or deleted) in the mirror
+    (destination / "ms.tex").write_text("changed!")
+    (destination / "figures" / "fig.pdf").unlink()
+    written, _ = mirror_directory(source, destination, method="copy")
+    assert written == ["figures/fig.pdf", "ms.tex"]
+    assert (destination / "ms.tex").read_text() == "new manuscript"
+
+
+def test_mirror_removes_stale_files_only(tmp_path, source):
+    destination = tmp_path / "compile"
+    mirror_directory(source, destination)
+    (destination / "ms.aux").write_text("intermediate")
+    (source / "figures" / "fig.pdf").unlink()
+    (source / "figures").rmdir()
+    written, removed = mirror_directory(source, destination)
+    assert written == []
+    assert removed == ["figures/fig.pdf"]
+    assert not (destination / "figures").exists()
+    assert (destination / "ms.aux").read_text() == "intermediate"
+
+
+def test_mirror_exclude(tmp_path, source):
+    destination = tmp_path / "compile"
+    (destination).mkdir()
+    (destination / "ms.tex").write_text("generated")
+    written, _ = mirror_directory(source, destination, exclude=["ms.tex"])
+    assert written == ["figures/fig.pdf"]
+    assert (destination / "ms.tex").read_text() == "generated"
+
+
+def test_mirror_hardlinks(tmp_path, source):
+    destination = tmp_path / "compile"
+    mirror_directory(source, destination, method="hardlink")
+    assert os.path.samefile(source / "ms.tex", destination / "ms.tex")
+    (source / "ms.tex").write_text("new manuscript")
+    assert mirror_directory(source, destination, method="hardlink") == ([], [])
+
+
+def test_update_file(tmp_path):
+    path = tmp_path / "showyourwork.tex"
+    assert update_file(path, b"stylesheet")
+    os.utime(path, ns=(0, 0))
+    assert not update_file(path, b"stylesheet")
+    assert path.stat().st_mtime_ns == 0
+    assert update_file(path, b"new stylesheet")
+    assert path.read_bytes() == b"new stylesheet"
@@ -0,0 +1,36 @@
+import subprocess
+
+from showyourwork import git, paths
+
+
+def test_user_paths_are_memoized(tmp_path, monkeypatch):
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv(paths.REPO_ROOT_ENV, raising=False)
+    paths.user.cache_clear()
+
+    count = git.get_call_count()
+    first = paths.user()
+    for _ in range(10):
+        assert paths.user() is first
+    assert git.get_call_count() == count + 1
+
+    # Temporary directories are only created when accessed
+    assert not (tmp_path / ".showyourwork").exists()
+    assert first.logs.is_dir()
+    assert (tmp_path / ".showyourwork").is_dir()
+    assert not (tmp_path / ".showyourwork" / "cache").exists()
+
+    paths.user.cache_clear()
+
+
+def test_user_paths_from_environment(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv(paths.REPO_ROOT_ENV, str(tmp_path.resolve()))
+    paths.user.cache_clear()
+
+    count = git.get_call_count()
+    assert paths.user().repo == tmp_path.resolve()
+    assert git.get_call_count() == count
+
+    paths.user.cache_clear()
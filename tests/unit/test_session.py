@@ -0,0 +1,64 @@
+import requests
+from requests.adapters import BaseAdapter
+
+from showyourwork.session import Session
+
+
+class CannedAdapter(BaseAdapter):
+    """Returns a fixed sequence of status codes."""
+
+    def __init__(self, statuses, headers=None):
+        super().__init__()
+        self.statuses = list(statuses)
+        self.headers = headers or {}
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = self.statuses[self.calls]
+        response.headers.update(self.headers)
+        response._content = b"{}"
+        response.request = request
+        response.url = request.url
+        self.calls += 1
+        return response
+
+    def close(self):
+        pass
+
+
+def make_session(statuses, headers=None, **settings):
+    session = Session(dict(backoff_factor=0, **settings))
+    adapter = CannedAdapter(statuses, headers)
+    session.mount("https://", adapter)
+    return session, adapter
+
+
+def test_retries_server_errors():
+    session, adapter = make_session([503, 502, 200])
+    assert session.get("https://example.org").status_code == 200
+    assert adapter.calls == 3
+    assert session.stats.requests == 3
+    assert session.stats.retries == 2
+
+
+def test_gives_up_after_max_retries():
+    session, adapter = make_session([500] * 3, max_retries=2)
+    assert session.get("https://example.org").status_code == 500
+    assert adapter.calls == 3
+
+
+def test_post_only_retried_when_rate_limited():
+    session, adapter = make_session([500, 200])
+    assert session.post("https://example.org").status_code == 500
+    session, adapter = make_session([429, 200], headers={"Retry-After": "0"})
+    assert session.post("https://example.org").status_code == 200
+    assert adapter.calls == 2
+
+
+def test_honors_retry_after(monkeypatch):
+    delays = []
+    monkeypatch.setattr("showyourwork.session.time.sleep", delays.append)
+    session, _ = make_session([429, 200], headers={"Retry-After": "7"})
+    session.get("https://example.org")
+    assert delays == [7.0]
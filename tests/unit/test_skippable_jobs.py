@@ -0,0 +1,83 @@
+import random
+import time
+
+import pytest
+
+from showyourwork.patches import find_skippable_jobs
+
+
+class Job:
+    def __init__(self, name, input, output):
+        self.name = name
+        self.input = input
+        self.output = output
+
+    def __repr__(self):
+        return self.name
+
+
+def synthetic_dag(size, seed=0, max_inputs=3):
+    """Random layered DAG; each job produces one file and reads earlier ones."""
+    rng = random.Random(seed)
+    jobs = []
+    for n in range(size):
+        inputs = [f"file{k}" for k in rng.sample(range(n), min(n, max_inputs))]
+        jobs.append(Job(f"job{n}", inputs, [f"file{n}"]))
+    cached = {job for job in jobs if rng.random() < 0.1}
+    return jobs, cached
+
+
+def reference_skippable_jobs(jobs, cached_jobs):
+    """The original fixed-point search, for comparison."""
+    nodes = set(cached_jobs)
+    new_nodes = True
+    while new_nodes:
+        new_nodes = set()
+        for node in nodes:
+            parents = set()
+            for file in node.input:
+                parents |= {job for job in jobs if file in job.output}
+            parents -= nodes
+            for parent in parents:
+                children = set()
+                for file in parent.output:
+                    children |= {job for job in jobs if file in job.input}
+                if all(child in nodes for child in children):
+                    new_nodes.add(parent)
+        nodes |= new_nodes
+    return nodes - set(cached_jobs)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_matches_reference(seed):
+    jobs, cached = synthetic_dag(60, seed=seed)
+    assert find_skippable_jobs(jobs, cached) == reference_skippable_jobs(jobs, cached)
+
+
+def test_chain():
+    a = Job("a", [], ["a.txt"])
+    b = Job("b", ["a.txt"], ["b.txt"])
+    c = Job("c", ["b.txt"], ["c.txt"])
+    d = Job("d", ["a.txt"], ["d.txt"])
+    assert find_skippable_jobs([a, b, c], {c}) == {a, b}
+    # `a` is also needed by `d`, which isn't cached
+    assert find_skippable_jobs([a, b, c, d], {c}) == {b}
+
+
+@pytest.mark.benchmark
+def test_scaling():
+    # Run with: pytest tests/unit/test_skippable_jobs.py --benchmark -s
+    timings = {}
+    for size in [250, 500, 1000, 2000, 4000, 8000]:
+        jobs, cached = synthetic_dag(size)
+        start = time.perf_counter()
+        find_skippable_jobs(jobs, cached)
+        timings[size] = time.perf_counter() - start
+        line = f"{size:>6} jobs: {timings[size] * 1e3:8.1f} ms"
+        if size <= 1000:
+            start = time.perf_counter()
+            reference_skippable_jobs(jobs, cached)
+            line += f"   (original: {(time.perf_counter() - start) * 1e3:8.1f} ms)"
+        print(line)
+    # A single sweep scales (roughly) linearly with the size of the graph
+    assert timings[8000] < 8 * 4 * timings[1000]
@@ -0,0 +1,33 @@
+from showyourwork.zenodo import SyncLedger, Zenodo
+
+
+def test_sync_ledger(tmp_path, monkeypatch):
+    ledger = SyncLedger(tmp_path / "123" / "sync.json", ttl=60)
+    assert not ledger.is_current("rule", "abc")
+    ledger.record("rule", "abc")
+    assert ledger.is_current("rule", "abc")
+    assert not ledger.is_current("rule", "def")
+
+    # The ledger persists across builds...
+    ledger = SyncLedger(tmp_path / "123" / "sync.json", ttl=60)
+    assert ledger.is_current("rule", "abc")
+
+    # ...but entries expire
+    now = ledger.entries["rule"]["time"]
+    monkeypatch.setattr("showyourwork.zenodo.time.time", lambda: now + 61)
+    assert not ledger.is_current("rule", "abc")
+
+    ledger.clear()
+    assert ledger.entries == {}
+
+
+def test_has_file_consults_the_ledger_first(tmp_path):
+    deposit = Zenodo.__new__(Zenodo)
+    deposit.sync_ledger = SyncLedger(tmp_path / "sync.json", ttl=60)
+    deposit.sync_ledger.record("rule", "abc")
+
+    def no_requests(*args, **kwargs):
+        raise AssertionError("The API shouldn't be queried.")
+
+    deposit.get_manifest = deposit.get_records = no_requests
+    assert deposit.has_file("rule", "abc")
@@ -0,0 +1,69 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from showyourwork import paths
+
+script = paths.showyourwork().workflow / "scripts" / "tectonic.sh"
+
+# Records its arguments and writes the cross-references from `refs.txt`
+fake_tectonic = """#!/bin/sh
+echo "$*" >> calls.log
+cat refs.txt > ms.aux
+"""
+
+pytestmark = pytest.mark.skipif(shutil.which("bash") is None, reason="requires bash")
+
+
+@pytest.fixture
+def compile_dir(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    tectonic = bin_dir / "tectonic"
+    tectonic.write_text(fake_tectonic)
+    tectonic.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    compile_dir = tmp_path / "compile"
+    compile_dir.mkdir()
+    (compile_dir / "refs.txt").write_text("refs")
+    (compile_dir / "bib.bib").write_text("@article{a}")
+    return compile_dir
+
+
+def compile(compile_dir, warm_start=True):
+    (compile_dir / "calls.log").unlink(missing_ok=True)
+    subprocess.run(
+        [
+            "bash",
+            str(script),
+            ".showyourwork-xref",
+            "true" if warm_start else "false",
+            "ms.tex",
+            "--keep-logs",
+        ],
+        cwd=compile_dir,
+        check=True,
+    )
+    return (compile_dir / "calls.log").read_text().splitlines()
+
+
+def test_single_pass_when_state_is_unchanged(compile_dir):
+    assert compile(compile_dir) == ["--keep-logs ms.tex"]
+    assert compile(compile_dir) == ["--keep-logs -r 0 ms.tex"]
+    assert compile(compile_dir, warm_start=False) == ["--keep-logs ms.tex"]
+
+
+def test_full_compile_when_the_pass_changes_the_state(compile_dir):
+    compile(compile_dir)
+    (compile_dir / "refs.txt").write_text("new refs")
+    assert compile(compile_dir) == ["--keep-logs -r 0 ms.tex", "--keep-logs ms.tex"]
+    assert compile(compile_dir) == ["--keep-logs -r 0 ms.tex"]
+
+
+def test_full_compile_when_the_bibliography_changes(compile_dir):
+    compile(compile_dir)
+    (compile_dir / "bib.bib").write_text("@article{a}\n@article{b}")
+    assert compile(compile_dir) == ["--keep-logs ms.tex"]
+    assert compile(compile_dir) == ["--keep-logs -r 0 ms.tex"]
@@ -0,0 +1,76 @@
+from xml.etree.ElementTree import tostring
+
+import pytest
+
+from showyourwork import texscan
+
+PREAMBLE = r"""
+\documentclass{article}
+\usepackage{graphicx}
+\usepackage{showyourwork}
+\graphicspath{{figures/}}
+\begin{document}
+"""
+
+
+def scan(tmp_path, body, **files):
+    for name, text in files.items():
+        (tmp_path / name).write_text(text)
+    (tmp_path / "ms.tex").write_text(PREAMBLE + body + "\n\\end{document}\n")
+    root, _ = texscan.scan(tmp_path / "ms.tex")
+    return tostring(root).decode()
+
+
+def test_builds_the_article_tree(tmp_path):
+    body = r"""
+    See Figure~\ref{fig:a} and \variable{output/num.txt}.
+    % \includegraphics{commented.pdf}
+    \begin{figure*}[ht!]
+        \script{a.py}
+        \includegraphics[width=\linewidth]{a.pdf}
+        \caption{Caption with \verb|\label{nope}|.}
+        \label{fig:a}
+    \end{figure*}
+    \input{section}
+    \includegraphics{free.png}
+    """
+    section = (
+        r"\begin{figure}\includegraphics{b.pdf}\marginicon{x}\label{fig:b}"
+        r"\end{figure}"
+    )
+    assert scan(tmp_path, body, **{"section.tex": section}) == (
+        "<HTML><GRAPHICSPATH>{figures/}</GRAPHICSPATH>"
+        "<INPUT>output/num.txt</INPUT>"
+        "<FIGURE><SCRIPT>a.py</SCRIPT><GRAPHICS>a.pdf</GRAPHICS>"
+        "<CAPTION /><LABEL>fig:a</LABEL></FIGURE>"
+        "<FIGURE><GRAPHICS>b.pdf</GRAPHICS><MARGINICON />"
+        "<LABEL>fig:b</LABEL></FIGURE>"
+        "<GRAPHICS>free.png</GRAPHICS></HTML>"
+    )
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        r"\newcommand{\fig}[1]{\includegraphics{#1}}\fig{a.pdf}",
+        r"\newenvironment{myfig}{\begin{figure}}{\end{figure}}\begin{myfig}\end{myfig}",
+        r"\includegraphics{\figdir/a.pdf}",
+        r"\iffalse \includegraphics{a.pdf} \fi",
+        r"\plotone{a.pdf}",
+        r"\input{missing}",
+    ],
+)
+def test_gives_up_on_what_it_cant_resolve(tmp_path, body):
+    with pytest.raises(texscan.UnsupportedTeX):
+        scan(tmp_path, body)
+
+
+def test_harmless_macros_are_fine(tmp_path):
+    body = r"\newcommand{\kms}{km\,s$^{-1}$}\label{sec:a} 10\kms"
+    assert scan(tmp_path, body).endswith("<LABEL>sec:a</LABEL></HTML>")
+
+
+def test_wrappers_in_local_classes(tmp_path):
+    style = r"\newcommand\myplot[1]{\includegraphics{#1}}"
+    with pytest.raises(texscan.UnsupportedTeX):
+        scan(tmp_path, r"\myplot{a.pdf}", **{"mystyle.sty": style})
@@ -0,0 +1,221 @@
+import hashlib
+import io
+import json
+import os
+import tarfile
+from pathlib import Path
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from showyourwork import archives, exceptions, transfer
+from showyourwork.session import Session
+
+
+class FileServer(BaseAdapter):
+    """Serves and accepts files held in memory."""
+
+    def __init__(self, status=200, truncate=0, reject_chunked=False, corrupt=False):
+        super().__init__()
+        self.status = status
+        self.truncate = truncate
+        self.reject_chunked = reject_chunked
+        self.corrupt = corrupt
+        self.files = {}
+        self.ranges = []
+        self.headers = {}
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = self.status
+        response.request = request
+        response.url = request.url
+        key = request.url.split("?")[0]
+        self.headers = request.headers
+        if request.method == "PUT":
+            if self.reject_chunked and "Content-Length" not in request.headers:
+                response.status_code = 411
+                response.raw = io.BytesIO(b"{}")
+                return response
+            body = request.body
+            if not isinstance(body, bytes):
+                body = b"".join(iter(lambda: body.read(1 << 16), b""))
+            self.files[key] = body
+            if self.corrupt:
+                body = body[:-1]
+            info = dict(checksum="md5:" + hashlib.md5(body).hexdigest(), size=len(body))
+            response.raw = io.BytesIO(json.dumps(info).encode())
+        elif request.method == "DELETE":
+            self.files.pop(key, None)
+            response.raw = io.BytesIO(b"")
+        else:
+            content = self.files.get(key, b"")
+            total = len(content)
+            first = 0
+            if "Range" in request.headers:
+                first = int(request.headers["Range"][6:].split("-")[0])
+                self.ranges.append(first)
+                if response.status_code == 200:
+                    response.status_code = 206
+                    response.headers["Content-Range"] = (
+                        f"bytes {first}-{total - 1}/{total}"
+                    )
+            content = content[first:]
+            response.headers["Content-Length"] = str(len(content))
+            response.raw = io.BytesIO(content[: len(content) - self.truncate])
+        return response
+
+    def close(self):
+        pass
+
+
+def make_session(**kwargs):
+    session = Session(dict(backoff_factor=0, max_retries=0))
+    server = FileServer(**kwargs)
+    session.mount("https://", server)
+    return session, server
+
+
+def test_round_trip(tmp_path):
+    session, server = make_session()
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"x" * (3 * transfer.chunk_size + 17))
+    transfer.upload("https://example.org/file", source, session=session)
+    assert server.files["https://example.org/file"] == source.read_bytes()
+    output = tmp_path / "output.bin"
+    size = transfer.download("https://example.org/file", output, session=session)
+    assert size == source.stat().st_size
+    assert output.read_bytes() == source.read_bytes()
+
+
+@pytest.mark.parametrize("kwargs", [dict(status=404), dict(truncate=5)])
+def test_failed_download_leaves_no_file(tmp_path, kwargs):
+    session, server = make_session(**kwargs)
+    server.files["https://example.org/file"] = b"hello world"
+    output = tmp_path / "output.bin"
+    output.write_text("old")
+    with pytest.raises(exceptions.ZenodoDownloadError):
+        transfer.download("https://example.org/file", output, session=session)
+    exceptions.restore_trace()
+    assert output.read_text() == "old"
+    # Only a partial download we can resume from is left behind
+    part = transfer.part_path(output)
+    files = {file.name for file in tmp_path.iterdir()}
+    assert files - {part.name} == {"output.bin"}
+    assert not part.exists() or part.read_bytes() == b"hello "
+
+
+def test_resumes_interrupted_download(tmp_path):
+    session, server = make_session(truncate=5)
+    server.files["https://example.org/file"] = b"hello world"
+    output = tmp_path / "output.bin"
+    checksum = "md5:" + hashlib.md5(b"hello world").hexdigest()
+    with pytest.raises(exceptions.ZenodoDownloadError):
+        transfer.download(
+            "https://example.org/file", output, session=session, checksum=checksum
+        )
+    exceptions.restore_trace()
+    server.truncate = 0
+    size = transfer.download(
+        "https://example.org/file", output, session=session, checksum=checksum
+    )
+    assert server.ranges == [6]
+    assert size == 11
+    assert output.read_bytes() == b"hello world"
+    assert not transfer.part_path(output).exists()
+
+
+def test_corrupt_partial_download_is_discarded(tmp_path):
+    session, server = make_session()
+    server.files["https://example.org/file"] = b"hello world"
+    output = tmp_path / "output.bin"
+    transfer.part_path(output).write_bytes(b"jello ")
+    checksum = "md5:" + hashlib.md5(b"hello world").hexdigest()
+    with pytest.raises(exceptions.ZenodoDownloadError):
+        transfer.download(
+            "https://example.org/file", output, session=session, checksum=checksum
+        )
+    exceptions.restore_trace()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_failed_upload_raises(tmp_path):
+    session, _ = make_session(status=500)
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"hello")
+    with pytest.raises(exceptions.ZenodoUploadError):
+        transfer.upload("https://example.org/file", source, session=session)
+    exceptions.restore_trace()
+
+
+def test_corrupt_upload_raises(tmp_path):
+    session, server = make_session(corrupt=True)
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"hello world")
+    with pytest.raises(exceptions.ZenodoUploadError):
+        transfer.upload("https://example.org/file", source, session=session)
+    exceptions.restore_trace()
+    assert server.files == {}
+
+
+def test_rejected_chunked_upload_is_sent_with_a_length(tmp_path):
+    session, server = make_session(reject_chunked=True)
+    stream = io.BytesIO(b"x" * (2 * transfer.chunk_size + 17))
+    stream.path = "stream.bin"
+    transfer.upload("https://example.org/file", stream, session=session)
+    assert server.files["https://example.org/file"] == stream.getvalue()
+    assert server.headers["Content-Length"] == str(len(stream.getvalue()))
+
+
+def test_download_verifies_checksum(tmp_path):
+    session, server = make_session()
+    server.files["https://example.org/file"] = b"hello world"
+    output = tmp_path / "output.bin"
+    checksum = "md5:" + hashlib.md5(b"hello world").hexdigest()
+    transfer.download(
+        "https://example.org/file", output, session=session, checksum=checksum
+    )
+    assert transfer.file_checksum(output) == transfer.parse_checksum(checksum)[1]
+    output.unlink()
+    with pytest.raises(exceptions.ZenodoDownloadError):
+        transfer.download(
+            "https://example.org/file", output, session=session, checksum="md5:0"
+        )
+    exceptions.restore_trace()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_directory_round_trip_without_tarball(tmp_path):
+    session, server = make_session()
+    source = tmp_path / "source"
+    (source / "sub").mkdir(parents=True)
+    (source / "sub" / "big.bin").write_bytes(os.urandom(3 * transfer.chunk_size))
+    (source / "small.txt").write_text("hello")
+    stream = archives.TarballStream(source)
+    transfer.upload("https://example.org/dir", stream, session=session)
+    stream.close()
+    assert server.headers["Transfer-Encoding"] == "chunked"
+    assert not list(tmp_path.glob("*.tar.gz"))
+
+    output = tmp_path / "output"
+
+    def extract(body):
+        with tarfile.open(fileobj=body, mode="r|gz") as tb:
+            tb.extractall(output)
+
+    transfer.stream("https://example.org/dir", extract, session=session)
+    assert (output / "small.txt").read_text() == "hello"
+    assert (output / "sub" / "big.bin").read_bytes() == (
+        source / "sub" / "big.bin"
+    ).read_bytes()
+
+
+def test_tarball_stream_rewinds():
+    stream = archives.TarballStream(Path(__file__).parent)
+    first = stream.read()
+    stream.seek(0)
+    assert stream.read() == first
+    with pytest.raises(OSError):
+        stream.seek(0, os.SEEK_END)
+    stream.close()
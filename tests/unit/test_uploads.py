@@ -0,0 +1,43 @@
+import threading
+
+from showyourwork.uploads import UploadQueue
+
+
+class FakeDeposit:
+    doi = "10.5281/zenodo.123"
+    service = "Zenodo Sandbox"
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.uploads = []
+
+    def upload_file(self, file, rule_name, tarball=False):
+        self.started.set()
+        self.release.wait(timeout=10)
+        if file == "broken":
+            raise Exception("Upload failed.")
+        self.uploads.append((file, rule_name))
+        return file != "current"
+
+
+def test_uploads_are_coalesced_per_rule():
+    deposit = FakeDeposit()
+    uploads = UploadQueue(workers=1)
+
+    # The first upload keeps the only worker busy...
+    uploads.submit(deposit, "a1", "a")
+    assert deposit.started.wait(timeout=10)
+
+    # ...so the second one for rule `a` replaces the third
+    uploads.submit(deposit, "a2", "a")
+    uploads.submit(deposit, "a3", "a")
+    uploads.submit(deposit, "current", "b")
+    uploads.submit(deposit, "broken", "c")
+    assert uploads.busy
+    deposit.release.set()
+
+    assert uploads.flush() == "2 uploaded, 2 skipped, 1 failed"
+    assert deposit.uploads == [("a1", "a"), ("a3", "a"), ("current", "b")]
+    assert uploads.failed == ["broken"]
+    assert not uploads.busy
@@ -0,0 +1,40 @@
+import pytest
+
+from showyourwork import exceptions
+from showyourwork.config import UpstreamDependencies, get_upstream_dependencies
+
+
+def test_diamond():
+    dependencies = {
+        "fig.pdf": ["a.dat", "b.dat"],
+        "a.dat": ["raw.dat"],
+        "b.dat": "raw.dat",
+        "raw.dat": [],
+    }
+    upstream = UpstreamDependencies(dependencies)
+    assert upstream.upstream("fig.pdf") == {"a.dat", "b.dat", "raw.dat"}
+    assert upstream.upstream("raw.dat") == set()
+    assert upstream.upstream("unknown") == set()
+    assert sorted(get_upstream_dependencies("fig.pdf", dependencies)) == [
+        "a.dat",
+        "b.dat",
+        "raw.dat",
+    ]
+    # `a.dat` and `b.dat` have the same upstream set, which is stored once
+    ids = upstream.ids
+    assert upstream._closures[ids["a.dat"]] is upstream._closures[ids["b.dat"]]
+
+
+def test_deep_chain():
+    size = 2000
+    dependencies = {f"file{n}": [f"file{n - 1}"] for n in range(1, size)}
+    upstream = UpstreamDependencies(dependencies)
+    assert len(upstream.upstream(f"file{size - 1}")) == size - 1
+    assert upstream.upstream("file3") == {"file0", "file1", "file2"}
+
+
+def test_cycle():
+    upstream = UpstreamDependencies({"a": ["b"], "b": ["c"], "c": ["a"]})
+    with pytest.raises(exceptions.CircularDependencyError):
+        upstream.upstream("a")
+    exceptions.restore_trace()